@@ -91,6 +91,51 @@ CHANNEL_LAYERS = {
 }
 
 
+# Cache
+# Con CACHE_REDIS_URL se usa Redis como caché compartida entre procesos;
+# si no, una caché en memoria local (desarrollo y tests). Con varios procesos
+# (Daphne y los workers de start.sh) hace falta la compartida: en memoria
+# local cada proceso solo ve sus propias invalidaciones.
+if os.environ.get('CACHE_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['CACHE_REDIS_URL'],
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+
+# Caché de UserSettings: LRU local por proceso delante de la caché compartida
+USER_SETTINGS_CACHE = {
+    'LOCAL_MAX_ENTRIES': 1024,
+    'LOCAL_TTL': 5,  # segundos
+    'SHARED_TTL': 3600,  # segundos; LOCAL_TTL si la caché no es compartida
+}
+
+# Escritura diferida de mensajes del chat (ver funATIAPP/message_writer.py).
+# Desactivada, cada mensaje se inserta antes de difundirse. Activada, los
+# mensajes se agrupan en lotes; con WAIT_FOR_FLUSH el cliente recibe el
+# mensaje solo después de que su lote se haya confirmado.
+CHAT_WRITE_BEHIND = {
+    'ENABLED': os.environ.get('CHAT_WRITE_BEHIND') == '1',
+    'MAX_BATCH': 100,
+    'FLUSH_INTERVAL': 0.05,  # segundos
+    'WAIT_FOR_FLUSH': os.environ.get('CHAT_WRITE_BEHIND_WAIT') == '1',
+    'MAX_RETRIES': 5,  # intentos por lote antes de descartarlo
+    'RETRY_DELAY': 0.1,  # segundos, se duplica en cada intento
+}
+
+# Id de worker de los ids de Message con escritura diferida (ver
+# funATIAPP/message_ids.py), de 0 a 1023. Cada proceso que inserta mensajes
+# (cada Daphne) necesita uno distinto.
+MESSAGE_WORKER_ID = int(os.environ.get('MESSAGE_WORKER_ID', '0'))
+
+
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
@@ -148,6 +193,49 @@ STATIC_ROOT = '/app/funATI/staticfiles/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    # Archivos subidos (avatares, publicaciones, chat), guardados una sola vez por contenido
+    'content': {
+        'BACKEND': 'funATIAPP.storage.ContentAddressedStorage',
+    },
+    # Nombres con hash del contenido y versiones .gz/.br, ver apache-funati.conf
+    'staticfiles': {
+        'BACKEND': 'funATIAPP.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# Versiones WEBP de avatares e imágenes, generadas por el comando process_renditions
+IMAGE_RENDITIONS = {
+    'QUALITY': 80,
+    'BATCH_SIZE': 20,  # archivos por lote del worker
+}
+
+# Subidas por partes y reanudables (ver funATIAPP/uploads.py)
+CHUNKED_UPLOADS = {
+    'CHUNK_SIZE': 5 * 1024 * 1024,  # tamaño máximo de cada PATCH
+    'MAX_SIZE': {
+        'image': 10 * 1024 * 1024,
+        'video': 200 * 1024 * 1024,
+    },
+    'EXPIRE_HOURS': 24,  # las subidas sin actividad se borran con expire_uploads
+    'TEMP_DIR': BASE_DIR / 'upload_parts',  # fuera de MEDIA_ROOT: no se sirve por /media/
+}
+
+# Paginación por cursor de publicaciones (muro y perfiles)
+PUBLICATIONS_PAGE_SIZE = 20
+
+# Hilos de comentarios: niveles de respuestas y comentarios cargados por página
+COMMENT_TREE_MAX_DEPTH = 6
+COMMENT_TREE_PAGE_SIZE = 200
+# Comentarios de primer nivel (o respuestas directas) por página en la API de hilos
+COMMENTS_PAGE_SIZE = 20
+
+# Mensajes por página en el historial del chat
+CHAT_HISTORY_PAGE_SIZE = 50
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -168,6 +256,19 @@ EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')  # Usar contrase
 DEFAULT_FROM_EMAIL = 'FunATI <funati.app@gmail.com>'
 SERVER_EMAIL = DEFAULT_FROM_EMAIL
 
+# Cola de correos salientes (EmailOutbox), enviada por el comando send_queued_emails
+EMAIL_OUTBOX = {
+    'BATCH_SIZE': 50,  # correos por conexión SMTP
+    'MAX_ATTEMPTS': 5,
+    'RETRY_BASE_SECONDS': 60,  # espera exponencial: 1, 2, 4, 8... minutos
+    'RETRY_MAX_SECONDS': 3600,
+    'LEASE_SECONDS': 300,  # tras este tiempo otro worker puede retomar un lote sin confirmar
+}
+
+# Segundos durante los que los seguimientos y comentarios repetidos se agrupan
+# en una sola notificación sin leer ("ana y 5 personas más...")
+NOTIFICATION_COALESCE_WINDOW = 3600
+
 # Logging configuration
 LOGGING = {
     'version': 1,
@@ -0,0 +1,105 @@
+"""
+Carga paginada de hilos de comentarios.
+
+load_comment_page y load_replies_page paginan por keyset los comentarios de
+primer nivel y las respuestas directas de un comentario. Las respuestas de
+cada página se leen ordenadas por su materialized path (Comment.path), que
+corresponde al recorrido en preorden del árbol, junto con su usuario y
+perfil. El árbol se arma en memoria: cada comentario recibe una lista
+`children` con sus respuestas cargadas, de modo que los templates no
+vuelven a consultar `replies`; `hidden_replies` indica cuántas respuestas
+quedan por pedir.
+"""
+from functools import reduce
+from operator import or_
+from django.conf import settings
+from django.db.models import Q
+from .pagination import encode_cursor, keyset_page
+
+
+def _mark_hidden_replies(comments):
+    """
+    Anota cuántas respuestas directas no se cargaron y el cursor para pedirlas
+    a partir de la última respuesta cargada.
+    """
+    for comment in comments:
+        comment.hidden_replies = max(comment.replies_count - len(comment.children), 0)
+        last = comment.children[-1] if comment.children else None
+        comment.replies_cursor = encode_cursor(last.created_at, last.pk) if last else None
+
+
+def _attach_children(roots, descendants):
+    """
+    Reparte `descendants` (en preorden) entre los `children` de `roots`.
+    Las filas cuyo padre no está cargado se descartan.
+    """
+    nodes = {}
+    for root in roots:
+        root.children = []
+        nodes[root.pk] = root
+    for comment in descendants:
+        parent = nodes.get(comment.parent_id)
+        if parent is None:
+            continue
+        comment.children = []
+        parent.children.append(comment)
+        nodes[comment.pk] = comment
+    _mark_hidden_replies(nodes.values())
+
+
+def load_comment_page(publication, cursor=None, page_size=None, max_depth=None, limit=None):
+    """
+    Página de comentarios de primer nivel con sus respuestas precargadas.
+
+    Usa dos consultas: la página de raíces (keyset sobre created_at, id) y los
+    subárboles de esas raíces por prefijo de path, recortados por profundidad
+    y tamaño.
+
+    Returns:
+        tuple (lista de comentarios de primer nivel, cursor de la siguiente página o None)
+
+    Raises:
+        ValueError si el cursor no es válido
+    """
+    if page_size is None:
+        page_size = settings.COMMENTS_PAGE_SIZE
+    if max_depth is None:
+        max_depth = settings.COMMENT_TREE_MAX_DEPTH
+    if limit is None:
+        limit = settings.COMMENT_TREE_PAGE_SIZE
+
+    roots = publication.comments.select_related('user__profile').filter(parent__isnull=True)
+    roots, next_cursor = keyset_page(roots, cursor, page_size, descending=False)
+    if not roots:
+        return roots, next_cursor
+
+    # Solo los subárboles de las raíces de esta página: un rango entre el
+    # path menor y el mayor incluiría raíces de otras páginas (created_at no
+    # sigue necesariamente el orden de los ids)
+    subtrees = reduce(or_, (Q(path__startswith=root.path) for root in roots))
+    descendants = publication.comments.select_related('user__profile').filter(
+        subtrees,
+        depth__gte=1,
+        depth__lt=max_depth,
+    ).order_by('path')[:limit]
+    _attach_children(roots, descendants)
+    return roots, next_cursor
+
+
+def load_replies_page(comment, cursor=None, page_size=None):
+    """
+    Página de respuestas directas de un comentario, de la más antigua a la
+    más reciente. Sus propias respuestas se piden después con otra página.
+
+    Returns:
+        tuple (lista de respuestas, cursor de la siguiente página o None)
+
+    Raises:
+        ValueError si el cursor no es válido
+    """
+    if page_size is None:
+        page_size = settings.COMMENTS_PAGE_SIZE
+    replies = comment.replies.select_related('user__profile')
+    replies, next_cursor = keyset_page(replies, cursor, page_size, descending=False)
+    _attach_children(replies, [])
+    return replies, next_cursor
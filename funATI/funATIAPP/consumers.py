@@ -2,32 +2,145 @@ import json
 import logging
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from django.contrib.auth.models import User
 from django.contrib.auth.models import AnonymousUser
-from .models import Message
+from .models import Message, Profile
+from . import message_writer, realtime, social_graph
 
 logger = logging.getLogger(__name__)
 
-class ChatConsumer(AsyncWebsocketConsumer):
+def is_authenticated(scope):
+    user = scope.get("user")
+    return not isinstance(user, AnonymousUser) and getattr(user, 'is_authenticated', False)
+
+class UserGroupMixin:
+    """
+    Joins every connection to the user's personal group (user_<id>), where
+    inbox summaries and read-state changes are pushed to all their devices
+    (see realtime.publish_conversation / realtime.publish_read).
+    """
+    async def join_user_group(self):
+        self.user_group_name = realtime.user_group(self.user_id)
+        await self.channel_layer.group_add(self.user_group_name, self.channel_name)
+
+    async def leave_user_group(self):
+        if hasattr(self, 'user_group_name'):
+            await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
+
+    async def inbox_update(self, event):
+        try:
+            await self.send(text_data=json.dumps({
+                "type": "inbox",
+                "conversation": event["conversation"],
+                "unread_messages": event.get("unread_messages"),
+            }))
+        except Exception as e:
+            logger.error(f"Error sending inbox update: {e}")
+
+    async def messages_read(self, event):
+        try:
+            await self.send(text_data=json.dumps({
+                "type": "read",
+                "reader_id": event["reader_id"],
+            }))
+        except Exception as e:
+            logger.error(f"Error sending read state: {e}")
+
+    async def notification_created(self, event):
+        try:
+            await self.send(text_data=json.dumps({
+                "type": "notification",
+                "notification": event["notification"],
+                "unread_count": event["unread_count"],
+            }))
+        except Exception as e:
+            logger.error(f"Error sending notification: {e}")
+
+    async def notification_unread(self, event):
+        try:
+            await self.send(text_data=json.dumps({
+                "type": "notification_unread",
+                "unread_count": event["unread_count"],
+            }))
+        except Exception as e:
+            logger.error(f"Error sending notification count: {e}")
+
+class NotificationConsumer(UserGroupMixin, AsyncWebsocketConsumer):
+    """
+    Pushes new notifications and the unread count to every session of the
+    user (see realtime.publish_notification).
+    """
+    async def connect(self):
+        if not is_authenticated(self.scope):
+            await self.close()
+            return
+        self.user_id = self.scope["user"].id
+        try:
+            await self.join_user_group()
+            await self.accept()
+            # Initial badge value; later changes arrive through the group
+            await self.notification_unread({"unread_count": await self.get_unread_count()})
+        except Exception as e:
+            logger.error(f"Error connecting user to notifications: {e}")
+            await self.close()
+
+    async def disconnect(self, close_code):
+        try:
+            await self.leave_user_group()
+        except Exception as e:
+            logger.error(f"Error disconnecting user from notifications: {e}")
+
+    @database_sync_to_async
+    def get_unread_count(self):
+        return realtime.unread_notifications(self.user_id)
+
+class InboxConsumer(UserGroupMixin, AsyncWebsocketConsumer):
+    """Chats list connection: only receives the user's personal group events"""
+    async def connect(self):
+        if not is_authenticated(self.scope):
+            await self.close()
+            return
+        self.user_id = self.scope["user"].id
+        try:
+            await self.join_user_group()
+            await self.accept()
+        except Exception as e:
+            logger.error(f"Error connecting user to inbox: {e}")
+            await self.close()
+
+    async def disconnect(self, close_code):
+        try:
+            await self.leave_user_group()
+        except Exception as e:
+            logger.error(f"Error disconnecting user from inbox: {e}")
+
+class ChatConsumer(UserGroupMixin, AsyncWebsocketConsumer):
     async def connect(self):
         try:
             # Check if user is authenticated
-            if isinstance(self.scope.get("user"), AnonymousUser) or not hasattr(self.scope.get("user"), 'is_authenticated') or not self.scope["user"].is_authenticated:
+            if not is_authenticated(self.scope):
                 logger.warning("Unauthenticated user trying to connect to chat")
                 await self.close()
                 return
 
             self.user_id = self.scope["user"].id
             self.room_name = self.scope["url_route"]["kwargs"]["room_name"]
-            self.room_group_name = f"chat_{self.room_name}"
 
             logger.info(f"User {self.scope['user'].username} connecting to room {self.room_name}")
 
+            # Resolve the other participant once; receive() trusts it afterwards
+            self.peer_id = await self.get_room_peer(self.room_name)
+            if self.peer_id is None:
+                logger.warning(f"User {self.scope['user'].username} is not a member of room {self.room_name}")
+                await self.close()
+                return
+            self.room_group_name = f"chat_{self.room_name}"
+
             # Join room group
             await self.channel_layer.group_add(
                 self.room_group_name,
                 self.channel_name
             )
+            await self.join_user_group()
 
             await self.accept()
             logger.info(f"User {self.scope['user'].username} connected to room {self.room_name}")
@@ -41,6 +154,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
     async def disconnect(self, close_code):
         try:
+            # Don't leave this connection's messages waiting for the next batch
+            if message_writer.enabled():
+                await message_writer.writer.flush()
             # Leave room group
             if hasattr(self, 'room_group_name'):
                 await self.channel_layer.group_discard(
@@ -48,6 +164,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     self.channel_name
                 )
                 logger.info(f"User disconnected from room {self.room_name}")
+            await self.leave_user_group()
         except Exception as e:
             logger.error(f"Error disconnecting user from chat: {e}")
 
@@ -56,34 +173,30 @@ class ChatConsumer(AsyncWebsocketConsumer):
             # Parse message data
             text_data_json = json.loads(text_data)
             message = text_data_json.get("message", "")
-            receiver_id = text_data_json.get("receiver_id")
-
-            # Validate required fields
-            if not receiver_id:
-                logger.error("Missing receiver_id in message")
-                await self.send_error("Missing receiver_id")
-                return
+            # The receiver is the other room member resolved at connect time;
+            # any receiver_id sent by the client is ignored
+            receiver_id = self.peer_id
 
             if not message.strip():
                 logger.error("Empty message content")
                 await self.send_error("Message cannot be empty")
                 return
 
-            # Validate receiver exists
-            receiver_exists = await self.user_exists(receiver_id)
-            if not receiver_exists:
-                logger.error(f"Receiver {receiver_id} does not exist")
-                await self.send_error("Receiver not found")
-                return
-
             logger.info(f"Saving message from {self.user_id} to {receiver_id}")
 
-            # Save message to database
-            saved_message = await self.save_message(
-                sender_id=self.user_id,
-                receiver_id=receiver_id,
-                content=message
-            )
+            # Save message to database (or to the write-behind buffer)
+            if message_writer.enabled():
+                saved_message = await self.buffer_message(
+                    sender_id=self.user_id,
+                    receiver_id=receiver_id,
+                    content=message
+                )
+            else:
+                saved_message = await self.save_message(
+                    sender_id=self.user_id,
+                    receiver_id=receiver_id,
+                    content=message
+                )
 
             if not saved_message:
                 await self.send_error("Failed to save message")
@@ -98,7 +211,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     "sender_id": self.user_id,
                     "sender_username": self.scope["user"].username,
                     "timestamp": saved_message["timestamp"],
-                    "message_id": saved_message["id"],
+                    # Snowflake ids exceed JavaScript's safe integers (see message_ids.py)
+                    "message_id": str(saved_message["id"]),
                 }
             )
 
@@ -128,6 +242,14 @@ class ChatConsumer(AsyncWebsocketConsumer):
         except Exception as e:
             logger.error(f"Error sending chat message: {e}")
 
+    async def membership_revoked(self, event):
+        """The friendship behind this room was removed (see realtime.revoke_chat_membership)"""
+        try:
+            await self.send_error("You are no longer friends with this user")
+            await self.close()
+        except Exception as e:
+            logger.error(f"Error revoking chat membership: {e}")
+
     async def send_error(self, error_message):
         """Send error message to the client"""
         try:
@@ -141,28 +263,42 @@ class ChatConsumer(AsyncWebsocketConsumer):
     @database_sync_to_async
     def save_message(self, sender_id, receiver_id, content):
         try:
-            sender = User.objects.get(id=sender_id)
-            receiver = User.objects.get(id=receiver_id)
+            # Both users were already validated; a single INSERT is enough
             message = Message.objects.create(
-                sender=sender,
-                receiver=receiver,
+                sender_id=sender_id,
+                receiver_id=receiver_id,
                 content=content
             )
             return {
                 "id": message.id,
                 "timestamp": message.timestamp.strftime("%Y-%m-%d %H:%M:%S")
             }
-        except User.DoesNotExist as e:
-            logger.error(f"User not found: {e}")
-            return None
         except Exception as e:
             logger.error(f"Error saving message: {e}")
             return None
 
-    @database_sync_to_async
-    def user_exists(self, user_id):
+    async def buffer_message(self, sender_id, receiver_id, content):
+        """Queue the message in the write-behind buffer (see message_writer.py)"""
         try:
-            return User.objects.filter(id=user_id).exists()
+            return await message_writer.writer.submit(sender_id, receiver_id, content)
         except Exception as e:
-            logger.error(f"Error checking if user exists: {e}")
-            return False 
\ No newline at end of file
+            logger.error(f"Error buffering message: {e}")
+            return None
+
+    @database_sync_to_async
+    def get_room_peer(self, room_name):
+        """
+        Parse a "<low user id>_<high user id>" room name and return the other
+        participant's user id, or None if the connected user is not one of the
+        two or they are not friends.
+        """
+        try:
+            low, high = (int(part) for part in room_name.split("_"))
+        except ValueError:
+            return None
+        if low >= high or self.user_id not in (low, high):
+            return None
+        profile_ids = dict(Profile.objects.filter(user_id__in=(low, high)).values_list("user_id", "id"))
+        if len(profile_ids) != 2 or not social_graph.are_friends_in_db(profile_ids[low], profile_ids[high]):
+            return None
+        return high if self.user_id == low else low
@@ -1,12 +1,19 @@
-from .models import UserSettings
+from django.utils.functional import SimpleLazyObject
+from .models import UnreadCounter, UserSettings
 
 def user_settings(request):
-    """Context processor para proporcionar configuraciones del usuario a todos los templates"""
+    """
+    Context processor para proporcionar configuraciones del usuario y sus
+    contadores de no leídos (ver UnreadCounter) a todos los templates
+    """
     if request.user.is_authenticated:
         settings = UserSettings.get_user_settings(request.user)
         return {
-            'user_settings': settings
+            'user_settings': settings,
+            # Solo se consulta si el template lo usa
+            'unread_counts': SimpleLazyObject(lambda: UnreadCounter.for_user(request.user.id)),
         }
     return {
-        'user_settings': None
-    } 
\ No newline at end of file
+        'user_settings': None,
+        'unread_counts': None,
+    }
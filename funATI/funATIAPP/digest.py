@@ -0,0 +1,127 @@
+"""
+Resúmenes de notificaciones por correo.
+
+Los usuarios con UserSettings.email_delivery 'cada_hora' o 'diario' no
+reciben un correo por notificación: sus notificaciones quedan con
+emailed=False y el comando send_notification_digests las agrupa por
+destinatario y tipo en un solo correo por ventana, que se encola en
+EmailOutbox como cualquier otro.
+"""
+from itertools import groupby
+from django.db import transaction
+from .models import Notification
+from . import outbox
+
+# Preferencias que atiende cada ejecución. La horaria también recoge lo que
+# quedó pendiente de quienes volvieron a 'inmediato'.
+FREQUENCIES = {
+    'cada_hora': ['cada_hora', 'inmediato'],
+    'diario': ['diario'],
+}
+NAMES_SHOWN = 3
+COMMENTS_SHOWN = 5
+
+
+def _names(notifications):
+    names = []
+    for notification in notifications:
+        if notification.sender.username not in names:
+            names.append(notification.sender.username)
+    # De las notificaciones agrupadas solo se conoce el último actor
+    others = len(names) - NAMES_SHOWN if len(names) > NAMES_SHOWN else 0
+    others += sum(notification.other_actors for notification in notifications)
+    shown = ', '.join(names[:NAMES_SHOWN])
+    if others:
+        shown += f' y {others} más'
+    return shown
+
+
+def _actors(notifications):
+    """Eventos que representan las notificaciones, contando los agrupados"""
+    return sum(notification.actor_count for notification in notifications)
+
+
+def build_digest(recipient, notifications):
+    """
+    Asunto y cuerpo de un resumen con las notificaciones agrupadas por tipo.
+
+    Returns:
+        tuple (asunto, mensaje)
+    """
+    by_type = {}
+    for notification in notifications:
+        by_type.setdefault(notification.notification_type, []).append(notification)
+
+    sections = []
+    follows = by_type.get('follow')
+    if follows:
+        sections.append(f"🚀 {_actors(follows)} nuevos seguidores: {_names(follows)}")
+    friends = by_type.get('friend')
+    if friends:
+        sections.append(f"🤝 {_actors(friends)} nuevos amigos: {_names(friends)}")
+    comments = by_type.get('comment')
+    if comments:
+        lines = [f"💬 {_actors(comments)} respuestas a tus publicaciones:"]
+        for notification in comments[-COMMENTS_SHOWN:]:
+            content = notification.comment.content if notification.comment else ''
+            preview = content[:100] + ("..." if len(content) > 100 else "")
+            others = f" y {notification.other_actors} más" if notification.other_actors else ""
+            lines.append(f'   - {notification.sender.username}{others}: "{preview}"')
+        if len(comments) > COMMENTS_SHOWN:
+            lines.append(f"   ... y {len(comments) - COMMENTS_SHOWN} más")
+        sections.append('\n'.join(lines))
+
+    subject = f"📬 Tu resumen de FunATI: {_actors(notifications)} notificaciones nuevas"
+    body = "\n\n".join([
+        f"¡Hola {recipient.username}!",
+        "Esto pasó en FunATI desde tu último resumen:",
+        *sections,
+        "¡Entra a FunATI para ver todos los detalles!",
+        "---\nEste email fue enviado desde FunATI.\n"
+        "Puedes cambiar la frecuencia de los resúmenes o desactivarlos en tu configuración.",
+    ])
+    return subject, body
+
+
+def pending_notifications(frequency):
+    """Notificaciones sin enviar de los usuarios con esa frecuencia, agrupables por destinatario"""
+    return (
+        Notification.objects.filter(
+            emailed=False,
+            recipient__settings__email_notifications=True,
+            recipient__settings__email_delivery__in=FREQUENCIES[frequency],
+        )
+        .exclude(recipient__email='')
+        .select_related('recipient', 'sender', 'comment')
+        .order_by('recipient_id', 'updated_at')
+    )
+
+
+def send_digests(frequency, batch_size=100):
+    """
+    Encola un resumen por destinatario con sus notificaciones pendientes.
+    Los destinatarios se procesan por lotes; cada lote se lee completo antes de
+    marcarlo, para no escribir sobre una consulta que aún se está recorriendo.
+
+    Returns:
+        número de resúmenes encolados
+    """
+    pending = pending_notifications(frequency)
+    recipient_ids = list(pending.order_by('recipient_id').values_list('recipient_id', flat=True).distinct())
+    sent = 0
+    for start in range(0, len(recipient_ids), batch_size):
+        rows = list(pending.filter(recipient_id__in=recipient_ids[start:start + batch_size]))
+        for _, group in groupby(rows, key=lambda notification: notification.recipient_id):
+            notifications = list(group)
+            recipient = notifications[0].recipient
+            subject, body = build_digest(recipient, notifications)
+            # El resumen y la marca se guardan juntos: si falla uno, no se pierde ni se repite
+            with transaction.atomic():
+                outbox.enqueue(recipient.email, subject, body)
+                # Las que se reagruparon después de leerlas quedan para el siguiente resumen
+                Notification.objects.filter(
+                    id__in=[notification.id for notification in notifications],
+                    updated_at__lte=max(notification.updated_at for notification in notifications),
+                ).update(emailed=True)
+            sent += 1
+    return sent
@@ -0,0 +1,173 @@
+"""
+Timeline materializado del muro (fan-out on write).
+
+Cada publicación se copia como FeedEntry en el feed de todos los perfiles
+que pueden verla. Los cambios de seguimiento, amistad y privacidad
+añaden o eliminan las entradas de un autor en los feeds afectados, de modo
+que muro_view solo lee una porción ya filtrada y ordenada.
+"""
+from django.db.models import Q
+from .models import FeedEntry, Profile, Publication, UserSettings
+from .pagination import keyset_page
+
+BATCH_SIZE = 500
+
+
+def is_public(profile):
+    """Indica si las publicaciones del perfil son públicas"""
+    return UserSettings.get_user_settings(profile.user).privacy == 'publico'
+
+
+def audience_ids(author):
+    """
+    IDs de los perfiles cuyo feed debe incluir las publicaciones de `author`:
+    el propio autor, sus amigos y, si su perfil es público, sus seguidores.
+    """
+    ids = {author.id}
+    ids.update(author.friends.values_list('id', flat=True))
+    if is_public(author):
+        ids.update(author.followers.values_list('id', flat=True))
+    return ids
+
+
+def are_friends(profile_a, profile_b):
+    """
+    Comprueba la amistad en cualquiera de los dos sentidos: durante post_add
+    la fila espejo de la relación simétrica todavía no existe.
+    """
+    return Profile.friends.through.objects.filter(
+        Q(from_profile=profile_a, to_profile=profile_b) |
+        Q(from_profile=profile_b, to_profile=profile_a)
+    ).exists()
+
+
+def should_see_author(owner, author):
+    """Indica si las publicaciones de `author` pertenecen al feed de `owner`"""
+    if owner.id == author.id:
+        return True
+    if are_friends(owner, author):
+        return True
+    return owner.following.filter(id=author.id).exists() and is_public(author)
+
+
+def _backfill(owner_ids, author_ids):
+    """Inserta todas las publicaciones de los autores indicados en los feeds indicados"""
+    owner_ids = list(owner_ids)
+    author_ids = list(author_ids)
+    if not owner_ids or not author_ids:
+        return
+    publications = Publication.objects.filter(profile_id__in=author_ids).values_list(
+        'id', 'profile_id', 'created_at'
+    ).iterator()
+    batch = []
+    for publication_id, author_id, created_at in publications:
+        for owner_id in owner_ids:
+            batch.append(FeedEntry(
+                owner_id=owner_id,
+                publication_id=publication_id,
+                author_id=author_id,
+                created_at=created_at,
+            ))
+        if len(batch) >= BATCH_SIZE:
+            FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out_publication(publication):
+    """Copia una publicación nueva en el feed de toda su audiencia"""
+    entries = [
+        FeedEntry(
+            owner_id=owner_id,
+            publication_id=publication.id,
+            author_id=publication.profile_id,
+            created_at=publication.created_at,
+        )
+        for owner_id in audience_ids(publication.profile)
+    ]
+    FeedEntry.objects.bulk_create(entries, ignore_conflicts=True, batch_size=BATCH_SIZE)
+
+
+def _friend_ids_among(profile_id, ids):
+    """Amigos de `profile_id` entre `ids`, en cualquiera de los dos sentidos (ver are_friends)"""
+    rows = Profile.friends.through.objects.filter(
+        Q(from_profile_id=profile_id, to_profile_id__in=ids) |
+        Q(to_profile_id=profile_id, from_profile_id__in=ids)
+    ).values_list('from_profile_id', 'to_profile_id')
+    return {other for pair in rows for other in pair if other != profile_id}
+
+
+def sync_owners(owner_ids, author):
+    """
+    Reconcilia las entradas de `author` en los feeds de `owner_ids` después
+    de un cambio de seguimiento o amistad en bloque (p. ej. varios seguidores
+    nuevos). Son unas pocas consultas sin importar cuántos perfiles cambien.
+    """
+    owner_ids = set(owner_ids)
+    visible = (owner_ids & {author.id}) | _friend_ids_among(author.id, owner_ids)
+    if is_public(author):
+        visible.update(
+            Profile.following.through.objects.filter(to_profile_id=author.id, from_profile_id__in=owner_ids)
+            .values_list('from_profile_id', flat=True)
+        )
+    FeedEntry.objects.filter(author=author, owner_id__in=owner_ids - visible).delete()
+    _backfill(visible, [author.id])
+
+
+def sync_authors(owner, author_ids):
+    """
+    Reconcilia las entradas de los autores `author_ids` en el feed de `owner`
+    después de que empiece o deje de seguirlos, o de ser su amigo, en bloque.
+    """
+    author_ids = set(author_ids)
+    visible = (author_ids & {owner.id}) | _friend_ids_among(owner.id, author_ids)
+    followed = owner.following.filter(id__in=author_ids - visible)
+    # Los seguidos solo cuentan si su perfil es público (ver visible_profiles_q)
+    visible.update(followed.publications_visible_to(None).values_list('id', flat=True))
+    FeedEntry.objects.filter(owner=owner, author_id__in=author_ids - visible).delete()
+    _backfill([owner.id], visible)
+
+
+def refresh_author_audience(author):
+    """
+    Reconcilia los feeds que contienen a `author` con su audiencia actual
+    (por ejemplo, después de un cambio de privacidad).
+    """
+    audience = audience_ids(author)
+    FeedEntry.objects.filter(author=author).exclude(owner_id__in=audience).delete()
+    present = set(
+        FeedEntry.objects.filter(author=author).values_list('owner_id', flat=True).distinct()
+    )
+    _backfill(audience - present, [author.id])
+
+
+def rebuild_feed(owner):
+    """Reconstruye desde cero el feed de un perfil"""
+    FeedEntry.objects.filter(owner=owner).delete()
+    authors = Profile.objects.select_related('user').filter(
+        Q(id=owner.id) | Q(friends=owner) | Q(followers=owner)
+    ).distinct()
+    for author in authors:
+        if should_see_author(owner, author):
+            _backfill([owner.id], [author.id])
+
+
+def feed_for(profile):
+    """Publicaciones del feed materializado de un perfil, de la más reciente a la más antigua"""
+    return Publication.objects.select_related('profile__user').filter(
+        feed_entries__owner=profile
+    ).order_by('-created_at', '-id')
+
+
+def feed_page(profile, cursor=None, page_size=20):
+    """
+    Página del feed materializado paginada por keyset sobre
+    (FeedEntry.created_at, publication_id), que recorre el índice del timeline.
+
+    Returns:
+        tuple (lista de publicaciones, cursor de la siguiente página o None)
+    """
+    entries = FeedEntry.objects.filter(owner=profile).select_related('publication__profile__user')
+    entries, next_cursor = keyset_page(entries, cursor, page_size, id_field='publication_id')
+    return [entry.publication for entry in entries], next_cursor
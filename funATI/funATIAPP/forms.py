@@ -2,6 +2,7 @@ from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import AuthenticationForm, PasswordResetForm
 from .models import Publication, Profile
+from . import uploads
 
 class PublicationForm(forms.ModelForm):
     class Meta:
@@ -11,6 +12,17 @@ class PublicationForm(forms.ModelForm):
             'content': forms.Textarea(attrs={'placeholder': '¿Qué quieres funar?', 'class': 'form-control'}),
         }
 
+    def clean_media(self):
+        media = self.cleaned_data.get('media')
+        # Mismos límites por tipo que las subidas por partes
+        if media and hasattr(media, 'size'):
+            kind = uploads.kind_of(media.name)
+            if kind is None:
+                raise forms.ValidationError('Solo se permiten imágenes y videos.')
+            if media.size > uploads.max_size(kind):
+                raise forms.ValidationError(f'El archivo supera el límite de {uploads.max_size(kind) // (1024 * 1024)} MB.')
+        return media
+
 class RegisterForm(forms.Form):
     email = forms.EmailField(required=True)
     password = forms.CharField(label='Password', widget=forms.PasswordInput)
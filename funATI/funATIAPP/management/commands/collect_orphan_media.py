@@ -0,0 +1,60 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from funATIAPP import orphan_media
+
+
+class Command(BaseCommand):
+    help = 'Borra (o mueve a cuarentena) los archivos de MEDIA_ROOT que ya no usa ninguna fila'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo lista los huérfanos, sin borrar nada',
+        )
+        parser.add_argument(
+            '--quarantine',
+            default=None,
+            help='Mueve los huérfanos a este directorio en lugar de borrarlos',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=orphan_media.BATCH_SIZE,
+            help=f'Archivos comprobados por consulta (por defecto {orphan_media.BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=float,
+            default=24,
+            help='Horas sin modificar para considerar un archivo (por defecto 24)',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size debe ser mayor que 0')
+        skip = []
+        quarantine = options['quarantine']
+        if quarantine:
+            quarantine = os.path.abspath(quarantine)
+            # La cuarentena puede estar dentro de MEDIA_ROOT: no se recorre
+            skip.append(quarantine)
+
+        found = freed = 0
+        for orphans in orphan_media.find_orphans(
+            options['min_age'] * 3600, batch_size=options['batch_size'], skip=skip
+        ):
+            found += len(orphans)
+            if options['dry_run']:
+                for name in orphans:
+                    self.stdout.write(name)
+                continue
+            freed += orphan_media.remove(orphans, quarantine=quarantine)
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Huérfanos encontrados: {found} (sin cambios)'))
+        else:
+            action = 'movidos a cuarentena' if quarantine else 'borrados'
+            self.stdout.write(self.style.SUCCESS(
+                f'Huérfanos {action}: {found} ({freed / (1024 * 1024):.1f} MB liberados)'
+            ))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from funATIAPP.models import Profile
+from funATIAPP import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Precalcula por lotes las recomendaciones de amigos de todos los perfiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Perfiles leídos por lote (por defecto 500)',
+        )
+        parser.add_argument(
+            '--profile',
+            type=int,
+            action='append',
+            dest='profile_ids',
+            help='ID del perfil a recalcular (se puede repetir). Por defecto, todos.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        profiles = Profile.objects.order_by('id')
+        if options['profile_ids']:
+            profiles = profiles.filter(id__in=options['profile_ids'])
+
+        # Recorrido por keyset sobre el id para no cargar todos los perfiles
+        last_id = 0
+        processed = 0
+        while True:
+            batch = list(profiles.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size])
+            if not batch:
+                break
+            for profile_id in batch:
+                recommendations.compute_for(profile_id)
+            processed += len(batch)
+            last_id = batch[-1]
+            self.stdout.write(f'Perfiles procesados: {processed}')
+
+        self.stdout.write(self.style.SUCCESS(f'Recomendaciones calculadas para {processed} perfiles'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from funATIAPP import uploads
+
+
+class Command(BaseCommand):
+    help = 'Borra las subidas por partes abandonadas y sus archivos temporales'
+
+    def handle(self, *args, **options):
+        deleted = uploads.expire_sessions()
+        self.stdout.write(self.style.SUCCESS(f'Subidas expiradas: {deleted}'))
@@ -0,0 +1,42 @@
+import time
+from django.core.management.base import BaseCommand
+from funATIAPP import renditions
+
+
+class Command(BaseCommand):
+    help = 'Genera las versiones WEBP (thumb, card, full) de los avatares e imágenes subidos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Procesa lo pendiente una vez y termina (por defecto queda esperando subidas nuevas)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Archivos por lote (por defecto IMAGE_RENDITIONS["BATCH_SIZE"])',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Segundos de espera cuando no hay pendientes (por defecto 5)',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        try:
+            while True:
+                processed = renditions.process_pending(options['batch_size'])
+                total += processed
+                if processed:
+                    self.stdout.write(f'Procesados: {processed}')
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Archivos procesados: {total}'))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from funATIAPP.models import Publication, Comment
+
+
+def count_subquery(queryset, field):
+    """Subconsulta correlacionada que cuenta las filas de `queryset` agrupadas por `field`"""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+class Command(BaseCommand):
+    help = 'Recalcula en bloque los contadores de comentarios y respuestas'
+
+    def handle(self, *args, **options):
+        # Un solo UPDATE por tabla, sin cargar filas en memoria
+        with transaction.atomic():
+            publications = Publication.objects.update(
+                comments_count=count_subquery(Comment.objects.all(), 'publication')
+            )
+            comments = Comment.objects.update(
+                replies_count=count_subquery(Comment.objects.all(), 'parent')
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Contadores recalculados: {publications} publicaciones, {comments} comentarios'
+        ))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from funATIAPP.models import Profile
+from funATIAPP import feed
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el timeline materializado (FeedEntry) de los perfiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--profile',
+            type=int,
+            action='append',
+            dest='profile_ids',
+            help='ID del perfil cuyo feed se reconstruye (se puede repetir). Por defecto, todos.',
+        )
+
+    def handle(self, *args, **options):
+        profiles = Profile.objects.select_related('user').order_by('id')
+        if options['profile_ids']:
+            profiles = profiles.filter(id__in=options['profile_ids'])
+
+        total = 0
+        for profile in profiles.iterator():
+            feed.rebuild_feed(profile)
+            total += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Feeds reconstruidos: {total}'))
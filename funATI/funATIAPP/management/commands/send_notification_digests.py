@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from funATIAPP import digest
+
+
+class Command(BaseCommand):
+    help = 'Encola los resúmenes de notificaciones de los usuarios con entrega por hora o diaria'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--frequency',
+            choices=sorted(digest.FREQUENCIES),
+            default='cada_hora',
+            help='Resúmenes a enviar: cada_hora (por defecto) o diario',
+        )
+
+    def handle(self, *args, **options):
+        sent = digest.send_digests(options['frequency'])
+        self.stdout.write(self.style.SUCCESS(f'Resúmenes encolados: {sent}'))
@@ -0,0 +1,43 @@
+import time
+from django.core.management.base import BaseCommand
+from funATIAPP import outbox
+
+
+class Command(BaseCommand):
+    help = 'Envía los correos encolados en EmailOutbox, por lotes y con reintentos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Vacía la cola una vez y termina (por defecto queda esperando correos nuevos)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Correos enviados por conexión SMTP (por defecto EMAIL_OUTBOX["BATCH_SIZE"])',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Segundos de espera cuando la cola está vacía (por defecto 5)',
+        )
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        try:
+            while True:
+                sent, failed = outbox.deliver_batch(options['batch_size'])
+                total_sent += sent
+                total_failed += failed
+                if sent or failed:
+                    self.stdout.write(f'Enviados: {sent}, fallidos: {failed}')
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Correos enviados: {total_sent}, fallidos: {total_failed}'))
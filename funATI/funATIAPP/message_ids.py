@@ -0,0 +1,83 @@
+"""
+Ids de los mensajes del chat.
+
+Con la escritura diferida activa (CHAT_WRITE_BEHIND['ENABLED']) el búfer de
+message_writer.py asigna el id antes de insertar, así que los mensajes usan
+un id tipo snowflake (milisegundos desde ID_EPOCH_MS, MESSAGE_WORKER_ID y
+secuencia). En ese modo Message.save usa el mismo origen para los de
+send_message_api y del consumer, de modo que los ids siguen ordenados en el
+tiempo, que es lo que necesita la paginación del historial
+(Message.objects.history_page). Sin escritura diferida se usa el id
+autoincremental de siempre. Los mensajes anteriores conservan sus ids, todos
+menores; al desactivar el modo, SQLite sigue numerando desde el mayor, pero
+en otros motores hay que avanzar la secuencia de la tabla.
+
+Estos ids superan 2**53 (Number.MAX_SAFE_INTEGER en JavaScript): al cliente
+se envían siempre como cadenas.
+
+Cada proceso que inserta mensajes necesita su propio MESSAGE_WORKER_ID
+(0 a 1023): dos procesos con el mismo pueden generar el mismo id.
+"""
+import threading
+import time
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# 2025-01-01T00:00:00Z en milisegundos
+ID_EPOCH_MS = 1735689600000
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+
+
+class IdGenerator:
+    """Ids de 63 bits: milisegundos desde ID_EPOCH_MS, id de worker y secuencia"""
+
+    def __init__(self, worker_id):
+        if not isinstance(worker_id, int) or not 0 <= worker_id < (1 << WORKER_BITS):
+            raise ImproperlyConfigured(
+                f'MESSAGE_WORKER_ID must be an integer between 0 and {(1 << WORKER_BITS) - 1}, got {worker_id!r}'
+            )
+        self.worker_id = worker_id
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._sequence = 0
+
+    def next_id(self):
+        with self._lock:
+            now_ms = max(int(time.time() * 1000), self._last_ms)
+            if now_ms == self._last_ms:
+                self._sequence = (self._sequence + 1) % (1 << SEQUENCE_BITS)
+                if self._sequence == 0:
+                    # Secuencia agotada en este milisegundo: se toma el siguiente
+                    now_ms += 1
+            else:
+                self._sequence = 0
+            self._last_ms = now_ms
+            return (
+                ((now_ms - ID_EPOCH_MS) << (WORKER_BITS + SEQUENCE_BITS))
+                | (self.worker_id << SEQUENCE_BITS)
+                | self._sequence
+            )
+
+
+_generator = None
+_generator_lock = threading.Lock()
+
+
+def generator():
+    """Generador del proceso, creado con MESSAGE_WORKER_ID la primera vez"""
+    global _generator
+    worker_id = getattr(settings, 'MESSAGE_WORKER_ID', None)
+    with _generator_lock:
+        if _generator is None or _generator.worker_id != worker_id:
+            _generator = IdGenerator(worker_id)
+        return _generator
+
+
+def enabled():
+    """Indica si los mensajes nuevos usan ids de este módulo"""
+    return bool(getattr(settings, 'CHAT_WRITE_BEHIND', {}).get('ENABLED', False))
+
+
+def next_id():
+    return generator().next_id()
@@ -0,0 +1,193 @@
+"""
+Persistencia diferida (write-behind) de los mensajes del chat.
+
+Con CHAT_WRITE_BEHIND['ENABLED'] el ChatConsumer no inserta cada mensaje:
+le asigna un id al momento, lo difunde a la sala y lo deja en el búfer de
+este proceso. Una tarea del event loop lo escribe con bulk_create en lotes
+acotados por tamaño (MAX_BATCH) y por tiempo (FLUSH_INTERVAL), en una sola
+transacción por lote.
+
+Durabilidad: por defecto el mensaje se confirma al cliente antes de llegar a
+la base de datos, y si el proceso muere se pierde lo que quede en el búfer
+(como mucho FLUSH_INTERVAL segundos). Con WAIT_FOR_FLUSH el consumer espera
+a que su lote se confirme antes de difundirlo: se mantiene el agrupamiento
+de escrituras sin perder mensajes ya confirmados. El búfer se vacía al
+desconectarse cada consumer y al terminar el proceso.
+
+Si un lote falla (p. ej. "database is locked" en SQLite) vuelve al principio
+del búfer y se reintenta con espera exponencial; solo tras MAX_RETRIES
+intentos se descarta, registrando los ids perdidos.
+
+Los ids los asigna message_ids.py, igual que en el resto de inserciones de
+Message mientras este modo está activo.
+"""
+import asyncio
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Conversation, Message
+from . import message_ids, realtime
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'MAX_BATCH': 100,
+    'FLUSH_INTERVAL': 0.05,
+    'WAIT_FOR_FLUSH': False,
+    'MAX_RETRIES': 5,
+    'RETRY_DELAY': 0.1,
+}
+
+def _config(name):
+    return getattr(settings, 'CHAT_WRITE_BEHIND', {}).get(name, DEFAULTS[name])
+
+
+def enabled():
+    return message_ids.enabled()
+
+
+def write_batch(messages):
+    """
+    Inserta un lote de mensajes y actualiza sus conversaciones. bulk_create no
+    envía post_save, así que las conversaciones se actualizan (y se publican a
+    los grupos de usuario) aquí, una vez por remitente y destinatario.
+    """
+    with transaction.atomic():
+        Message.objects.bulk_create(messages)
+        by_direction = defaultdict(list)
+        for message in messages:
+            by_direction[(message.sender_id, message.receiver_id)].append(message)
+        for direction_messages in by_direction.values():
+            last = max(direction_messages, key=lambda message: message.id)
+            Conversation.register_message(last, unread=len(direction_messages))
+        for message in {message.conversation_key: message for message in messages}.values():
+            realtime.publish_conversation_on_commit(message.sender_id, message.receiver_id)
+
+
+class MessageWriter:
+    """Búfer de mensajes pendientes de este proceso y su tarea de escritura"""
+
+    def __init__(self):
+        self._pending = []
+        # Intentos fallidos seguidos del lote que encabeza el búfer
+        self._failures = 0
+        self._lock = threading.Lock()
+        self._wakeup = None
+        self._task = None
+
+    def _ensure_task(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=_config('FLUSH_INTERVAL'))
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def _take_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        return pending
+
+    async def submit(self, sender_id, receiver_id, content):
+        """
+        Encola un mensaje nuevo con su id ya asignado.
+
+        Returns:
+            dict con el id y el timestamp, como ChatConsumer.save_message
+        """
+        message = Message(
+            id=message_ids.next_id(),
+            sender_id=sender_id,
+            receiver_id=receiver_id,
+            conversation_key=Message.conversation_key_for(sender_id, receiver_id),
+            content=content,
+        )
+        future = asyncio.get_running_loop().create_future() if _config('WAIT_FOR_FLUSH') else None
+        with self._lock:
+            self._pending.append((message, future))
+            full = len(self._pending) >= _config('MAX_BATCH')
+        self._ensure_task()
+        if full:
+            self._wakeup.set()
+        if future is not None:
+            await future
+        return {
+            "id": message.id,
+            # auto_now_add fija la hora definitiva al insertar; difiere como mucho FLUSH_INTERVAL
+            "timestamp": (message.timestamp or timezone.now()).strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+    def _requeue(self, pending, error):
+        """
+        Devuelve un lote fallido al principio del búfer.
+
+        Returns:
+            segundos a esperar antes de reintentar, o None si se agotaron los
+            intentos y el lote se descartó
+        """
+        self._failures += 1
+        if self._failures < _config('MAX_RETRIES'):
+            with self._lock:
+                self._pending = pending + self._pending
+            logger.warning(f"Error writing {len(pending)} buffered messages (attempt {self._failures}), retrying: {error}")
+            return _config('RETRY_DELAY') * 2 ** (self._failures - 1)
+        self._failures = 0
+        logger.error(
+            f"Dropping {len(pending)} buffered messages after {_config('MAX_RETRIES')} attempts: {error}. "
+            f"Lost ids: {[message.id for message, _ in pending]}"
+        )
+        for _, future in pending:
+            if future is not None and not future.done():
+                future.set_exception(error)
+        return None
+
+    async def flush(self):
+        """Escribe todo lo pendiente, reintentando si el lote falla"""
+        while True:
+            pending = self._take_pending()
+            if not pending:
+                return
+            try:
+                await database_sync_to_async(write_batch)([message for message, _ in pending])
+            except Exception as e:
+                delay = self._requeue(pending, e)
+                if delay is not None:
+                    await asyncio.sleep(delay)
+                continue
+            self._failures = 0
+            for _, future in pending:
+                if future is not None and not future.done():
+                    future.set_result(None)
+
+    def flush_sync(self):
+        """Vaciado síncrono para el cierre del proceso, sin event loop"""
+        while True:
+            pending = self._take_pending()
+            if not pending:
+                return
+            try:
+                write_batch([message for message, _ in pending])
+            except Exception as e:
+                delay = self._requeue(pending, e)
+                if delay is not None:
+                    time.sleep(delay)
+                continue
+            self._failures = 0
+
+
+writer = MessageWriter()
+atexit.register(writer.flush_sync)
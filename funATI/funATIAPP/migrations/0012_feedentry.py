@@ -0,0 +1,63 @@
+# Generated by Django 5.2.3 on 2026-10-17 23:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_feed_entries(apps, schema_editor):
+    """
+    Llenar el timeline materializado con las publicaciones existentes:
+    cada perfil ve las suyas, las de sus amigos y las de los perfiles
+    públicos que sigue.
+    """
+    Profile = apps.get_model('funATIAPP', 'Profile')
+    Publication = apps.get_model('funATIAPP', 'Publication')
+    UserSettings = apps.get_model('funATIAPP', 'UserSettings')
+    FeedEntry = apps.get_model('funATIAPP', 'FeedEntry')
+
+    private_user_ids = set(
+        UserSettings.objects.filter(privacy='privado').values_list('user_id', flat=True)
+    )
+    for author in Profile.objects.all().iterator():
+        audience = {author.id}
+        audience.update(author.friends.values_list('id', flat=True))
+        if author.user_id not in private_user_ids:
+            audience.update(author.followers.values_list('id', flat=True))
+
+        entries = [
+            FeedEntry(owner_id=owner_id, publication_id=publication_id, author_id=author.id, created_at=created_at)
+            for publication_id, created_at in Publication.objects.filter(profile=author).values_list('id', 'created_at')
+            for owner_id in audience
+        ]
+        FeedEntry.objects.bulk_create(entries, ignore_conflicts=True, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funATIAPP', '0011_alter_usersettings_privacy'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profile',
+            name='friends',
+            field=models.ManyToManyField(blank=True, to='funATIAPP.profile'),
+        ),
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='funATIAPP.profile')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='funATIAPP.profile')),
+                ('publication', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='funATIAPP.publication')),
+            ],
+            options={
+                'ordering': ['-created_at', '-publication_id'],
+                'indexes': [models.Index(fields=['owner', '-created_at', '-publication'], name='feed_owner_timeline_idx'), models.Index(fields=['owner', 'author'], name='feed_owner_author_idx')],
+                'constraints': [models.UniqueConstraint(fields=('owner', 'publication'), name='unique_feed_entry')],
+            },
+        ),
+        migrations.RunPython(backfill_feed_entries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-17 23:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funATIAPP', '0012_feedentry'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='publication',
+            index=models.Index(fields=['profile', '-created_at', '-id'], name='publication_profile_time_idx'),
+        ),
+    ]
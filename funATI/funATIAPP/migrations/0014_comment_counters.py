@@ -0,0 +1,47 @@
+# Generated by Django 5.2.3 on 2026-10-17 23:50
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def initialize_counters(apps, schema_editor):
+    """
+    Calcular los contadores de las filas existentes con un UPDATE por tabla
+    """
+    Publication = apps.get_model('funATIAPP', 'Publication')
+    Comment = apps.get_model('funATIAPP', 'Comment')
+
+    def count_of(field):
+        return Coalesce(
+            Subquery(
+                Comment.objects.filter(**{field: OuterRef('pk')}).order_by()
+                .values(field).annotate(total=Count('pk')).values('total'),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        )
+
+    Publication.objects.update(comments_count=count_of('publication'))
+    Comment.objects.update(replies_count=count_of('parent'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funATIAPP', '0013_publication_profile_time_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='replies_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='publication',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(initialize_counters, migrations.RunPython.noop),
+    ]
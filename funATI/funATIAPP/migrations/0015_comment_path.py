@@ -0,0 +1,51 @@
+# Generated by Django 5.2.3 on 2026-10-17 23:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_comment_paths(apps, schema_editor):
+    """
+    Calcular path y depth de los comentarios existentes, publicación por
+    publicación. Un padre siempre tiene un id menor que sus respuestas.
+    """
+    Publication = apps.get_model('funATIAPP', 'Publication')
+    Comment = apps.get_model('funATIAPP', 'Comment')
+
+    for publication_id in Publication.objects.values_list('id', flat=True).iterator():
+        paths = {}
+        updated = []
+        for comment in Comment.objects.filter(publication_id=publication_id).order_by('id'):
+            parent = paths.get(comment.parent_id)
+            parent_path, parent_depth = parent if parent else ('', -1)
+            comment.path = f"{parent_path}{comment.pk:010d}/"
+            comment.depth = parent_depth + 1
+            paths[comment.pk] = (comment.path, comment.depth)
+            updated.append(comment)
+        Comment.objects.bulk_update(updated, ['path', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funATIAPP', '0014_comment_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, default='', max_length=1000),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['publication', 'path'], name='comment_publication_path_idx'),
+        ),
+        migrations.RunPython(backfill_comment_paths, migrations.RunPython.noop),
+    ]
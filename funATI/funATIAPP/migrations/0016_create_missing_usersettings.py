@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-17 23:54
+
+from django.conf import settings
+from django.db import migrations
+
+
+def create_missing_usersettings(apps, schema_editor):
+    """
+    Crear la configuración de los usuarios que todavía no la tienen, para
+    que UserSettings.get_user_settings no tenga que escribir al leer.
+    """
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    UserSettings = apps.get_model('funATIAPP', 'UserSettings')
+
+    missing = User.objects.filter(settings__isnull=True).values_list('id', flat=True)
+    UserSettings.objects.bulk_create(
+        [UserSettings(user_id=user_id) for user_id in missing.iterator()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funATIAPP', '0015_comment_path'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_usersettings, migrations.RunPython.noop),
+    ]
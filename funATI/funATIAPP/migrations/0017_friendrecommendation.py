@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-17 23:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funATIAPP', '0016_create_missing_usersettings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FriendRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('mutual_friends', models.PositiveIntegerField(default=0)),
+                ('shared_following', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('candidate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='funATIAPP.profile')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='friend_recommendations', to='funATIAPP.profile')),
+            ],
+            options={
+                'ordering': ['-score', 'candidate_id'],
+                'indexes': [models.Index(fields=['profile', '-score'], name='recommendation_rank_idx')],
+                'constraints': [models.UniqueConstraint(fields=('profile', 'candidate'), name='unique_friend_recommendation')],
+            },
+        ),
+    ]
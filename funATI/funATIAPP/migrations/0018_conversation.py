@@ -0,0 +1,70 @@
+# Generated by Django 5.2.3 on 2026-10-18 00:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+
+def create_conversations(apps, schema_editor):
+    """
+    Crear una conversación por cada par de usuarios con mensajes, con su
+    último mensaje y los no leídos de cada participante
+    """
+    Message = apps.get_model('funATIAPP', 'Message')
+    Conversation = apps.get_model('funATIAPP', 'Conversation')
+
+    pairs = {}
+    rows = (
+        Message.objects.order_by().values('sender_id', 'receiver_id')
+        .annotate(last_id=Max('id'), unread=Count('id', filter=Q(is_read=False)))
+    )
+    for row in rows.iterator():
+        low, high = sorted((row['sender_id'], row['receiver_id']))
+        pair = pairs.setdefault((low, high), {'last_id': None, 'unread_low': 0, 'unread_high': 0})
+        pair['last_id'] = max(pair['last_id'] or 0, row['last_id'])
+        pair['unread_low' if row['receiver_id'] == low else 'unread_high'] += row['unread']
+
+    timestamps = dict(
+        Message.objects.filter(id__in=[pair['last_id'] for pair in pairs.values()])
+        .values_list('id', 'timestamp')
+    )
+    Conversation.objects.bulk_create([
+        Conversation(
+            user_low_id=low,
+            user_high_id=high,
+            last_message_id=pair['last_id'],
+            last_activity_at=timestamps[pair['last_id']],
+            unread_low=pair['unread_low'],
+            unread_high=pair['unread_high'],
+        )
+        for (low, high), pair in pairs.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funATIAPP', '0017_friendrecommendation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_activity_at', models.DateTimeField(blank=True, null=True)),
+                ('unread_low', models.PositiveIntegerField(default=0)),
+                ('unread_high', models.PositiveIntegerField(default=0)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='funATIAPP.message')),
+                ('user_high', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user_low', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_low', '-last_activity_at'], name='conversation_low_activity_idx'), models.Index(fields=['user_high', '-last_activity_at'], name='conversation_high_activity_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user_low', 'user_high'), name='unique_conversation_pair')],
+            },
+        ),
+        migrations.RunPython(create_conversations, migrations.RunPython.noop),
+    ]
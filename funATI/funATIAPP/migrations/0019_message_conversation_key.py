@@ -0,0 +1,43 @@
+# Generated by Django 5.2.3 on 2026-10-18 00:20
+
+from django.db import migrations, models
+from django.db.models import Case, CharField, F, Value, When
+from django.db.models.functions import Cast, Concat
+
+
+def backfill_conversation_keys(apps, schema_editor):
+    """
+    Calcular la clave de conversación ("<id menor>_<id mayor>") de los
+    mensajes existentes con un solo UPDATE
+    """
+    Message = apps.get_model('funATIAPP', 'Message')
+
+    def as_text(field):
+        return Cast(field, output_field=CharField())
+
+    Message.objects.update(conversation_key=Case(
+        When(sender_id__lt=F('receiver_id'), then=Concat(as_text('sender_id'), Value('_'), as_text('receiver_id'))),
+        default=Concat(as_text('receiver_id'), Value('_'), as_text('sender_id')),
+        output_field=CharField(),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funATIAPP', '0018_conversation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='conversation_key',
+            field=models.CharField(default='', editable=False, max_length=41),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_conversation_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation_key', 'id'], name='message_conversation_idx'),
+        ),
+    ]
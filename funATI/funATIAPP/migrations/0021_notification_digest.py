@@ -0,0 +1,39 @@
+# Generated by Django 5.2.3 on 2026-10-18 00:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_existing_as_emailed(apps, schema_editor):
+    """
+    Las notificaciones anteriores ya se enviaron una a una; sin esto el primer
+    resumen incluiría todo el historial
+    """
+    Notification = apps.get_model('funATIAPP', 'Notification')
+    Notification.objects.update(emailed=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funATIAPP', '0020_emailoutbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='emailed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='usersettings',
+            name='email_delivery',
+            field=models.CharField(choices=[('inmediato', 'Un correo por notificación'), ('cada_hora', 'Resumen cada hora'), ('diario', 'Resumen diario')], default='inmediato', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['emailed', 'recipient', 'created_at'], name='notification_digest_idx'),
+        ),
+        migrations.RunPython(mark_existing_as_emailed, migrations.RunPython.noop),
+    ]
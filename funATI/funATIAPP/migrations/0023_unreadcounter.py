@@ -0,0 +1,60 @@
+# Generated by Django 5.2.3 on 2026-10-18 00:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_unread_counters(apps, schema_editor):
+    """Contadores iniciales con tres consultas agregadas para todos los usuarios"""
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Notification = apps.get_model('funATIAPP', 'Notification')
+    Conversation = apps.get_model('funATIAPP', 'Conversation')
+    UnreadCounter = apps.get_model('funATIAPP', 'UnreadCounter')
+
+    notifications = dict(
+        Notification.objects.filter(is_read=False).values('recipient_id')
+        .annotate(total=Count('id')).values_list('recipient_id', 'total')
+    )
+    messages = dict(
+        Conversation.objects.values('user_low_id').annotate(total=Sum('unread_low'))
+        .values_list('user_low_id', 'total')
+    )
+    for user_id, total in (
+        Conversation.objects.values('user_high_id').annotate(total=Sum('unread_high'))
+        .values_list('user_high_id', 'total')
+    ):
+        messages[user_id] = messages.get(user_id, 0) + total
+
+    UnreadCounter.objects.bulk_create(
+        [
+            UnreadCounter(
+                user_id=user_id,
+                notifications=notifications.get(user_id, 0),
+                messages=messages.get(user_id, 0),
+            )
+            for user_id in User.objects.values_list('id', flat=True).iterator()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('funATIAPP', '0022_notification_coalescing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='unread_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('notifications', models.PositiveIntegerField(default=0)),
+                ('messages', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_unread_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 00:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funATIAPP', '0023_unreadcounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='publication',
+            name='media_renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
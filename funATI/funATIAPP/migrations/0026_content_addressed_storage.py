@@ -0,0 +1,38 @@
+# Generated by Django 5.2.3 on 2026-10-18 00:34
+
+import funATIAPP.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funATIAPP', '0025_uploadsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='media',
+            field=models.FileField(blank=True, null=True, storage=funATIAPP.storage.content_storage, upload_to='chat_media/'),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, storage=funATIAPP.storage.content_storage, upload_to='avatars/'),
+        ),
+        migrations.AlterField(
+            model_name='publication',
+            name='media',
+            field=models.FileField(blank=True, null=True, storage=funATIAPP.storage.content_storage, upload_to='media/'),
+        ),
+    ]
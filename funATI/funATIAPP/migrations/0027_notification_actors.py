@@ -0,0 +1,42 @@
+# Generated by Django 5.2.3 on 2026-10-18 01:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_actors(apps, schema_editor):
+    """De los grupos abiertos solo se conoce el último actor"""
+    Notification = apps.get_model('funATIAPP', 'Notification')
+    NotificationActor = apps.get_model('funATIAPP', 'NotificationActor')
+    open_groups = Notification.objects.filter(is_read=False).exclude(group_key='').values_list('id', 'sender_id')
+    batch = []
+    for notification_id, sender_id in open_groups.iterator(chunk_size=1000):
+        batch.append(NotificationActor(notification_id=notification_id, user_id=sender_id))
+        if len(batch) >= 1000:
+            NotificationActor.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    NotificationActor.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funATIAPP', '0026_content_addressed_storage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationActor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actors', to='funATIAPP.notification')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('notification', 'user'), name='notification_actor_unique')],
+            },
+        ),
+        migrations.RunPython(backfill_actors, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,52 @@
-from django.db import models
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.functions import Greatest
 from django.contrib.auth.models import User
 from django.utils import timezone
+from . import message_ids, settings_cache
+from .storage import content_storage, is_content_addressed, recently_reused
+
+def visible_profiles_q(user, prefix='', profile_ref='pk'):
+    """
+    Condición de privacidad como expresión SQL: el perfil es del propio usuario,
+    es público (o no tiene configuración, que por defecto es pública), o es
+    privado y amigo del usuario.
+
+    Args:
+        user: Usuario que quiere ver las publicaciones (puede ser anónimo)
+        prefix: Prefijo de lookup hasta el Profile (por ejemplo 'profile__')
+        profile_ref: Campo con el id del Profile para la subconsulta de amistad
+    """
+    public = (
+        Q(**{f'{prefix}user__settings__isnull': True}) |
+        Q(**{f'{prefix}user__settings__privacy': 'publico'})
+    )
+    if not user or not user.is_authenticated:
+        return public
+    friendship = Profile.friends.through.objects.filter(
+        from_profile_id=OuterRef(profile_ref),
+        to_profile__user_id=user.id,
+    )
+    return Q(**{f'{prefix}user_id': user.id}) | public | Exists(friendship)
+
+class ProfileQuerySet(models.QuerySet):
+    def publications_visible_to(self, user):
+        """Perfiles cuyas publicaciones puede ver `user`, en una sola consulta"""
+        return self.filter(visible_profiles_q(user))
+
+class PublicationQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """Publicaciones que puede ver `user` según la privacidad de cada autor, en una sola consulta"""
+        return self.filter(visible_profiles_q(user, prefix='profile__', profile_ref='profile_id'))
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
-    avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
+    avatar = models.ImageField(upload_to='avatars/', storage=content_storage, blank=True, null=True)
+    # Versiones reducidas del avatar en WEBP (ver renditions.py)
+    avatar_renditions = models.JSONField(default=dict, blank=True)
     biography = models.TextField(blank=True, null=True)
     birth_date = models.DateField(blank=True, null=True)
     favorite_color = models.CharField(max_length=50, blank=True, null=True)
@@ -16,42 +58,301 @@ class Profile(models.Model):
     friends = models.ManyToManyField('self', symmetrical=True, blank=True)
     following = models.ManyToManyField('self', symmetrical=False, blank=True, related_name='followers')
 
+    objects = ProfileQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.user.username}'s Profile"
 
 class Publication(models.Model):
     profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='publications')
     content = models.TextField()
-    media = models.FileField(upload_to='media/', blank=True, null=True)
+    media = models.FileField(upload_to='media/', storage=content_storage, blank=True, null=True)
+    # Versiones reducidas de la imagen en WEBP (ver renditions.py)
+    media_renditions = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Contador desnormalizado, mantenido por signals (ver rebuild_comment_counters)
+    comments_count = models.PositiveIntegerField(default=0)
+
+    objects = PublicationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['profile', '-created_at', '-id'], name='publication_profile_time_idx'),
+        ]
 
     def __str__(self):
         return f"Publication by {self.profile.user.username} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
 
+class FeedEntry(models.Model):
+    """Entrada materializada del timeline de un perfil (fan-out on write)"""
+    owner = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='feed_entries')
+    publication = models.ForeignKey(Publication, on_delete=models.CASCADE, related_name='feed_entries')
+    author = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='+')
+    # Copia de Publication.created_at para ordenar el timeline sin joins
+    created_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-created_at', '-publication_id']
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'publication'], name='unique_feed_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-publication'], name='feed_owner_timeline_idx'),
+            models.Index(fields=['owner', 'author'], name='feed_owner_author_idx'),
+        ]
+
+    def __str__(self):
+        return f"Feed de {self.owner.user.username}: publicación {self.publication_id}"
+
+class FriendRecommendation(models.Model):
+    """Candidato a amigo precalculado para un perfil (ver recommendations.py)"""
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='friend_recommendations')
+    candidate = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    mutual_friends = models.PositiveIntegerField(default=0)
+    shared_following = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-score', 'candidate_id']
+        constraints = [
+            models.UniqueConstraint(fields=['profile', 'candidate'], name='unique_friend_recommendation'),
+        ]
+        indexes = [
+            models.Index(fields=['profile', '-score'], name='recommendation_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"Recomendación para {self.profile.user.username}: {self.candidate.user.username} ({self.score})"
+
 class Comment(models.Model):
     publication = models.ForeignKey(Publication, on_delete=models.CASCADE, related_name='comments')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name='replies')
-    
+    # Respuestas directas, mantenido por signals (ver rebuild_comment_counters)
+    replies_count = models.PositiveIntegerField(default=0)
+    # Materialized path: ids de los ancestros y del propio comentario, con
+    # ancho fijo, p. ej. "0000000012/0000000034/". Ordenar por path recorre
+    # el árbol en preorden y un subárbol es un rango path__startswith.
+    path = models.CharField(max_length=1000, blank=True, default='')
+    depth = models.PositiveSmallIntegerField(default=0)
+
+    PATH_STEP_WIDTH = 10
+    # Nivel máximo de anidación. Un path ocupa (depth + 1) * (PATH_STEP_WIDTH + 1)
+    # caracteres, así que con 50 niveles sobra espacio en la columna
+    MAX_DEPTH = 50
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['publication', 'path'], name='comment_publication_path_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self.path and self.parent_id:
+            # Las respuestas a un comentario del último nivel cuelgan de su padre
+            if self.parent.depth >= self.MAX_DEPTH:
+                self.parent = self.parent.parent
+            self.depth = self.parent.depth + 1
+        # El path y los contadores se completan en post_save (ver signals.py):
+        # en la misma transacción que el INSERT para que no se desfasen de las filas
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def assign_path(self):
+        """Completa el path de un comentario recién insertado, que necesita su id"""
+        parent_path = self.parent.path if self.parent_id else ''
+        self.path = f"{parent_path}{self.pk:0{self.PATH_STEP_WIDTH}d}/"
+        Comment.objects.filter(pk=self.pk).update(path=self.path)
+
     def __str__(self):
         return f"Comentario de {self.user.username} en {self.publication.id}"
 
+class MessageQuerySet(models.QuerySet):
+    def between(self, user_a, user_b):
+        """Mensajes entre dos usuarios (acepta User o id)"""
+        return self.filter(conversation_key=Message.conversation_key_for(
+            getattr(user_a, 'id', user_a), getattr(user_b, 'id', user_b)
+        ))
+
+    def history_page(self, before=None, after=None, limit=50):
+        """
+        Página del historial por keyset sobre el id, en orden cronológico.
+        Sin cursores devuelve los `limit` mensajes más recientes; con `before`
+        los anteriores a ese id y con `after` los posteriores.
+
+        Returns:
+            tuple (lista de mensajes, True si quedan más en esa dirección)
+        """
+        if after is not None:
+            messages = list(self.filter(id__gt=after).order_by('id')[:limit + 1])
+            has_more = len(messages) > limit
+            return messages[:limit], has_more
+        messages = self
+        if before is not None:
+            messages = messages.filter(id__lt=before)
+        messages = list(messages.order_by('-id')[:limit + 1])
+        has_more = len(messages) > limit
+        return messages[:limit][::-1], has_more
+
 class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_messages')
+    # "<id menor>_<id mayor>", el mismo nombre que la sala del WebSocket
+    conversation_key = models.CharField(max_length=41, editable=False)
     content = models.TextField(blank=True)  # Allow empty content for media-only messages
-    media = models.FileField(upload_to='chat_media/', blank=True, null=True)
+    media = models.FileField(upload_to='chat_media/', storage=content_storage, blank=True, null=True)
     timestamp = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
 
+    objects = MessageQuerySet.as_manager()
+
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['conversation_key', 'id'], name='message_conversation_idx'),
+        ]
 
     def __str__(self):
         return f"Mensaje de {self.sender.username} para {self.receiver.username} - {self.timestamp.strftime('%Y-%m-%d %H:%M')}"
 
+    @staticmethod
+    def conversation_key_for(user_a_id, user_b_id):
+        return f"{min(user_a_id, user_b_id)}_{max(user_a_id, user_b_id)}"
+
+    def save(self, *args, **kwargs):
+        if not self.conversation_key:
+            self.conversation_key = self.conversation_key_for(self.sender_id, self.receiver_id)
+        if self.pk is None and message_ids.enabled():
+            # Mismo origen de ids que el búfer de escritura diferida (ver message_ids.py)
+            self.pk = message_ids.next_id()
+            kwargs['force_insert'] = True
+        # El INSERT y register_message (post_save) van juntos; ver Conversation.mark_read
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+class ConversationQuerySet(models.QuerySet):
+    def for_user(self, user):
+        """Conversaciones en las que participa el usuario"""
+        return self.filter(Q(user_low=user) | Q(user_high=user))
+
+class Conversation(models.Model):
+    """
+    Conversación entre dos usuarios, con el último mensaje y los no leídos de
+    cada participante. Los usuarios se guardan ordenados por id
+    (user_low.id < user_high.id) para que cada par tenga una sola fila.
+    Se mantiene desde los signals de Message (ver signals.py).
+    """
+    user_low = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    user_high = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    last_message = models.ForeignKey(Message, on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    last_activity_at = models.DateTimeField(blank=True, null=True)
+    unread_low = models.PositiveIntegerField(default=0)
+    unread_high = models.PositiveIntegerField(default=0)
+
+    objects = ConversationQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='unique_conversation_pair'),
+        ]
+        indexes = [
+            models.Index(fields=['user_low', '-last_activity_at'], name='conversation_low_activity_idx'),
+            models.Index(fields=['user_high', '-last_activity_at'], name='conversation_high_activity_idx'),
+        ]
+
+    def __str__(self):
+        return f"Conversación {self.user_low_id}-{self.user_high_id}"
+
+    @staticmethod
+    def pair(user_a_id, user_b_id):
+        """Ids de los participantes en el orden en que se guardan"""
+        return min(user_a_id, user_b_id), max(user_a_id, user_b_id)
+
+    @staticmethod
+    def unread_field(user_id, other_user_id):
+        """Nombre del contador de no leídos del usuario en su conversación con `other_user_id`"""
+        return 'unread_low' if user_id < other_user_id else 'unread_high'
+
+    def other_user_id(self, user):
+        return self.user_high_id if user.id == self.user_low_id else self.user_low_id
+
+    def unread_for(self, user):
+        return self.unread_low if user.id == self.user_low_id else self.unread_high
+
+    @classmethod
+    def register_message(cls, message, unread=1):
+        """
+        Actualiza la conversación con un mensaje recién creado. `unread` permite
+        registrar de una vez varios mensajes en la misma dirección, siendo
+        `message` el último de ellos.
+        """
+        low, high = cls.pair(message.sender_id, message.receiver_id)
+        conversation, _ = cls.objects.get_or_create(user_low_id=low, user_high_id=high)
+        unread_field = cls.unread_field(message.receiver_id, message.sender_id)
+        # El puntero solo avanza: un mensaje que llega tarde no reemplaza a uno más reciente
+        is_newer = Q(last_activity_at__isnull=True) | Q(last_activity_at__lte=message.timestamp)
+        cls.objects.filter(pk=conversation.pk).update(
+            last_message_id=models.Case(
+                models.When(is_newer, then=models.Value(message.pk)),
+                default=models.F('last_message_id'),
+                output_field=models.BigIntegerField(),
+            ),
+            last_activity_at=models.Case(
+                models.When(is_newer, then=models.Value(message.timestamp)),
+                default=models.F('last_activity_at'),
+                output_field=models.DateTimeField(),
+            ),
+            **{unread_field: models.F(unread_field) + unread},
+        )
+        UnreadCounter.add(message.receiver_id, messages=unread)
+
+    @classmethod
+    def forget_message(cls, message):
+        """
+        Ajusta la conversación tras borrar un mensaje: descuenta los no leídos
+        y, si era el último, vuelve a apuntar al anterior.
+        """
+        low, high = cls.pair(message.sender_id, message.receiver_id)
+        conversations = cls.objects.filter(user_low_id=low, user_high_id=high)
+        if not message.is_read:
+            unread_field = cls.unread_field(message.receiver_id, message.sender_id)
+            if conversations.filter(**{f'{unread_field}__gt': 0}).update(**{unread_field: models.F(unread_field) - 1}):
+                UnreadCounter.add(message.receiver_id, messages=-1)
+        latest = Message.objects.between(low, high).order_by('-id')
+        # on_delete=SET_NULL ya vació el puntero si el borrado era el último mensaje
+        conversations.filter(last_message__isnull=True).update(
+            last_message_id=models.Subquery(latest.values('id')[:1]),
+            last_activity_at=models.Subquery(latest.values('timestamp')[:1]),
+        )
+
+    @classmethod
+    def mark_read(cls, user, other_user):
+        """
+        Marca como leídos los mensajes de `other_user` para `user` y descuenta
+        de su contador los que se marcaron.
+
+        Returns:
+            número de mensajes que estaban sin leer
+        """
+        low, high = cls.pair(user.id, other_user.id)
+        unread_field = cls.unread_field(user.id, other_user.id)
+        with transaction.atomic():
+            # Con la conversación bloqueada, register_message (que la actualiza
+            # en la misma transacción que inserta el mensaje) espera: cada
+            # mensaje queda o bien marcado y descontado aquí, o bien sin leer y
+            # sumado después
+            conversation = cls.objects.select_for_update().filter(user_low_id=low, user_high_id=high)
+            list(conversation.values_list('pk', flat=True))
+            updated = Message.objects.between(user, other_user).filter(
+                sender=other_user, is_read=False
+            ).update(is_read=True)
+            if updated:
+                conversation.update(**{unread_field: Greatest(models.F(unread_field) - updated, models.Value(0))})
+                UnreadCounter.add(user.id, messages=-updated)
+        return updated
+
 class Notification(models.Model):
     NOTIFICATION_TYPES = [
         ('follow', 'Follow'),
@@ -66,14 +367,244 @@ class Notification(models.Model):
     comment = models.ForeignKey(Comment, on_delete=models.CASCADE, blank=True, null=True)
     message = models.TextField(blank=True, null=True)
     is_read = models.BooleanField(default=False)
+    # Ya no queda pendiente de correo: se encoló sola, dentro de un resumen
+    # (ver digest.py) o el destinatario no recibe correos
+    emailed = models.BooleanField(default=False)
+    # Agrupación de eventos repetidos (ver Notification.record): `sender` es el
+    # último actor y `actor_count` cuántos distintos hubo en el grupo
+    group_key = models.CharField(max_length=64, blank=True, default='')
+    actor_count = models.PositiveIntegerField(default=1)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['emailed', 'recipient', 'created_at'], name='notification_digest_idx'),
+            models.Index(fields=['recipient', '-updated_at'], name='notification_recent_idx'),
+            models.Index(fields=['recipient', 'group_key', '-updated_at'], name='notification_group_idx'),
+        ]
 
     def __str__(self):
         return f"Notificación para {self.recipient.username} de {self.sender.username} - {self.get_notification_type_display()}"
 
+    @property
+    def other_actors(self):
+        return self.actor_count - 1
+
+    @classmethod
+    def record(cls, recipient, sender, notification_type, group_key='', **fields):
+        """
+        Crea una notificación o, si hay una sin leer del mismo grupo
+        (destinatario y `group_key`) actualizada dentro de
+        NOTIFICATION_COALESCE_WINDOW, la actualiza con el nuevo actor.
+        `actor_count` solo suma actores que no estaban ya en el grupo (ver
+        NotificationActor).
+
+        Returns:
+            tuple (notificación, True si se creó)
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            if group_key:
+                since = now - timedelta(seconds=settings.NOTIFICATION_COALESCE_WINDOW)
+                existing = cls.objects.select_for_update().filter(
+                    recipient=recipient, group_key=group_key, is_read=False, updated_at__gte=since,
+                ).order_by('-updated_at').first()
+                if existing is not None:
+                    _, new_actor = NotificationActor.objects.get_or_create(notification=existing, user=sender)
+                    if new_actor:
+                        existing.actor_count = models.F('actor_count') + 1
+                    existing.sender = sender
+                    for name, value in fields.items():
+                        setattr(existing, name, value)
+                    existing.updated_at = now
+                    update_fields = ['sender', 'actor_count', 'updated_at', *fields]
+                    # Los actores nuevos salen en el próximo resumen; quien recibe un
+                    # correo por notificación ya tuvo el del grupo
+                    user_settings = UserSettings.get_user_settings(recipient)
+                    if user_settings.email_notifications and user_settings.email_delivery in UserSettings.DIGEST_DELIVERIES:
+                        existing.emailed = False
+                        update_fields.append('emailed')
+                    existing.save(update_fields=update_fields)
+                    existing.refresh_from_db(fields=['actor_count'])
+                    return existing, False
+            notification = cls.objects.create(
+                recipient=recipient,
+                sender=sender,
+                notification_type=notification_type,
+                group_key=group_key,
+                updated_at=now,
+                **fields,
+            )
+            if group_key:
+                NotificationActor.objects.create(notification=notification, user=sender)
+        return notification, True
+
+    @classmethod
+    def record_many(cls, sender, recipients, notification_type, group_key='', **fields):
+        """
+        Notification.record para un mismo actor y varios destinatarios, con un
+        número fijo de consultas: los grupos abiertos se actualizan con UPDATE
+        y el resto se crea con bulk_create. Ninguno de los dos envía
+        post_save: aquí se suman los no leídos y quien llama publica y envía
+        los correos.
+
+        Returns:
+            tuple (notificaciones creadas, ids de las notificaciones reagrupadas)
+        """
+        recipients = list(recipients)
+        if not recipients:
+            return [], []
+        now = timezone.now()
+        regrouped = {}
+        with transaction.atomic():
+            if group_key:
+                since = now - timedelta(seconds=settings.NOTIFICATION_COALESCE_WINDOW)
+                open_groups = cls.objects.select_for_update().filter(
+                    recipient__in=recipients, group_key=group_key, is_read=False, updated_at__gte=since,
+                ).order_by('recipient_id', '-updated_at').only('id', 'recipient_id')
+                for notification in open_groups:
+                    regrouped.setdefault(notification.recipient_id, notification.id)
+                if regrouped:
+                    known = set(
+                        NotificationActor.objects.filter(
+                            notification_id__in=regrouped.values(), user=sender,
+                        ).values_list('notification_id', flat=True)
+                    )
+                    joined = [notification_id for notification_id in regrouped.values() if notification_id not in known]
+                    NotificationActor.objects.bulk_create([
+                        NotificationActor(notification_id=notification_id, user=sender) for notification_id in joined
+                    ])
+                    cls.objects.filter(id__in=joined).update(actor_count=models.F('actor_count') + 1)
+                    rows = cls.objects.filter(id__in=regrouped.values())
+                    rows.update(sender=sender, updated_at=now, **fields)
+                    rows.filter(
+                        recipient__settings__email_notifications=True,
+                        recipient__settings__email_delivery__in=UserSettings.DIGEST_DELIVERIES,
+                    ).update(emailed=False)
+            created = cls.objects.bulk_create([
+                cls(
+                    recipient=recipient,
+                    sender=sender,
+                    notification_type=notification_type,
+                    group_key=group_key,
+                    updated_at=now,
+                    **fields,
+                )
+                for recipient in recipients
+                if recipient.id not in regrouped
+            ])
+            if group_key:
+                NotificationActor.objects.bulk_create([
+                    NotificationActor(notification=notification, user=sender) for notification in created
+                ])
+            # Los grupos reabiertos ya estaban sin leer: solo cuentan los nuevos
+            UnreadCounter.add_many([notification.recipient_id for notification in created], notifications=1)
+        return created, list(regrouped.values())
+
+    @classmethod
+    def record_group(cls, recipient, senders, notification_type, group_key, **fields):
+        """
+        Notification.record para varios actores y un mismo destinatario (p. ej.
+        varios seguidores nuevos de un perfil a la vez): todos entran en una
+        sola notificación, con un número fijo de consultas. `fields` se
+        aplican como los del último actor. Como record_many, no envía
+        post_save.
+
+        Returns:
+            tuple (notificaciones creadas, ids de las notificaciones reagrupadas)
+        """
+        senders = list({sender.id: sender for sender in senders}.values())
+        if not senders:
+            return [], []
+        now = timezone.now()
+        since = now - timedelta(seconds=settings.NOTIFICATION_COALESCE_WINDOW)
+        with transaction.atomic():
+            existing = cls.objects.select_for_update().filter(
+                recipient=recipient, group_key=group_key, is_read=False, updated_at__gte=since,
+            ).order_by('-updated_at').only('id').first()
+            if existing is not None:
+                known = set(
+                    NotificationActor.objects.filter(
+                        notification=existing, user__in=senders,
+                    ).values_list('user_id', flat=True)
+                )
+                joined = [sender for sender in senders if sender.id not in known]
+                NotificationActor.objects.bulk_create([
+                    NotificationActor(notification=existing, user=sender) for sender in joined
+                ])
+                updates = {'sender': senders[-1], 'updated_at': now, **fields}
+                if joined:
+                    updates['actor_count'] = models.F('actor_count') + len(joined)
+                user_settings = UserSettings.get_user_settings(recipient)
+                if user_settings.email_notifications and user_settings.email_delivery in UserSettings.DIGEST_DELIVERIES:
+                    updates['emailed'] = False
+                cls.objects.filter(pk=existing.pk).update(**updates)
+                return [], [existing.id]
+            created = cls.objects.bulk_create([
+                cls(
+                    recipient=recipient,
+                    sender=senders[-1],
+                    notification_type=notification_type,
+                    group_key=group_key,
+                    actor_count=len(senders),
+                    updated_at=now,
+                    **fields,
+                )
+            ])
+            NotificationActor.objects.bulk_create([
+                NotificationActor(notification=created[0], user=sender) for sender in senders
+            ])
+            UnreadCounter.add_many([recipient.id], notifications=1)
+        return created, []
+
+
+class NotificationActor(models.Model):
+    """Actor distinto de una notificación agrupada, para no contarlo dos veces en actor_count"""
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='actors')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['notification', 'user'], name='notification_actor_unique'),
+        ]
+
+class EmailOutbox(models.Model):
+    """
+    Correo pendiente de envío. Las vistas y signals solo insertan filas; el
+    comando send_queued_emails las envía por lotes (ver outbox.py).
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pendiente'),
+        (SENDING, 'Enviando'),
+        (SENT, 'Enviado'),
+        (FAILED, 'Fallido'),
+    ]
+
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Próximo intento; mientras se envía es el vencimiento de la reserva del worker
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"Correo para {self.to_email} ({self.get_status_display()})"
+
 class UserSettings(models.Model):
     COLOR_CHOICES = [
         ('rosado', 'Rosado'),
@@ -98,12 +629,21 @@ class UserSettings(models.Model):
         ('automatico', 'Automático'),
     ]
     
+    EMAIL_DELIVERY_CHOICES = [
+        ('inmediato', 'Un correo por notificación'),
+        ('cada_hora', 'Resumen cada hora'),
+        ('diario', 'Resumen diario'),
+    ]
+    # Entregas por resumen (ver digest.py)
+    DIGEST_DELIVERIES = ('cada_hora', 'diario')
+    
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='settings')
     privacy = models.CharField(max_length=20, choices=PRIVACY_CHOICES, default='publico')
     language = models.CharField(max_length=10, choices=LANGUAGE_CHOICES, default='es')
     color_theme = models.CharField(max_length=20, choices=COLOR_CHOICES, default='rosado')
     theme_mode = models.CharField(max_length=20, choices=THEME_CHOICES, default='claro')
     email_notifications = models.BooleanField(default=True)
+    email_delivery = models.CharField(max_length=20, choices=EMAIL_DELIVERY_CHOICES, default='inmediato')
     created_at = models.DateTimeField(default=timezone.now)
     
     def __str__(self):
@@ -111,6 +651,144 @@ class UserSettings(models.Model):
     
     @classmethod
     def get_user_settings(cls, user):
-        """Obtiene o crea las configuraciones del usuario"""
-        settings, created = cls.objects.get_or_create(user=user)
-        return settings
+        """
+        Obtiene las configuraciones del usuario desde la caché (ver settings_cache).
+        Solo crea la fila si falta, por ejemplo en usuarios anteriores a la
+        creación al registrarse. Para editarlas, usar la base de datos directamente.
+        """
+        return settings_cache.get(user.id, lambda: cls.objects.get_or_create(user=user)[0])
+
+
+class UnreadCounter(models.Model):
+    """
+    Notificaciones y mensajes sin leer de cada usuario, desnormalizados para
+    que el menú no haga COUNT en cada página. Se actualizan al crear y leer
+    notificaciones (signals.py, Notification.record_many) y mensajes
+    (Conversation.register_message, forget_message y mark_read). Si falta la
+    fila, se recalcula desde las tablas de origen.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='unread_counter')
+    notifications = models.PositiveIntegerField(default=0)
+    messages = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"No leídos de {self.user_id}: {self.notifications} notificaciones, {self.messages} mensajes"
+
+    @classmethod
+    def recount(cls, user_id):
+        """Recalcula los contadores de un usuario desde Notification y Conversation"""
+        low = Conversation.objects.filter(user_low_id=user_id).aggregate(total=models.Sum('unread_low'))['total']
+        high = Conversation.objects.filter(user_high_id=user_id).aggregate(total=models.Sum('unread_high'))['total']
+        counter, _ = cls.objects.update_or_create(user_id=user_id, defaults={
+            'notifications': Notification.objects.filter(recipient_id=user_id, is_read=False).count(),
+            'messages': (low or 0) + (high or 0),
+        })
+        return counter
+
+    @classmethod
+    def for_user(cls, user_id):
+        counter = cls.objects.filter(user_id=user_id).first()
+        return counter if counter is not None else cls.recount(user_id)
+
+    @classmethod
+    def add_many(cls, user_ids, **deltas):
+        """
+        Suma `deltas` (notifications=1, messages=-1, ...) a los contadores de
+        varios usuarios con un solo UPDATE. Los que no tienen fila se
+        recalculan, ya con el cambio guardado.
+        """
+        user_ids = set(user_ids)
+        updates = {
+            field: Greatest(models.F(field) + delta, models.Value(0))
+            for field, delta in deltas.items() if delta
+        }
+        if not user_ids or not updates:
+            return
+        counters = cls.objects.filter(user_id__in=user_ids)
+        if counters.update(**updates) < len(user_ids):
+            for user_id in user_ids - set(counters.values_list('user_id', flat=True)):
+                cls.recount(user_id)
+
+    @classmethod
+    def add(cls, user_id, **deltas):
+        cls.add_many([user_id], **deltas)
+
+
+class UploadSession(models.Model):
+    """
+    Subida por partes en curso (ver uploads.py). Su id es el handle que se
+    envía al crear el mensaje o la publicación.
+    """
+    UPLOADING = 'uploading'
+    COMPLETE = 'complete'
+    ATTACHED = 'attached'
+    STATUS_CHOICES = [
+        (UPLOADING, 'Subiendo'),
+        (COMPLETE, 'Completa'),
+        (ATTACHED, 'Adjuntada'),
+    ]
+    PURPOSE_CHOICES = [
+        ('message', 'Mensaje'),
+        ('publication', 'Publicación'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    purpose = models.CharField(max_length=20, choices=PURPOSE_CHOICES)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=UPLOADING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'], name='upload_session_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"Subida {self.id} de {self.user_id}: {self.offset}/{self.size}"
+
+
+class StoredFile(models.Model):
+    """
+    Archivo guardado por contenido (ver storage.py) y cuántas filas lo usan.
+    Se mantiene desde los signals de Profile.avatar, Publication.media y
+    Message.media; al dejar de usarse se borra del almacenamiento.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} usos)"
+
+    @classmethod
+    def acquire(cls, name):
+        """Registra un uso más de `name`"""
+        if not is_content_addressed(name):
+            return
+        if not cls.objects.filter(name=name).update(ref_count=models.F('ref_count') + 1):
+            stored, created = cls.objects.get_or_create(name=name, defaults={'ref_count': 1})
+            if not created:
+                cls.objects.filter(pk=stored.pk).update(ref_count=models.F('ref_count') + 1)
+
+    @classmethod
+    def release(cls, name):
+        """Descuenta un uso de `name` y, si era el último, borra el archivo al confirmar"""
+        if not is_content_addressed(name):
+            return
+        cls.objects.filter(name=name, ref_count__gt=0).update(ref_count=models.F('ref_count') - 1)
+        deleted, _ = cls.objects.filter(name=name, ref_count=0).delete()
+        if deleted:
+            transaction.on_commit(lambda: cls._delete_unused(name))
+
+    @classmethod
+    def _delete_unused(cls, name):
+        # Una subida idéntica pudo volver a registrarlo entre tanto, o haberlo
+        # reutilizado sin confirmar aún su acquire: en ese caso el archivo se
+        # deja y, si al final nadie lo usa, lo recoge collect_orphan_media
+        if cls.objects.filter(name=name).exists() or recently_reused(name):
+            return
+        content_storage().delete(name)
@@ -0,0 +1,124 @@
+"""
+Limpieza de archivos huérfanos en MEDIA_ROOT.
+
+Los archivos subidos antes del almacenamiento por contenido (avatars/,
+media/, chat_media/), las versiones WEBP de archivos que ya no se usan y los
+restos de subidas interrumpidas quedan en el disco aunque ninguna fila los
+use. El comando collect_orphan_media recorre el árbol con os.scandir sin
+listar directorios enteros en memoria y comprueba los nombres por lotes
+contra la base de datos (una consulta por campo y lote, nunca la tabla
+completa). Los huérfanos se borran o se mueven a un directorio de cuarentena.
+
+No se tocan los archivos modificados hace menos de `min_age` (una subida en
+curso ya está en el disco antes de que su fila se confirme) ni el directorio
+de trabajo de ContentAddressedStorage.
+"""
+import logging
+import os
+import shutil
+import time
+from itertools import islice
+from django.core.files.storage import default_storage
+from .models import Profile, Publication, Message, StoredFile
+from .renditions import FIELDS as RENDITION_FIELDS, SIZES as RENDITION_SIZES, UPLOAD_DIR as RENDITION_DIR
+from .storage import TEMP_DIR as CONTENT_TEMP_DIR
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+# Campos que guardan el nombre del archivo
+FILE_FIELDS = [(Profile, 'avatar'), (Publication, 'media'), (Message, 'media')]
+SKIP_DIRS = {CONTENT_TEMP_DIR}
+
+
+def iter_files(root, skip=()):
+    """
+    Recorre `root` y devuelve, uno a uno, (nombre relativo, mtime) de cada
+    archivo. Los nombres usan '/' como en los FileField.
+    """
+    skip = {os.path.normpath(os.path.join(root, path)) for path in skip}
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        try:
+            entries = os.scandir(directory)
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if os.path.normpath(entry.path) not in skip:
+                        pending.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    name = os.path.relpath(entry.path, root).replace(os.sep, '/')
+                    yield name, entry.stat(follow_symlinks=False).st_mtime
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def referenced(names):
+    """Subconjunto de `names` que alguna fila usa"""
+    names = set(names)
+    found = set(StoredFile.objects.filter(name__in=names).values_list('name', flat=True))
+    for model, field_name in FILE_FIELDS:
+        found.update(
+            model.objects.filter(**{f'{field_name}__in': names - found}).values_list(field_name, flat=True)
+        )
+    rendition_names = {name for name in names - found if name.startswith(f'{RENDITION_DIR}/')}
+    for field_name, (model, json_field) in RENDITION_FIELDS.items():
+        for size in RENDITION_SIZES[field_name]:
+            if not rendition_names:
+                return found
+            lookup = f'{json_field}__{size}__name'
+            used = set(model.objects.filter(**{f'{lookup}__in': rendition_names}).values_list(lookup, flat=True))
+            found |= used
+            rendition_names -= used
+    return found
+
+
+def find_orphans(min_age, batch_size=BATCH_SIZE, skip=()):
+    """
+    Devuelve, por lotes, los nombres de MEDIA_ROOT que ninguna fila usa y que
+    no se modificaron en los últimos `min_age` segundos.
+    """
+    cutoff = time.time() - min_age
+    candidates = (
+        name for name, mtime in iter_files(default_storage.location, SKIP_DIRS | set(skip))
+        if mtime < cutoff
+    )
+    for batch in _batches(candidates, batch_size):
+        orphans = sorted(set(batch) - referenced(batch))
+        if orphans:
+            yield orphans
+
+
+def remove(names, quarantine=None):
+    """
+    Borra los archivos `names` o, con `quarantine`, los mueve ahí conservando
+    su ruta relativa.
+
+    Returns:
+        bytes liberados en MEDIA_ROOT
+    """
+    freed = 0
+    for name in names:
+        path = default_storage.path(name)
+        try:
+            size = os.path.getsize(path)
+            if quarantine:
+                target = os.path.join(quarantine, name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.move(path, target)
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            logger.error(f"Could not remove orphan {name}: {e}")
+            continue
+        freed += size
+    return freed
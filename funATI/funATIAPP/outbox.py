@@ -0,0 +1,120 @@
+"""
+Cola de correos salientes respaldada por la base de datos.
+
+send_notification_emails (utils.py) solo inserta filas en EmailOutbox, así
+que las peticiones no esperan al servidor SMTP. El comando send_queued_emails
+llama a deliver_batch, que reserva un lote de correos vencidos, los envía
+por una sola conexión SMTP y registra el resultado. Los fallos se reintentan
+con espera exponencial hasta MAX_ATTEMPTS.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import EmailOutbox
+
+DEFAULTS = {
+    'BATCH_SIZE': 50,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_BASE_SECONDS': 60,
+    'RETRY_MAX_SECONDS': 3600,
+    'LEASE_SECONDS': 300,
+}
+
+
+def _config(name):
+    return getattr(settings, 'EMAIL_OUTBOX', {}).get(name, DEFAULTS[name])
+
+
+def enqueue(to_email, subject, body):
+    """Agrega un correo a la cola"""
+    return EmailOutbox.objects.create(to_email=to_email, subject=subject, body=body)
+
+
+def enqueue_many(emails):
+    """Agrega a la cola varias tuplas (destinatario, asunto, cuerpo) con un solo INSERT"""
+    return EmailOutbox.objects.bulk_create([
+        EmailOutbox(to_email=to_email, subject=subject, body=body)
+        for to_email, subject, body in emails
+    ])
+
+
+def retry_delay(attempts):
+    """Espera antes del siguiente intento: RETRY_BASE_SECONDS * 2^(intentos - 1), acotada"""
+    seconds = _config('RETRY_BASE_SECONDS') * 2 ** max(attempts - 1, 0)
+    return timedelta(seconds=min(seconds, _config('RETRY_MAX_SECONDS')))
+
+
+def claim_batch(batch_size):
+    """
+    Reserva los correos vencidos: pendientes, o en envío con la reserva
+    vencida (un worker que murió a mitad de lote).
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(Q(status=EmailOutbox.PENDING) | Q(status=EmailOutbox.SENDING), next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        EmailOutbox.objects.filter(id__in=[email.id for email in batch]).update(
+            status=EmailOutbox.SENDING,
+            next_attempt_at=now + timedelta(seconds=_config('LEASE_SECONDS')),
+        )
+    return batch
+
+
+def deliver_batch(batch_size=None):
+    """
+    Envía un lote de correos por una sola conexión.
+
+    Returns:
+        tuple (enviados, fallidos en este intento)
+    """
+    batch = claim_batch(batch_size or _config('BATCH_SIZE'))
+    if not batch:
+        return 0, 0
+
+    sent = failed = 0
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        # Sin conexión no se intenta ninguno; todo el lote se reintenta más tarde
+        connection = None
+        connection_error = e
+    now = timezone.now()
+    for email in batch:
+        try:
+            if connection is None:
+                raise connection_error
+            EmailMessage(
+                subject=email.subject,
+                body=email.body,
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to=[email.to_email],
+                connection=connection,
+            ).send()
+        except Exception as e:
+            failed += 1
+            email.attempts += 1
+            email.last_error = str(e)
+            if email.attempts >= _config('MAX_ATTEMPTS'):
+                email.status = EmailOutbox.FAILED
+            else:
+                email.status = EmailOutbox.PENDING
+                email.next_attempt_at = now + retry_delay(email.attempts)
+        else:
+            sent += 1
+            email.attempts += 1
+            email.status = EmailOutbox.SENT
+            email.sent_at = timezone.now()
+    if connection is not None:
+        connection.close()
+
+    EmailOutbox.objects.bulk_update(
+        batch, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+    )
+    return sent, failed
@@ -0,0 +1,80 @@
+"""
+Paginación por keyset (cursor) sobre (created_at, id).
+
+En lugar de OFFSET, cada página continúa después de la última fila de la
+anterior, así que el costo de una página no depende de cuánta historia haya.
+El cursor es opaco para el cliente: base64 de "<fecha ISO>|<id>".
+"""
+import base64
+import binascii
+from datetime import datetime
+from django.db.models import Q
+
+
+def encode_cursor(created_at, pk):
+    """Codifica la posición (created_at, pk) como un cursor opaco"""
+    raw = f"{created_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decodifica un cursor generado por encode_cursor.
+
+    Returns:
+        tuple (datetime, int) o None si el cursor está vacío
+
+    Raises:
+        ValueError si el cursor no es válido
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        created_at, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f'Cursor inválido: {cursor}') from e
+
+
+def keyset_page(queryset, cursor, page_size, date_field='created_at', id_field='id', descending=True):
+    """
+    Devuelve una página de `queryset` ordenada por (date_field, id_field).
+
+    Args:
+        queryset: QuerySet a paginar
+        cursor: Cursor devuelto por la página anterior (o None para la primera)
+        page_size: Número máximo de filas por página
+        date_field: Campo de fecha del keyset
+        id_field: Campo entero que desempata filas con la misma fecha
+        descending: True para ir de lo más reciente a lo más antiguo
+
+    Returns:
+        tuple (lista de objetos, cursor de la siguiente página o None)
+
+    Raises:
+        ValueError si el cursor no es válido
+    """
+    position = decode_cursor(cursor)
+    if descending:
+        queryset = queryset.order_by(f'-{date_field}', f'-{id_field}')
+        op = 'lt'
+    else:
+        queryset = queryset.order_by(date_field, id_field)
+        op = 'gt'
+
+    if position:
+        created_at, pk = position
+        queryset = queryset.filter(
+            Q(**{f'{date_field}__{op}': created_at}) |
+            Q(**{date_field: created_at, f'{id_field}__{op}': pk})
+        )
+
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, date_field), getattr(last, id_field))
+    return items, next_cursor
@@ -0,0 +1,136 @@
+"""
+Envío de eventos a los grupos del channel layer desde código síncrono
+(vistas, signals, comandos).
+
+Cada conexión WebSocket se une, además de a su sala, al grupo personal de su
+usuario (user_<id>). Ahí se publican los resúmenes de conversación (último
+mensaje y no leídos), los cambios de lectura y las notificaciones nuevas,
+para que todas las pestañas y dispositivos del usuario se actualicen sin
+consultar la bandeja ni recargar la página de notificaciones.
+
+Los fallos del channel layer (por ejemplo, Redis caído) se registran y no
+interrumpen la petición: los eventos en tiempo real son un complemento de lo
+que ya quedó guardado en la base de datos.
+"""
+import logging
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.template.loader import render_to_string
+from .models import Conversation, Message, Notification, UnreadCounter
+
+logger = logging.getLogger(__name__)
+
+
+def chat_group(user_a_id, user_b_id):
+    """Grupo de la sala de chat entre dos usuarios"""
+    return f"chat_{Message.conversation_key_for(user_a_id, user_b_id)}"
+
+
+def user_group(user_id):
+    """Grupo personal de un usuario"""
+    return f"user_{user_id}"
+
+
+def send_to_group(group, event):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(group, event)
+    except Exception as e:
+        logger.error(f"Error sending {event.get('type')} to {group}: {e}")
+
+
+def revoke_chat_membership(user_id, former_friend_user_ids):
+    """Cierra las salas de chat abiertas entre `user_id` y quienes dejaron de ser sus amigos"""
+    for friend_user_id in former_friend_user_ids:
+        send_to_group(chat_group(user_id, friend_user_id), {"type": "membership.revoked"})
+
+
+def conversation_summary(conversation, user_id):
+    """Resumen de una conversación tal como la ve `user_id`"""
+    last = conversation.last_message
+    is_low = user_id == conversation.user_low_id
+    return {
+        'peer_user_id': conversation.user_high_id if is_low else conversation.user_low_id,
+        'unread_count': conversation.unread_low if is_low else conversation.unread_high,
+        'last_activity_at': conversation.last_activity_at.isoformat() if conversation.last_activity_at else None,
+        'last_message': {
+            'id': str(last.id),
+            'content': last.content[:50] + '...' if len(last.content) > 50 else last.content,
+            'sender_id': last.sender_id,
+            'timestamp': last.timestamp.isoformat(),
+        } if last else None,
+    }
+
+
+def publish_conversation(user_a_id, user_b_id):
+    """Envía a ambos participantes el resumen actualizado de su conversación"""
+    low, high = Conversation.pair(user_a_id, user_b_id)
+    conversation = Conversation.objects.select_related('last_message').filter(
+        user_low_id=low, user_high_id=high
+    ).first()
+    if conversation is None:
+        return
+    for user_id in (low, high):
+        send_to_group(user_group(user_id), {
+            "type": "inbox.update",
+            "conversation": conversation_summary(conversation, user_id),
+            "unread_messages": UnreadCounter.for_user(user_id).messages,
+        })
+
+
+def publish_conversation_on_commit(user_a_id, user_b_id):
+    transaction.on_commit(lambda: publish_conversation(user_a_id, user_b_id))
+
+
+def publish_read(reader_id, peer_id):
+    """`reader_id` leyó los mensajes de `peer_id`: se avisa al remitente y a los otros dispositivos del lector"""
+    send_to_group(user_group(peer_id), {"type": "messages.read", "reader_id": reader_id})
+    publish_conversation(reader_id, peer_id)
+
+
+def unread_notifications(user_id):
+    return UnreadCounter.for_user(user_id).notifications
+
+
+def publish_notification(notification_id):
+    """Envía una notificación nueva o reagrupada, ya renderizada, a las sesiones de su destinatario"""
+    notification = Notification.objects.select_related(
+        'sender__profile', 'publication', 'comment'
+    ).filter(pk=notification_id).first()
+    if notification is None:
+        return
+    send_to_group(user_group(notification.recipient_id), {
+        "type": "notification.created",
+        "notification": {
+            'id': notification.id,
+            'notification_type': notification.notification_type,
+            'html': render_to_string('notification-item.html', {'notification': notification}),
+        },
+        "unread_count": unread_notifications(notification.recipient_id),
+    })
+
+
+def publish_notification_on_commit(notification_id):
+    transaction.on_commit(lambda: publish_notification(notification_id))
+
+
+def publish_notifications_on_commit(notification_ids):
+    """Para las notificaciones creadas o reagrupadas en bloque, que no envían post_save"""
+    notification_ids = list(notification_ids)
+
+    def publish():
+        for notification_id in notification_ids:
+            publish_notification(notification_id)
+
+    if notification_ids:
+        transaction.on_commit(publish)
+
+
+def publish_notifications_read(user_id):
+    """Las notificaciones del usuario se marcaron como leídas"""
+    # Las que llegaron mientras tanto siguen sin leer
+    send_to_group(user_group(user_id), {"type": "notification.unread", "unread_count": unread_notifications(user_id)})
+
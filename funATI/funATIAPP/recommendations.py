@@ -0,0 +1,153 @@
+"""
+Motor de recomendaciones de amigos.
+
+Los candidatos de cada perfil se puntúan por amigos en común (amigos de
+amigos) y por perfiles seguidos en común, y se guardan en
+FriendRecommendation. El comando compute_friend_recommendations los
+precalcula por lotes; los signals de amistad recalculan solo los perfiles
+afectados y sus amigos. friends_view lee la lista ya ordenada y, si no hay suficientes
+candidatos (usuarios nuevos), completa con perfiles al azar.
+"""
+import random
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from .models import FriendRecommendation, Profile
+from . import social_graph
+
+RECOMMENDATIONS_PER_PROFILE = 30
+# Tope de filas que devuelve cada agregación, para acotar perfiles muy conectados
+CANDIDATES_PER_SIGNAL = 200
+MUTUAL_FRIEND_WEIGHT = 2.0
+SHARED_FOLLOWING_WEIGHT = 1.0
+
+
+def _profile_id(profile):
+    return profile.id if isinstance(profile, Profile) else int(profile)
+
+
+def score_candidates(profile):
+    """
+    Calcula los candidatos de un perfil con dos consultas agregadas.
+
+    Returns:
+        lista de tuplas (candidate_id, score, mutual_friends, shared_following),
+        de mayor a menor puntuación
+    """
+    profile_id = _profile_id(profile)
+    friends = Profile.friends.through.objects
+    following = Profile.following.through.objects
+
+    my_friends = friends.filter(from_profile_id=profile_id).values('to_profile_id')
+    mutual = (
+        friends.filter(from_profile_id__in=my_friends)
+        .exclude(to_profile_id=profile_id)
+        .values('to_profile_id')
+        .annotate(total=Count('id'))
+        .order_by('-total')[:CANDIDATES_PER_SIGNAL]
+    )
+
+    my_following = following.filter(from_profile_id=profile_id).values('to_profile_id')
+    shared = (
+        following.filter(to_profile_id__in=my_following)
+        .exclude(from_profile_id=profile_id)
+        .values('from_profile_id')
+        .annotate(total=Count('id'))
+        .order_by('-total')[:CANDIDATES_PER_SIGNAL]
+    )
+
+    exclude = social_graph.friend_ids(profile_id) | {profile_id}
+    candidates = {}
+    for row in mutual:
+        if row['to_profile_id'] not in exclude:
+            candidates.setdefault(row['to_profile_id'], [0, 0])[0] = row['total']
+    for row in shared:
+        if row['from_profile_id'] not in exclude:
+            candidates.setdefault(row['from_profile_id'], [0, 0])[1] = row['total']
+
+    scored = [
+        (candidate_id, mutual_count * MUTUAL_FRIEND_WEIGHT + shared_count * SHARED_FOLLOWING_WEIGHT, mutual_count, shared_count)
+        for candidate_id, (mutual_count, shared_count) in candidates.items()
+    ]
+    scored.sort(key=lambda row: (-row[1], row[0]))
+    return scored[:RECOMMENDATIONS_PER_PROFILE]
+
+
+def compute_for(profile):
+    """Recalcula y guarda las recomendaciones de un perfil"""
+    profile_id = _profile_id(profile)
+    scored = score_candidates(profile_id)
+    with transaction.atomic():
+        FriendRecommendation.objects.filter(profile_id=profile_id).delete()
+        FriendRecommendation.objects.bulk_create([
+            FriendRecommendation(
+                profile_id=profile_id,
+                candidate_id=candidate_id,
+                score=score,
+                mutual_friends=mutual_count,
+                shared_following=shared_count,
+            )
+            for candidate_id, score, mutual_count, shared_count in scored
+        ])
+    return len(scored)
+
+
+def with_neighbours(profile_ids):
+    """
+    Los perfiles indicados y sus amigos: un cambio de amistad entre A y B
+    altera los amigos en común que ven los amigos de A (respecto de B) y los
+    de B (respecto de A).
+    """
+    profile_ids = set(profile_ids)
+    profile_ids.update(
+        Profile.friends.through.objects.filter(from_profile_id__in=profile_ids)
+        .values_list('to_profile_id', flat=True)
+    )
+    return profile_ids
+
+
+def refresh_on_commit(profile_ids):
+    """
+    Recalcula los perfiles indicados y sus amigos cuando se confirme la
+    transacción actual (los amigos se leen ya con el cambio confirmado).
+    """
+    profile_ids = set(profile_ids)
+
+    def refresh():
+        for profile_id in with_neighbours(profile_ids):
+            compute_for(profile_id)
+
+    transaction.on_commit(refresh)
+
+
+def random_profiles(exclude_ids, limit):
+    """
+    Perfiles al azar sin ORDER BY RANDOM(): se elige un id al azar y se
+    leen los siguientes por el índice de la clave primaria.
+    """
+    bounds = Profile.objects.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None or limit <= 0:
+        return []
+    start = random.randint(bounds['low'], bounds['high'])
+    profiles = Profile.objects.select_related('user').exclude(id__in=exclude_ids).order_by('id')
+    picked = list(profiles.filter(id__gte=start)[:limit])
+    if len(picked) < limit:
+        picked += list(profiles.filter(id__lt=start)[:limit - len(picked)])
+    return picked
+
+
+def recommended_profiles(profile, limit):
+    """
+    Lista corta de perfiles recomendados, primero los precalculados y luego,
+    si faltan, perfiles al azar.
+    """
+    friend_ids = social_graph.friend_ids(profile)
+    recommendations = (
+        FriendRecommendation.objects.filter(profile=profile)
+        .exclude(candidate_id__in=friend_ids)
+        .select_related('candidate__user')[:limit]
+    )
+    picked = [recommendation.candidate for recommendation in recommendations]
+    if len(picked) < limit:
+        exclude_ids = friend_ids | {profile.id} | {candidate.id for candidate in picked}
+        picked += random_profiles(exclude_ids, limit - len(picked))
+    return picked
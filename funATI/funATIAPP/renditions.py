@@ -0,0 +1,187 @@
+"""
+Versiones reducidas (renditions) de los avatares y de las imágenes de las
+publicaciones.
+
+Al subir un archivo no se procesa nada en la petición: el signal pre_save
+de Profile / Publication vacía el JSON de renditions si el archivo cambió, y
+el comando process_renditions (un worker en segundo plano, ver start.sh)
+genera para los pendientes las versiones thumb, card y full en WEBP, sin
+metadatos EXIF y sin agrandar imágenes pequeñas. El resultado se guarda en
+Profile.avatar_renditions / Publication.media_renditions:
+
+    {"source": "content/ab/cd/abcd….jpg",
+     "thumb": {"name": "renditions/content/ab/cd/abcd…_thumb.webp", "width": 96, "height": 96}, ...}
+
+`source` indica de qué archivo salieron; si no coincide con el actual, las
+versiones se ignoran. Los archivos que no son imágenes (videos) o no se
+pueden leer solo guardan `source` y se sirven tal cual. Los templates usan
+{% rendition %} (templatetags/renditions.py), que cae al original mientras
+la versión no exista.
+
+Las versiones se guardan en el storage por defecto, fuera del espacio por
+contenido (storage.py) y de su conteo de referencias: dos filas con el mismo
+archivo comparten las versiones ya generadas.
+"""
+import logging
+import os
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+from .models import Profile, Publication
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'QUALITY': 80,
+    'BATCH_SIZE': 20,
+}
+
+# Lado mayor, en píxeles, de cada versión
+SIZES = {
+    'avatar': {'thumb': 96, 'card': 320, 'full': 800},
+    'media': {'thumb': 320, 'card': 960, 'full': 1920},
+}
+# Campo de archivo -> (modelo, campo JSON)
+FIELDS = {
+    'avatar': (Profile, 'avatar_renditions'),
+    'media': (Publication, 'media_renditions'),
+}
+UPLOAD_DIR = 'renditions'
+
+
+def _config(name):
+    return getattr(settings, 'IMAGE_RENDITIONS', {}).get(name, DEFAULTS[name])
+
+
+def current(obj, field_name):
+    """Renditions vigentes del archivo actual, o {} si faltan o son de otro archivo"""
+    field_file = getattr(obj, field_name)
+    data = getattr(obj, FIELDS[field_name][1]) or {}
+    if not field_file or data.get('source') != field_file.name:
+        return {}
+    return data
+
+
+def get(obj, field_name, size):
+    """Datos (name, width, height) de una versión, o None si no existe"""
+    return current(obj, field_name).get(size)
+
+
+def url(obj, field_name, size):
+    """URL de la versión pedida o, si todavía no existe, la del original"""
+    field_file = getattr(obj, field_name)
+    if not field_file:
+        return None
+    rendition = get(obj, field_name, size)
+    if rendition:
+        return default_storage.url(rendition['name'])
+    return field_file.url
+
+
+def reset_if_changed(obj, field_name):
+    """Para pre_save: si el archivo cambió, las versiones anteriores dejan de valer"""
+    json_field = FIELDS[field_name][1]
+    field_file = getattr(obj, field_name)
+    data = getattr(obj, json_field) or {}
+    if data and (not field_file or data.get('source') != field_file.name):
+        setattr(obj, json_field, {})
+
+
+def _encode(image, quality):
+    buffer = BytesIO()
+    image.save(buffer, format='WEBP', quality=quality, method=6)
+    return buffer.getvalue()
+
+
+def build(field_file, sizes):
+    """
+    Genera y guarda las versiones de un archivo.
+
+    Returns:
+        dict con una entrada por versión; vacío si el archivo no es una imagen
+        fija (videos, GIF animados) o no se puede leer
+    """
+    try:
+        with field_file.open('rb') as source, Image.open(source) as image:
+            if getattr(image, 'is_animated', False):
+                return {}
+            # Aplicar la orientación EXIF antes de descartar los metadatos
+            image = ImageOps.exif_transpose(image)
+            has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+    except Exception as e:
+        logger.info(f"No renditions for {field_file.name}: {e}")
+        return {}
+
+    stem = os.path.splitext(field_file.name)[0]
+    renditions = {}
+    # De mayor a menor, reduciendo cada vez la versión anterior
+    for size_name, max_side in sorted(sizes.items(), key=lambda item: -item[1]):
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        name = default_storage.save(
+            f'{UPLOAD_DIR}/{stem}_{size_name}.webp',
+            ContentFile(_encode(image, _config('QUALITY'))),
+        )
+        renditions[size_name] = {'name': name, 'width': image.width, 'height': image.height}
+    return renditions
+
+
+def process(obj, field_name):
+    """
+    Genera las versiones de un objeto y las guarda sin pasar por save(),
+    solo si el archivo no cambió mientras tanto.
+
+    Returns:
+        True si se generó al menos una versión
+    """
+    model, json_field = FIELDS[field_name]
+    field_file = getattr(obj, field_name)
+    # Con el almacenamiento por contenido, un archivo repetido tiene el mismo
+    # nombre: se reutilizan las versiones que ya tenga otra fila
+    data = (
+        model.objects.filter(**{field_name: field_file.name, f'{json_field}__source': field_file.name})
+        .exclude(pk=obj.pk)
+        .values_list(json_field, flat=True)
+        .first()
+    )
+    if data is None:
+        data = {'source': field_file.name, **build(field_file, SIZES[field_name])}
+    model.objects.filter(pk=obj.pk, **{field_name: field_file.name}).update(**{json_field: data})
+    setattr(obj, json_field, data)
+    return len(data) > 1
+
+
+def pending(field_name):
+    """Objetos con archivo y sin versiones procesadas"""
+    model, json_field = FIELDS[field_name]
+    return (
+        model.objects.exclude(**{f'{field_name}__isnull': True})
+        .exclude(**{field_name: ''})
+        .filter(**{json_field: {}})
+        .order_by('pk')
+    )
+
+
+def process_pending(batch_size=None):
+    """
+    Procesa un lote de avatares y otro de imágenes de publicaciones pendientes.
+
+    Returns:
+        número de objetos procesados
+    """
+    batch_size = batch_size or _config('BATCH_SIZE')
+    processed = 0
+    for field_name in FIELDS:
+        for obj in pending(field_name)[:batch_size]:
+            try:
+                process(obj, field_name)
+            except Exception as e:
+                # Se marca igual para no reintentar sin fin un archivo roto
+                logger.error(f"Error building renditions for {field_name} {obj.pk}: {e}")
+                FIELDS[field_name][0].objects.filter(pk=obj.pk).update(
+                    **{FIELDS[field_name][1]: {'source': getattr(obj, field_name).name}}
+                )
+            processed += 1
+    return processed
@@ -0,0 +1,176 @@
+"""
+Caché de UserSettings por usuario.
+
+Dos niveles: un LRU local al proceso (muy pequeño TTL, para absorber las
+varias lecturas de una misma petición) delante del backend de caché
+compartido de Django. Las entradas se invalidan desde los signals de
+post_save / post_delete de UserSettings. Los contadores de aciertos y
+fallos se consultan con get_stats().
+
+La clave compartida lleva una versión por usuario que invalidate() cambia:
+si una lectura carga la fila de la base de datos y un invalidate() llega
+antes de su cache.set, el valor viejo queda bajo la versión anterior, que
+ya nadie lee. invalidate() vuelve a cambiar la versión al confirmarse la
+transacción, para descartar también lo leído antes del commit.
+
+Sin una caché compartida (LocMemCache, el valor por defecto sin
+CACHE_REDIS_URL) las invalidaciones solo llegan al proceso que guarda la
+fila: en ese caso las entradas duran LOCAL_TTL en lugar de SHARED_TTL, para
+que Daphne y los workers no sirvan una privacidad vieja durante una hora.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+DEFAULTS = {
+    'LOCAL_MAX_ENTRIES': 1024,
+    'LOCAL_TTL': 5,
+    'SHARED_TTL': 3600,
+}
+
+_lock = threading.Lock()
+_local = OrderedDict()
+# Invalidaciones en este proceso, para no guardar en el LRU una lectura que
+# empezó antes de una invalidación
+_generation = 0
+_stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+# Backends cuyo contenido no ven los demás procesos
+PROCESS_LOCAL_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def _config(name):
+    return getattr(settings, 'USER_SETTINGS_CACHE', {}).get(name, DEFAULTS[name])
+
+
+def is_shared_cache():
+    """Indica si todos los procesos usan la misma caché de Django (y ven sus invalidaciones)"""
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_BACKENDS
+
+
+def _shared_ttl():
+    return _config('SHARED_TTL') if is_shared_cache() else min(_config('SHARED_TTL'), _config('LOCAL_TTL'))
+
+
+def _version_key(user_id):
+    return f'user_settings_version:{user_id}'
+
+
+def _key(user_id, version):
+    return f'user_settings:{user_id}:{version}'
+
+
+def _version(user_id):
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # Un valor nuevo (no 0) por si la versión anterior se desalojó de la caché
+        cache.add(_version_key(user_id), time.time_ns(), None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def _bump_version(user_id):
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        cache.add(_version_key(user_id), time.time_ns(), None)
+
+
+def _count(stat):
+    with _lock:
+        _stats[stat] += 1
+
+
+def _local_get(user_id):
+    with _lock:
+        entry = _local.get(user_id)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del _local[user_id]
+            return None
+        _local.move_to_end(user_id)
+        return value
+
+
+def _local_set(user_id, value, generation):
+    with _lock:
+        if _generation != generation:
+            return
+        _local[user_id] = (time.monotonic() + _config('LOCAL_TTL'), value)
+        _local.move_to_end(user_id)
+        while len(_local) > _config('LOCAL_MAX_ENTRIES'):
+            _local.popitem(last=False)
+
+
+def _detached(instance):
+    """Copia sin relaciones cacheadas, para no guardar el User junto a la configuración"""
+    detached = copy.copy(instance)
+    detached._state.fields_cache = {}
+    return detached
+
+
+def get(user_id, loader):
+    """
+    Devuelve la configuración del usuario desde la caché.
+
+    Args:
+        user_id: ID del usuario
+        loader: Función sin argumentos que carga la configuración de la base de datos
+
+    Returns:
+        Una copia de UserSettings que el llamador puede modificar sin afectar la caché
+    """
+    value = _local_get(user_id)
+    if value is not None:
+        _count('local_hits')
+        return copy.copy(value)
+
+    generation = _generation
+    key = _key(user_id, _version(user_id))
+    value = cache.get(key)
+    if value is not None:
+        _count('shared_hits')
+    else:
+        _count('misses')
+        value = _detached(loader())
+        cache.set(key, value, _shared_ttl())
+    _local_set(user_id, value, generation)
+    return copy.copy(value)
+
+
+def _invalidate_now(user_id):
+    global _generation
+    with _lock:
+        _local.pop(user_id, None)
+        _generation += 1
+    _bump_version(user_id)
+
+
+def invalidate(user_id):
+    """
+    Invalida la configuración del usuario en ambos niveles de caché, ahora y
+    otra vez al confirmarse la transacción en curso
+    """
+    _count('invalidations')
+    _invalidate_now(user_id)
+    transaction.on_commit(lambda: _invalidate_now(user_id))
+
+
+def get_stats():
+    """Contadores de aciertos y fallos de este proceso"""
+    with _lock:
+        stats = dict(_stats)
+        stats['local_entries'] = len(_local)
+    lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+    stats['hit_ratio'] = round((stats['local_hits'] + stats['shared_hits']) / lookups, 4) if lookups else None
+    return stats
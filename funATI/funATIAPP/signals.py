@@ -1,69 +1,297 @@
 # signals.py
-from django.db.models.signals import post_save, m2m_changed
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_init, pre_save, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import Profile, Notification, Comment
-from .utils import send_notification_email
+from .models import Profile, Publication, Notification, Comment, UserSettings, Message, Conversation, UnreadCounter, StoredFile
+from .utils import send_notification_emails_on_commit
+from . import feed, realtime, recommendations, renditions, settings_cache, social_graph
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
-        Profile.objects.create(user=instance)
+        profile = Profile.objects.create(user=instance)
+        # Descartar adyacencias cacheadas con un id reutilizado
+        social_graph.invalidate_friends([profile.id])
+        social_graph.invalidate_following([profile.id])
+        # Crear la configuración al registrarse para que las lecturas no escriban
+        UserSettings.objects.get_or_create(user=instance)
+        UnreadCounter.objects.get_or_create(user=instance)
+
+# Connected before the other Comment receivers so that they already see the path
+@receiver(post_save, sender=Comment)
+def assign_comment_path(sender, instance, created, raw=False, **kwargs):
+    """The materialized path includes the new id, known only after the INSERT"""
+    if created and not raw and not instance.path:
+        instance.assign_path()
+
+# The graph index receivers are connected first so that the handlers
+# below already read the updated adjacency sets.
+@receiver(m2m_changed, sender=Profile.friends.through)
+def invalidate_friends_index(sender, instance, action, pk_set, **kwargs):
+    """Keep the cached friendship sets consistent with the friends table"""
+    if action == 'pre_clear':
+        instance._cleared_friend_ids = set(
+            Profile.friends.through.objects.filter(from_profile=instance).values_list('to_profile_id', flat=True)
+        )
+    elif action in ('post_add', 'post_remove'):
+        social_graph.invalidate_friends({instance.id, *pk_set})
+    elif action == 'post_clear':
+        social_graph.invalidate_friends({instance.id, *getattr(instance, '_cleared_friend_ids', ())})
+
+@receiver(m2m_changed, sender=Profile.following.through)
+def invalidate_following_index(sender, instance, action, reverse, pk_set, **kwargs):
+    """Only the follower's following set changes; with reverse=True those are pk_set"""
+    if action == 'pre_clear' and reverse:
+        instance._cleared_follower_ids = set(instance.followers.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        social_graph.invalidate_following(pk_set if reverse else {instance.id})
+    elif action == 'post_clear':
+        social_graph.invalidate_following(getattr(instance, '_cleared_follower_ids', ()) if reverse else {instance.id})
+
+def _deliver_in_bulk(created, regrouped_ids):
+    """Push bulk-created (or regrouped) notifications and email the new ones after commit"""
+    realtime.publish_notifications_on_commit([notification.id for notification in created] + regrouped_ids)
+    # Actors joining an existing group only go to digest recipients, like Notification.record
+    send_notification_emails_on_commit(created)
+
+def _notify_in_bulk(sender_user, recipients, notification_type, group_key='', **fields):
+    """Bulk-create (or regroup) one sender's notifications to several recipients"""
+    _deliver_in_bulk(*Notification.record_many(
+        sender_user, recipients, notification_type, group_key=group_key, **fields
+    ))
 
 @receiver(m2m_changed, sender=Profile.following.through)
-def create_follow_notification(sender, instance, action, pk_set, **kwargs):
-    """Create notification when someone follows a user"""
-    if action == 'post_add':
-        for profile_id in pk_set:
-            followed_profile = Profile.objects.get(pk=profile_id)
-            # Don't create notification if user follows themselves
-            if instance.user != followed_profile.user:
-                notification = Notification.objects.create(
-                    recipient=followed_profile.user,
-                    sender=instance.user,
-                    notification_type='follow',
-                    message=f'{instance.user.username} te está siguiendo'
-                )
-                # Enviar correo de notificación
-                send_notification_email(notification)
+def create_follow_notification(sender, instance, action, reverse, pk_set, **kwargs):
+    """Create notifications when someone follows users; bursts of follows share one notification"""
+    if action != 'post_add' or not pk_set:
+        return
+    profiles = Profile.objects.select_related('user').in_bulk(pk_set)
+    if reverse:
+        # instance is the followed profile and pk_set its new followers: they
+        # all go into the profile's follow group in one pass
+        followers = [profile.user for profile in profiles.values() if profile.user_id != instance.user_id]
+        if followers:
+            _deliver_in_bulk(*Notification.record_group(
+                instance.user, followers, 'follow', group_key='follow',
+                message=f'{followers[-1].username} te está siguiendo',
+            ))
+    else:
+        # Don't create notification if user follows themselves
+        recipients = [profile.user for profile in profiles.values() if profile.user_id != instance.user_id]
+        _notify_in_bulk(
+            instance.user, recipients, 'follow', group_key='follow',
+            message=f'{instance.user.username} te está siguiendo',
+        )
 
 @receiver(m2m_changed, sender=Profile.friends.through)
 def create_friend_notification(sender, instance, action, pk_set, **kwargs):
-    """Create notification when someone becomes friends with a user"""
-    if action == 'post_add':
-        for profile_id in pk_set:
-            friend_profile = Profile.objects.get(pk=profile_id)
-            # Don't create notification if user adds themselves (shouldn't happen but just in case)
-            if instance.user != friend_profile.user:
-                # Only create one notification per friendship (avoid duplicates)
-                if not Notification.objects.filter(
-                    recipient=friend_profile.user,
-                    sender=instance.user,
-                    notification_type='friend'
-                ).exists():
-                    notification = Notification.objects.create(
-                        recipient=friend_profile.user,
-                        sender=instance.user,
-                        notification_type='friend',
-                        message=f'{instance.user.username} es ahora tu amigo'
-                    )
-                    # Enviar correo de notificación
-                    send_notification_email(notification)
+    """Create notifications when someone becomes friends with users"""
+    if action != 'post_add' or not pk_set:
+        return
+    profiles = Profile.objects.select_related('user').in_bulk(pk_set)
+    # Don't create notification if user adds themselves (shouldn't happen but just in case)
+    recipients = [profile.user for profile in profiles.values() if profile.user_id != instance.user_id]
+    # Only create one notification per friendship (avoid duplicates)
+    notified = set(
+        Notification.objects.filter(
+            sender=instance.user,
+            notification_type='friend',
+            recipient__in=recipients,
+        ).values_list('recipient_id', flat=True)
+    )
+    _notify_in_bulk(
+        instance.user,
+        [user for user in recipients if user.id not in notified],
+        'friend',
+        message=f'{instance.user.username} es ahora tu amigo',
+    )
 
 @receiver(post_save, sender=Comment)
 def create_comment_notification(sender, instance, created, **kwargs):
-    """Create notification when someone comments on a user's publication"""
+    """Create notification when someone comments on a user's publication; grouped per publication"""
     if created:
         publication_owner = instance.publication.profile.user
         # Don't create notification if user comments on their own publication
         if instance.user != publication_owner:
-            notification = Notification.objects.create(
+            # A user replying several times counts once in the group
+            notification, created = Notification.record(
                 recipient=publication_owner,
                 sender=instance.user,
                 notification_type='comment',
+                group_key=f'comment:{instance.publication_id}',
                 publication=instance.publication,
                 comment=instance,
                 message=f'{instance.user.username} respondió a tu publicación: "{instance.content[:50]}{"..." if len(instance.content) > 50 else ""}"'
             )
             # Enviar correo de notificación
-            send_notification_email(notification)
+            if created:
+                send_notification_emails_on_commit([notification])
+
+@receiver(post_save, sender=Notification)
+def push_notification(sender, instance, created, **kwargs):
+    """Deliver new and regrouped notifications to the recipient's open sessions"""
+    if created and not instance.is_read:
+        UnreadCounter.add(instance.recipient_id, notifications=1)
+    realtime.publish_notification_on_commit(instance.id)
+
+@receiver(post_delete, sender=Notification)
+def discount_notification(sender, instance, **kwargs):
+    """Deleting an unread notification lowers the recipient's counter"""
+    if not instance.is_read:
+        UnreadCounter.add(instance.recipient_id, notifications=-1)
+
+@receiver(post_save, sender=Publication)
+def fan_out_publication(sender, instance, created, **kwargs):
+    """Copy new publications into the materialized feed of their audience"""
+    if created:
+        feed.fan_out_publication(instance)
+
+@receiver(m2m_changed, sender=Profile.following.through)
+def sync_feed_on_follow(sender, instance, action, reverse, pk_set, **kwargs):
+    """Add or remove an author's publications when a follow changes"""
+    if action in ('post_add', 'post_remove'):
+        if reverse:
+            # instance es el perfil seguido y pk_set sus seguidores
+            feed.sync_owners(pk_set, instance)
+        else:
+            feed.sync_authors(instance, pk_set)
+    elif action == 'post_clear':
+        if reverse:
+            feed.refresh_author_audience(instance)
+        else:
+            feed.rebuild_feed(instance)
+
+@receiver(m2m_changed, sender=Profile.friends.through)
+def sync_feed_on_friendship(sender, instance, action, pk_set, **kwargs):
+    """Friendship is symmetrical, so both feeds are reconciled"""
+    if action in ('post_add', 'post_remove'):
+        feed.sync_authors(instance, pk_set)
+        feed.sync_owners(pk_set, instance)
+    elif action == 'post_clear':
+        feed.rebuild_feed(instance)
+        feed.refresh_author_audience(instance)
+
+# Reference counting of content-addressed files (see storage.py). The file
+# name seen when the row was loaded is kept on the instance, so replacing or
+# clearing a file needs no extra query.
+STORED_FILE_FIELDS = {Profile: 'avatar', Publication: 'media', Message: 'media'}
+
+def _file_name(value):
+    return getattr(value, 'name', value) or ''
+
+@receiver(post_init, sender=Profile)
+@receiver(post_init, sender=Publication)
+@receiver(post_init, sender=Message)
+def remember_stored_file(sender, instance, **kwargs):
+    field_name = STORED_FILE_FIELDS[sender]
+    # Deferred fields are not in __dict__ and must not be loaded here
+    if field_name in instance.__dict__:
+        instance._stored_file = _file_name(instance.__dict__[field_name])
+
+@receiver(post_save, sender=Profile)
+@receiver(post_save, sender=Publication)
+@receiver(post_save, sender=Message)
+def count_stored_file(sender, instance, created, **kwargs):
+    if not created and not hasattr(instance, '_stored_file'):
+        return
+    previous = '' if created else instance._stored_file
+    current = _file_name(getattr(instance, STORED_FILE_FIELDS[sender]))
+    if current != previous:
+        if current:
+            StoredFile.acquire(current)
+        if previous:
+            StoredFile.release(previous)
+    instance._stored_file = current
+
+@receiver(post_delete, sender=Profile)
+@receiver(post_delete, sender=Publication)
+@receiver(post_delete, sender=Message)
+def release_stored_file(sender, instance, **kwargs):
+    name = _file_name(instance.__dict__.get(STORED_FILE_FIELDS[sender]))
+    if name:
+        StoredFile.release(name)
+
+@receiver(pre_save, sender=Profile)
+def reset_avatar_renditions(sender, instance, **kwargs):
+    """A new avatar is picked up by process_renditions"""
+    renditions.reset_if_changed(instance, 'avatar')
+
+@receiver(pre_save, sender=Publication)
+def reset_media_renditions(sender, instance, **kwargs):
+    renditions.reset_if_changed(instance, 'media')
+
+@receiver(pre_save, sender=UserSettings)
+def remember_previous_privacy(sender, instance, **kwargs):
+    """Keep the stored privacy value to detect changes in post_save"""
+    instance._previous_privacy = None
+    if instance.pk:
+        instance._previous_privacy = sender.objects.filter(pk=instance.pk).values_list('privacy', flat=True).first()
+
+@receiver(post_save, sender=UserSettings)
+@receiver(post_delete, sender=UserSettings)
+def invalidate_cached_settings(sender, instance, **kwargs):
+    """Drop the cached copy whenever the settings row changes"""
+    settings_cache.invalidate(instance.user_id)
+
+@receiver(post_save, sender=UserSettings)
+def sync_feed_on_privacy_change(sender, instance, created, **kwargs):
+    """Followers gain or lose an author's publications when privacy changes"""
+    previous = 'publico' if created else getattr(instance, '_previous_privacy', None)
+    if previous != instance.privacy:
+        feed.refresh_author_audience(instance.user.profile)
+
+# Both counter receivers run inside the transaction of the row change:
+# Comment.save wraps the INSERT and post_save in one atomic block, and
+# deletes send post_delete from the collector's own transaction.
+@receiver(post_save, sender=Comment)
+def increment_comment_counters(sender, instance, created, **kwargs):
+    """Keep Publication.comments_count and Comment.replies_count in sync"""
+    if created:
+        Publication.objects.filter(pk=instance.publication_id).update(comments_count=F('comments_count') + 1)
+        if instance.parent_id:
+            Comment.objects.filter(pk=instance.parent_id).update(replies_count=F('replies_count') + 1)
+
+@receiver(post_delete, sender=Comment)
+def decrement_comment_counters(sender, instance, **kwargs):
+    """Cascaded deletes hit rows that may already be gone; those updates are no-ops"""
+    Publication.objects.filter(pk=instance.publication_id, comments_count__gt=0).update(comments_count=F('comments_count') - 1)
+    if instance.parent_id:
+        Comment.objects.filter(pk=instance.parent_id, replies_count__gt=0).update(replies_count=F('replies_count') - 1)
+
+@receiver(m2m_changed, sender=Profile.friends.through)
+def refresh_friend_recommendations(sender, instance, action, pk_set, **kwargs):
+    """Recompute recommendations of the profiles whose friends changed and of their friends"""
+    if action in ('post_add', 'post_remove'):
+        recommendations.refresh_on_commit({instance.id, *pk_set})
+    elif action == 'post_clear':
+        recommendations.refresh_on_commit({instance.id, *getattr(instance, '_cleared_friend_ids', ())})
+
+@receiver(m2m_changed, sender=Profile.friends.through)
+def revoke_chat_membership(sender, instance, action, pk_set, **kwargs):
+    """Close open chat rooms between profiles that are no longer friends"""
+    if action == 'post_remove':
+        removed = pk_set
+    elif action == 'post_clear':
+        removed = getattr(instance, '_cleared_friend_ids', ())
+    else:
+        return
+    if not removed:
+        return
+    user_ids = list(Profile.objects.filter(id__in=removed).values_list('user_id', flat=True))
+    transaction.on_commit(lambda: realtime.revoke_chat_membership(instance.user_id, user_ids))
+
+@receiver(post_save, sender=Message)
+def update_conversation(sender, instance, created, **kwargs):
+    """Keep the inbox entry (last message and unread counters) in sync"""
+    if created:
+        with transaction.atomic():
+            Conversation.register_message(instance)
+        realtime.publish_conversation_on_commit(instance.sender_id, instance.receiver_id)
+
+@receiver(post_delete, sender=Message)
+def forget_conversation_message(sender, instance, **kwargs):
+    """Keep the inbox entry in sync when a message is deleted"""
+    Conversation.forget_message(instance)
+
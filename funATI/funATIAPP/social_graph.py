@@ -0,0 +1,107 @@
+"""
+Índice en caché del grafo social (amistades y seguimientos).
+
+Las listas de adyacencia de cada perfil se guardan como frozenset de ids en
+la caché de Django, de modo que las pruebas de pertenencia son O(1) y no
+cargan relaciones completas. Los signals m2m_changed de Profile.friends y
+Profile.following invalidan las entradas afectadas (ver signals.py).
+
+Las invalidaciones se hacen al confirmar la transacción del proceso que
+escribe; con una caché local a cada proceso los demás no las ven hasta que
+expira CACHE_TTL. Por eso las autorizaciones (el chat) usan
+are_friends_in_db, que consulta la tabla de amistades.
+
+Las funciones aceptan un Profile, un User o directamente el id de un perfil.
+"""
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from .models import Profile
+
+CACHE_TTL = 3600
+
+
+def _friends_key(profile_id):
+    return f'social:friends:{profile_id}'
+
+
+def _following_key(profile_id):
+    return f'social:following:{profile_id}'
+
+
+def _profile_id(obj):
+    if isinstance(obj, Profile):
+        return obj.id
+    if isinstance(obj, User):
+        return obj.profile.id
+    return int(obj)
+
+
+def friend_ids(profile):
+    """IDs de los amigos de un perfil"""
+    profile_id = _profile_id(profile)
+    ids = cache.get(_friends_key(profile_id))
+    if ids is None:
+        # Se leen ambos sentidos: durante post_add la fila espejo de la
+        # relación simétrica todavía no existe
+        rows = Profile.friends.through.objects.filter(
+            Q(from_profile_id=profile_id) | Q(to_profile_id=profile_id)
+        ).values_list('from_profile_id', 'to_profile_id')
+        ids = frozenset(
+            other for pair in rows for other in pair if other != profile_id
+        )
+        cache.set(_friends_key(profile_id), ids, CACHE_TTL)
+    return ids
+
+
+def following_set(profile):
+    """IDs de los perfiles que sigue un perfil (o el usuario indicado)"""
+    profile_id = _profile_id(profile)
+    ids = cache.get(_following_key(profile_id))
+    if ids is None:
+        ids = frozenset(
+            Profile.following.through.objects.filter(from_profile_id=profile_id)
+            .values_list('to_profile_id', flat=True)
+        )
+        cache.set(_following_key(profile_id), ids, CACHE_TTL)
+    return ids
+
+
+def are_friends(a, b):
+    """Indica si dos perfiles son amigos"""
+    return _profile_id(b) in friend_ids(a)
+
+
+def are_friends_in_db(a, b):
+    """Indica si dos perfiles son amigos según la base de datos, sin pasar por la caché"""
+    a, b = _profile_id(a), _profile_id(b)
+    return Profile.friends.through.objects.filter(
+        Q(from_profile_id=a, to_profile_id=b) | Q(from_profile_id=b, to_profile_id=a)
+    ).exists()
+
+
+def follows(a, b):
+    """Indica si el perfil `a` sigue al perfil `b`"""
+    return _profile_id(b) in following_set(a)
+
+
+def _delete(keys):
+    cache.delete_many(keys)
+
+
+def invalidate_friends(profile_ids):
+    """
+    Invalida las amistades de los perfiles indicados. Se repite al confirmar
+    la transacción para descartar lo que se haya cacheado antes del commit.
+    """
+    keys = [_friends_key(profile_id) for profile_id in profile_ids]
+    _delete(keys)
+    transaction.on_commit(lambda: _delete(keys))
+
+
+def invalidate_following(profile_ids):
+    """Invalida los seguimientos de los perfiles indicados"""
+    keys = [_following_key(profile_id) for profile_id in profile_ids]
+    _delete(keys)
+    transaction.on_commit(lambda: _delete(keys))
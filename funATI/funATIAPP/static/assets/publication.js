@@ -65,48 +65,74 @@ if (commentSpan) {
 }
 // Placeholder y envío para los formularios de respuesta
 const REPLY_PLACEHOLDER = 'Escribe una respuesta...';
-document.querySelectorAll('.reply-form').forEach(function(form) {
-    var replySpan = form.querySelector('.reply-contenteditable');
-    var hiddenInput = form.querySelector('.hidden-reply-content');
-    if (replySpan) {
-        if (!replySpan.innerText.trim()) {
-            replySpan.innerText = REPLY_PLACEHOLDER;
-            replySpan.classList.add('placeholder');
-        }
-        replySpan.addEventListener('focus', function() {
-            if (replySpan.innerText.trim() === REPLY_PLACEHOLDER) {
-                replySpan.innerText = '';
-                replySpan.classList.remove('placeholder');
-            }
-        });
-        replySpan.addEventListener('blur', function() {
+function initReplyForms(root) {
+    root.querySelectorAll('.reply-form:not([data-ready])').forEach(function(form) {
+        form.setAttribute('data-ready', 'true');
+        var replySpan = form.querySelector('.reply-contenteditable');
+        var hiddenInput = form.querySelector('.hidden-reply-content');
+        if (replySpan) {
             if (!replySpan.innerText.trim()) {
                 replySpan.innerText = REPLY_PLACEHOLDER;
                 replySpan.classList.add('placeholder');
             }
+            replySpan.addEventListener('focus', function() {
+                if (replySpan.innerText.trim() === REPLY_PLACEHOLDER) {
+                    replySpan.innerText = '';
+                    replySpan.classList.remove('placeholder');
+                }
+            });
+            replySpan.addEventListener('blur', function() {
+                if (!replySpan.innerText.trim()) {
+                    replySpan.innerText = REPLY_PLACEHOLDER;
+                    replySpan.classList.add('placeholder');
+                }
+            });
+        }
+        form.addEventListener('submit', function(e) {
+            e.preventDefault();
+            var content = replySpan.innerText.trim() === REPLY_PLACEHOLDER ? '' : replySpan.innerText.trim();
+            var parent = form.querySelector('input[name="parent"]').value;
+            var csrf = getCSRFToken();
+            var formData = new FormData();
+            formData.append('content', content);
+            formData.append('parent', parent);
+            formData.append('csrfmiddlewaretoken', csrf);
+            fetch(window.location.pathname, {
+                method: 'POST',
+                body: formData,
+                headers: {
+                    'X-Requested-With': 'XMLHttpRequest'
+                }
+            }).then(function(response) {
+                if (response.ok) {
+                    window.location.reload();
+                } else {
+                    alert('Error al enviar la respuesta.');
+                }
+            });
         });
-    }
-    form.addEventListener('submit', function(e) {
-        e.preventDefault();
-        var content = replySpan.innerText.trim() === REPLY_PLACEHOLDER ? '' : replySpan.innerText.trim();
-        var parent = form.querySelector('input[name="parent"]').value;
-        var csrf = getCSRFToken();
-        var formData = new FormData();
-        formData.append('content', content);
-        formData.append('parent', parent);
-        formData.append('csrfmiddlewaretoken', csrf);
-        fetch(window.location.pathname, {
-            method: 'POST',
-            body: formData,
-            headers: {
-                'X-Requested-With': 'XMLHttpRequest'
-            }
-        }).then(function(response) {
-            if (response.ok) {
-                window.location.reload();
-            } else {
-                alert('Error al enviar la respuesta.');
-            }
-        });
+    });
+}
+initReplyForms(document);
+// Carga perezosa de comentarios y respuestas: cada botón trae la página
+// siguiente y el fragmento incluye su propio botón si quedan más
+document.addEventListener('click', function(e) {
+    var button = e.target.closest('.load-replies-btn, .load-comments-btn');
+    if (!button || button.disabled) return;
+    button.disabled = true;
+    fetch(button.getAttribute('data-url'), {
+        headers: { 'X-Requested-With': 'XMLHttpRequest' }
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.error) throw new Error(data.error);
+        var wrapper = document.createElement('div');
+        wrapper.innerHTML = data.html;
+        initReplyForms(wrapper);
+        button.replaceWith(...wrapper.childNodes);
+    })
+    .catch(error => {
+        console.error('Error al cargar comentarios:', error);
+        button.disabled = false;
     });
 });
@@ -0,0 +1,71 @@
+// Subida por partes y reanudable (ver funATIAPP/uploads.py). Abre una sesión
+// en /api/uploads/, envía el archivo en partes con PATCH y, si una parte
+// falla, pregunta al servidor cuánto recibió y continúa desde ahí.
+// Devuelve una promesa con el id de la subida, que se envía como upload_id
+// al publicar o al mandar un mensaje.
+(function() {
+    var MAX_RETRIES = 5;
+
+    function csrfToken() {
+        var input = document.querySelector('[name=csrfmiddlewaretoken]');
+        return input ? input.value : '';
+    }
+
+    function request(method, url, options) {
+        options = options || {};
+        options.method = method;
+        options.credentials = 'same-origin';
+        options.headers = Object.assign({'X-CSRFToken': csrfToken()}, options.headers || {});
+        return fetch(url, options).then(function(response) {
+            return response.json().then(function(data) {
+                if (!response.ok) {
+                    var error = new Error(data.error || 'Error subiendo el archivo');
+                    error.status = response.status;
+                    throw error;
+                }
+                return data;
+            });
+        });
+    }
+
+    function sendChunks(file, uploadUrl, offset, chunkSize, retries, onProgress) {
+        if (offset >= file.size) {
+            return Promise.resolve();
+        }
+        var chunk = file.slice(offset, Math.min(offset + chunkSize, file.size));
+        return request('PATCH', uploadUrl, {
+            body: chunk,
+            headers: {
+                'Content-Type': 'application/offset+octet-stream',
+                'Upload-Offset': String(offset)
+            }
+        }).then(function(data) {
+            if (onProgress) onProgress(data.offset / file.size);
+            return sendChunks(file, uploadUrl, data.offset, chunkSize, MAX_RETRIES, onProgress);
+        }, function(error) {
+            // Los errores de validación no se reintentan; 409 (offset desfasado o
+            // parte incompleta) y los 5xx sí, desde el offset que tenga el servidor
+            if (error.status && error.status !== 409 && error.status < 500) throw error;
+            if (retries <= 0) throw error;
+            return new Promise(function(resolve) {
+                setTimeout(resolve, 1000 * (MAX_RETRIES - retries + 1));
+            }).then(function() {
+                return request('GET', uploadUrl);
+            }).then(function(data) {
+                return sendChunks(file, uploadUrl, data.offset, chunkSize, retries - 1, onProgress);
+            });
+        });
+    }
+
+    window.chunkedUpload = function(file, purpose, onProgress) {
+        var form = new FormData();
+        form.append('filename', file.name);
+        form.append('size', file.size);
+        form.append('purpose', purpose);
+        return request('POST', '/api/uploads/', {body: form}).then(function(session) {
+            var uploadUrl = '/api/uploads/' + session.upload_id + '/';
+            return sendChunks(file, uploadUrl, session.offset, session.chunk_size, MAX_RETRIES, onProgress)
+                .then(function() { return session.upload_id; });
+        });
+    };
+})();
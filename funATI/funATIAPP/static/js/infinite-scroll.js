@@ -0,0 +1,56 @@
+// Scroll infinito para listas de publicaciones paginadas por cursor.
+// Cada fragmento termina con un .load-more-sentinel cuyo data-next-url
+// devuelve {html, next_url}; al hacerse visible se reemplaza por la página siguiente.
+(function() {
+    var loading = new WeakSet();
+
+    function loadNextPage(sentinel) {
+        if (loading.has(sentinel)) return;
+        loading.add(sentinel);
+        observer.unobserve(sentinel);
+        fetch(sentinel.getAttribute('data-next-url'), {
+            headers: { 'X-Requested-With': 'XMLHttpRequest' }
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.error) throw new Error(data.error);
+            // El html incluye su propio sentinel si quedan más páginas
+            sentinel.insertAdjacentHTML('afterend', data.html);
+            sentinel.remove();
+        })
+        .catch(error => {
+            console.error('Error al cargar más publicaciones:', error);
+            loading.delete(sentinel);
+        });
+    }
+
+    var observer = new IntersectionObserver(function(entries) {
+        entries.forEach(function(entry) {
+            if (entry.isIntersecting) loadNextPage(entry.target);
+        });
+    }, { rootMargin: '400px 0px' });
+
+    function observeSentinels(root) {
+        root.querySelectorAll('.load-more-sentinel').forEach(function(sentinel) {
+            observer.observe(sentinel);
+        });
+    }
+
+    // Los fragmentos se insertan con innerHTML (loadHTML), así que se vigilan los nuevos nodos
+    new MutationObserver(function(mutations) {
+        mutations.forEach(function(mutation) {
+            mutation.addedNodes.forEach(function(node) {
+                if (node.nodeType !== Node.ELEMENT_NODE) return;
+                if (node.classList.contains('load-more-sentinel')) {
+                    observer.observe(node);
+                } else {
+                    observeSentinels(node);
+                }
+            });
+        });
+    }).observe(document.documentElement, { childList: true, subtree: true });
+
+    document.addEventListener('DOMContentLoaded', function() {
+        observeSentinels(document);
+    });
+})();
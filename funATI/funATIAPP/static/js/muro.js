@@ -28,12 +28,21 @@ if (funarForm) {
         if (content === PLACEHOLDER) content = '';
         document.getElementById('hidden-content').value = content;
         var formData = new FormData(this);
-        fetch(window.location.pathname, {
-            method: 'POST',
-            body: formData,
-            headers: {
-                'X-Requested-With': 'XMLHttpRequest'
+        var mediaFile = document.getElementById('media-input').files[0];
+        // La imagen se sube antes por partes; la publicación solo lleva su handle
+        var upload = mediaFile ? chunkedUpload(mediaFile, 'publication') : Promise.resolve(null);
+        upload.then(function(uploadId) {
+            if (uploadId) {
+                formData.delete('media');
+                formData.append('upload_id', uploadId);
             }
+            return fetch(window.location.pathname, {
+                method: 'POST',
+                body: formData,
+                headers: {
+                    'X-Requested-With': 'XMLHttpRequest'
+                }
+            });
         })
         .then(response => {
             if (response.ok) {
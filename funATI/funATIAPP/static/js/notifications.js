@@ -0,0 +1,69 @@
+// Notificaciones en tiempo real: el servidor envía por ws/notifications/ cada
+// notificación nueva (ya renderizada), el número de no leídas y los mensajes
+// sin leer cuando cambia alguna conversación. Los valores iniciales los pinta
+// el menú; /api/unread/ los vuelve a leer al reconectar.
+(function() {
+    var badge = document.getElementById('notifications-badge');
+    var messagesBadge = document.getElementById('messages-badge');
+    if (!badge) return;
+
+    function setBadge(element, count) {
+        if (!element) return;
+        element.textContent = count > 99 ? '99+' : count;
+        element.hidden = !count;
+    }
+
+    function setUnreadCount(count) {
+        setBadge(badge, count);
+    }
+
+    function refreshCounts() {
+        fetch('/api/unread/', {credentials: 'same-origin'})
+            .then(function(response) { return response.ok ? response.json() : null; })
+            .then(function(data) {
+                if (!data) return;
+                setBadge(badge, data.notifications);
+                setBadge(messagesBadge, data.messages);
+            })
+            .catch(function() {});
+    }
+
+    function connect() {
+        var protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+        var socket = new WebSocket(protocol + '//' + window.location.host + '/ws/notifications/');
+
+        socket.onmessage = function(event) {
+            var data = JSON.parse(event.data);
+            if (data.type === 'notification') {
+                // En la página de notificaciones se agrega arriba de la lista; una
+                // notificación reagrupada ("ana y 3 personas más") reemplaza a la anterior
+                var container = document.querySelector('.notifications-container');
+                if (container) {
+                    var empty = container.querySelector('.no-notifications');
+                    if (empty) empty.remove();
+                    var previous = container.querySelector('[data-notification-id="' + data.notification.id + '"]');
+                    if (previous) {
+                        (previous.closest('.notification-link') || previous).remove();
+                    }
+                    container.insertAdjacentHTML('afterbegin', data.notification.html);
+                }
+                setUnreadCount(data.unread_count);
+            } else if (data.type === 'notification_unread') {
+                setUnreadCount(data.unread_count);
+            } else if (data.type === 'inbox' && data.unread_messages !== null && data.unread_messages !== undefined) {
+                setBadge(messagesBadge, data.unread_messages);
+            }
+        };
+
+        socket.onclose = function() {
+            // Reintentar tras un reinicio del servidor o un corte de red;
+            // lo que cambió mientras tanto se lee del endpoint
+            setTimeout(function() {
+                refreshCounts();
+                connect();
+            }, 5000);
+        };
+    }
+
+    connect();
+})();
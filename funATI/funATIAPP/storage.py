@@ -0,0 +1,164 @@
+"""
+Almacenamiento por contenido para los archivos subidos.
+
+ContentAddressedStorage calcula el SHA-256 del archivo mientras lo copia,
+por bloques, a un temporal, y lo guarda en content/<ab>/<cd>/<hash><ext>.
+Si ese archivo ya existe (el mismo meme subido otra vez, una imagen
+reenviada del chat al muro) el temporal se descarta y se devuelve el nombre
+existente: el contenido se guarda una sola vez, sin importar el nombre con
+que se subió ni el campo que lo usa.
+
+Los usos de cada archivo se cuentan en StoredFile desde los signals de los
+modelos con archivos (ver signals.py); al llegar a cero se borra. Los
+archivos subidos antes, fuera de content/, no se cuentan.
+
+CompressedManifestStaticFilesStorage es el storage de collectstatic: nombres
+con el hash del contenido (css/muro.3f2a9c1b0d4e.css), que Apache sirve con
+caché inmutable, y una versión .gz (y .br si está instalado el paquete
+brotli) junto a cada archivo de texto.
+"""
+import gzip
+import hashlib
+import os
+import tempfile
+import time
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.storage import FileSystemStorage, storages
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CONTENT_PREFIX = 'content/'
+TEMP_DIR = 'content/.incoming'
+# Segundos tras reutilizar un archivo en los que StoredFile no lo borra: la
+# fila que lo reutiliza puede no haberse confirmado todavía
+REUSE_GRACE = 600
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # El nombre final depende del contenido (ver _save); no hace falta buscar uno libre
+        return name
+
+    def hashed_name(self, digest, name):
+        extension = os.path.splitext(name)[1].lower()
+        return f'{CONTENT_PREFIX}{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+    def _save(self, name, content):
+        incoming = self.path(TEMP_DIR)
+        os.makedirs(incoming, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=incoming, suffix='.part')
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as temp:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp.write(chunk)
+            stored_name = self.hashed_name(digest.hexdigest(), name)
+            full_path = self.path(stored_name)
+            reused = False
+            if os.path.exists(full_path):
+                # Contenido repetido: se reutiliza el archivo existente. Se
+                # actualiza su fecha para que ni StoredFile ni
+                # collect_orphan_media lo borren antes de que se confirme la
+                # fila que lo usa
+                try:
+                    os.utime(full_path)
+                    reused = True
+                except FileNotFoundError:
+                    # Se borró justo ahora: se guarda el temporal
+                    pass
+            if reused:
+                os.remove(temp_path)
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(temp_path, self.file_permissions_mode)
+                os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return stored_name
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # Sin manifest (en desarrollo, o antes del primer collectstatic) se usan
+    # los nombres originales en lugar de fallar
+    manifest_strict = False
+    # Solo los tipos para los que apache-funati.conf fija el Content-Type de la variante
+    compress_extensions = {'.css', '.js', '.svg', '.json'}
+
+    def hashed_name(self, name, content=None, filename=None):
+        try:
+            return super().hashed_name(name, content, filename)
+        except ValueError:
+            if content is not None:
+                raise
+            return name
+
+    def url(self, name, force=False):
+        # Apache sirve STATIC_ROOT directamente también con DEBUG activo
+        return super().url(name, force=True)
+
+    def post_process(self, paths, dry_run=False, **options):
+        final_names = {}
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                final_names[name] = hashed_name
+            yield name, hashed_name, processed
+        if not dry_run:
+            for name, hashed_name in final_names.items():
+                # Un nombre con hash no cambia de contenido: si ya tiene sus
+                # variantes, siguen valiendo (aunque se haya vuelto a escribir)
+                self.compress(hashed_name, hashed=hashed_name != name)
+
+    def compress(self, name, hashed=False):
+        """
+        Escribe name.gz y name.br si reducen el tamaño. Las variantes ya
+        existentes de un nombre con hash, o más nuevas que el archivo, se
+        conservan: collectstatic sin --clear solo comprime lo que cambió.
+        """
+        if os.path.splitext(name)[1].lower() not in self.compress_extensions:
+            return
+        path = self.path(name)
+        encoders = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            encoders.append(('.br', lambda data: brotli.compress(data, quality=11)))
+        source_mtime = os.path.getmtime(path)
+        data = None
+        for suffix, encode in encoders:
+            target = path + suffix
+            if os.path.exists(target) and (hashed or os.path.getmtime(target) >= source_mtime):
+                continue
+            if data is None:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            compressed = encode(data)
+            if len(compressed) >= len(data):
+                continue
+            temp_path = target + '.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(compressed)
+            os.replace(temp_path, target)
+
+
+def content_storage():
+    """Storage de los FileField de la app (STORAGES['content'])"""
+    return storages['content']
+
+
+def is_content_addressed(name):
+    return bool(name) and name.startswith(CONTENT_PREFIX)
+
+
+def recently_reused(name):
+    """True si el archivo se guardó o reutilizó en los últimos REUSE_GRACE segundos"""
+    try:
+        modified = os.path.getmtime(content_storage().path(name))
+    except FileNotFoundError:
+        return False
+    return time.time() - modified < REUSE_GRACE
@@ -0,0 +1,28 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+from .. import renditions
+
+register = template.Library()
+
+
+@register.simple_tag
+def rendition(obj, field_name, size, **attrs):
+    """
+    <img> con la versión `size` (thumb, card o full) del archivo `field_name`
+    de `obj`, con sus dimensiones para que el navegador reserve el espacio.
+    Mientras la versión no exista se usa el original, sin dimensiones.
+
+    Uso: {% rendition publication.profile 'avatar' 'thumb' alt=publication.profile.user.username class='post-avatar' %}
+    """
+    data = renditions.get(obj, field_name, size)
+    if data:
+        attrs.setdefault('width', data['width'])
+        attrs.setdefault('height', data['height'])
+    return format_html('<img src="{}"{} />', renditions.url(obj, field_name, size) or '', flatatt(attrs))
+
+
+@register.simple_tag
+def rendition_url(obj, field_name, size):
+    """URL de la versión `size`, o del original si todavía no existe"""
+    return renditions.url(obj, field_name, size) or ''
@@ -1,10 +1,34 @@
 # Create your tests here.
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.contrib.auth.models import User
-from .models import Profile, Publication, Comment, UserSettings
+from .models import Profile, Publication, Comment, UserSettings, Message, Conversation, Notification, EmailOutbox, UnreadCounter, UploadSession, StoredFile
+from . import digest, feed, message_writer, outbox, realtime, recommendations, renditions, routing, settings_cache, social_graph, storage, uploads, views
+from .comment_tree import load_comment_page
 from django.urls import reverse
+from django.core.management import call_command
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.template import Context, Template
+from django.core.mail.backends.base import BaseEmailBackend
 from django.utils import timezone
+from django.db import OperationalError, connection
+from django.core.exceptions import ImproperlyConfigured
+from django.test.utils import CaptureQueriesContext
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_save
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from channels.db import database_sync_to_async
+import gzip
+import os
+import shutil
 import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+from io import BytesIO, StringIO
 from PIL import Image
 
 # Función auxiliar para crear un usuario y perfil de prueba
@@ -212,3 +236,1202 @@ class PerfilConfigTest(TestCase):
         self.assertEqual(self.user.first_name, 'Usuario')
         self.assertEqual(self.user.email, 'newemail@example.com')
         self.assertEqual(self.profile.biography, 'Una nueva biografía.')
+
+class FeedMaterializadoTest(TestCase):
+    def setUp(self):
+        self.user1, self.profile1 = create_test_user('usuario1', 'user1@example.com', 'testpass123')
+        self.user2, self.profile2 = create_test_user('usuario2', 'user2@example.com', 'testpass123')
+
+    def test_publicacion_llega_a_seguidores(self):
+        """Una publicación pública se copia en el feed de los seguidores."""
+        self.profile1.following.add(self.profile2)
+        publication = Publication.objects.create(profile=self.profile2, content='Hola seguidores')
+        self.assertIn(publication, feed.feed_for(self.profile1))
+        self.assertIn(publication, feed.feed_for(self.profile2))
+
+        # Al dejar de seguir, la publicación sale del feed
+        self.profile1.following.remove(self.profile2)
+        self.assertNotIn(publication, feed.feed_for(self.profile1))
+
+    def test_privacidad_y_amistad(self):
+        """Las publicaciones privadas solo aparecen en el feed de los amigos."""
+        publication = Publication.objects.create(profile=self.profile2, content='Solo amigos')
+        self.profile1.following.add(self.profile2)
+
+        settings2 = UserSettings.get_user_settings(self.user2)
+        settings2.privacy = 'privado'
+        settings2.save()
+        self.assertNotIn(publication, feed.feed_for(self.profile1))
+
+        self.profile1.friends.add(self.profile2)
+        self.assertIn(publication, feed.feed_for(self.profile1))
+
+        self.profile1.friends.remove(self.profile2)
+        self.assertNotIn(publication, feed.feed_for(self.profile1))
+
+class PrivacidadQuerySetTest(TestCase):
+    def setUp(self):
+        self.user1, self.profile1 = create_test_user('usuario1', 'user1@example.com', 'testpass123')
+        self.user2, self.profile2 = create_test_user('usuario2', 'user2@example.com', 'testpass123')
+        self.user3, self.profile3 = create_test_user('usuario3', 'user3@example.com', 'testpass123')
+        settings2 = UserSettings.get_user_settings(self.user2)
+        settings2.privacy = 'privado'
+        settings2.save()
+        self.publica = Publication.objects.create(profile=self.profile3, content='Pública')
+        self.privada = Publication.objects.create(profile=self.profile2, content='Privada')
+
+    def test_visible_to_respeta_privacidad(self):
+        """visible_to aplica la regla público / privado-amigo / propio en una consulta."""
+        with self.assertNumQueries(1):
+            visibles = list(Publication.objects.visible_to(self.user1))
+        self.assertEqual(visibles, [self.publica])
+
+        self.profile1.friends.add(self.profile2)
+        self.assertEqual(set(Publication.objects.visible_to(self.user1)), {self.publica, self.privada})
+        self.assertEqual(set(Publication.objects.visible_to(self.user2)), {self.publica, self.privada})
+
+    def test_detalle_privado_no_visible(self):
+        """La vista de detalle no muestra publicaciones privadas a quien no es amigo."""
+        self.client.login(username='usuario1', password='testpass123')
+        response = self.client.get(reverse('funATIAPP:publication_detail', args=[self.privada.id]))
+        self.assertEqual(response.status_code, 404)
+
+class PaginacionCursorTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user, self.profile = create_test_user('testuser', 'test@example.com', 'testpass123')
+        self.client.login(username='testuser', password='testpass123')
+
+    @override_settings(PUBLICATIONS_PAGE_SIZE=2)
+    def test_feed_por_paginas(self):
+        """El feed se recorre por cursor sin repetir ni saltar publicaciones."""
+        for i in range(5):
+            Publication.objects.create(profile=self.profile, content=f'Publicación {i}')
+
+        response = self.client.get(reverse('funATIAPP:container'))
+        self.assertEqual(len(response.context['publications']), 2)
+        next_url = response.context['next_url']
+        seen = [p.content for p in response.context['publications']]
+        while next_url:
+            data = self.client.get(next_url).json()
+            next_url = data['next_url']
+            page = [f'Publicación {i}' for i in range(5) if f'Publicación {i}' in data['html']]
+            seen.extend(sorted(page, key=data['html'].index))
+        self.assertEqual(seen, [f'Publicación {i}' for i in reversed(range(5))])
+
+    def test_cursor_invalido(self):
+        """Un cursor mal formado devuelve 400."""
+        response = self.client.get(reverse('funATIAPP:publications_page_api'), {'cursor': 'no-es-un-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ContadoresComentariosTest(TestCase):
+    def setUp(self):
+        self.user, self.profile = create_test_user('testuser', 'test@example.com', 'testpass123')
+        self.publication = Publication.objects.create(profile=self.profile, content='Publicación')
+
+    def test_contadores_se_mantienen(self):
+        """Crear y borrar comentarios actualiza los contadores desnormalizados."""
+        comment = Comment.objects.create(publication=self.publication, user=self.user, content='Comentario')
+        reply = Comment.objects.create(publication=self.publication, user=self.user, content='Respuesta', parent=comment)
+        self.publication.refresh_from_db()
+        comment.refresh_from_db()
+        self.assertEqual(self.publication.comments_count, 2)
+        self.assertEqual(comment.replies_count, 1)
+
+        reply.delete()
+        self.publication.refresh_from_db()
+        comment.refresh_from_db()
+        self.assertEqual(self.publication.comments_count, 1)
+        self.assertEqual(comment.replies_count, 0)
+
+    def test_contador_y_comentario_en_la_misma_transaccion(self):
+        """Si el post_save falla, el comentario tampoco se guarda."""
+        def fail(sender, instance, created, **kwargs):
+            raise RuntimeError('fallo')
+
+        post_save.connect(fail, sender=Comment)
+        try:
+            with self.assertRaises(RuntimeError):
+                Comment.objects.create(publication=self.publication, user=self.user, content='Comentario')
+        finally:
+            post_save.disconnect(fail, sender=Comment)
+        self.assertFalse(Comment.objects.exists())
+        self.publication.refresh_from_db()
+        self.assertEqual(self.publication.comments_count, 0)
+
+    def test_rebuild_comment_counters(self):
+        """El comando recalcula los contadores desde cero."""
+        comment = Comment.objects.create(publication=self.publication, user=self.user, content='Comentario')
+        Comment.objects.create(publication=self.publication, user=self.user, content='Respuesta', parent=comment)
+        Publication.objects.update(comments_count=0)
+        Comment.objects.update(replies_count=7)
+
+        call_command('rebuild_comment_counters', stdout=StringIO())
+        self.publication.refresh_from_db()
+        comment.refresh_from_db()
+        self.assertEqual(self.publication.comments_count, 2)
+        self.assertEqual(comment.replies_count, 1)
+
+class ArbolComentariosTest(TestCase):
+    def setUp(self):
+        self.user, self.profile = create_test_user('testuser', 'test@example.com', 'testpass123')
+        self.publication = Publication.objects.create(profile=self.profile, content='Publicación')
+        self.c1 = Comment.objects.create(publication=self.publication, user=self.user, content='c1')
+        self.c2 = Comment.objects.create(publication=self.publication, user=self.user, content='c2')
+        self.r1 = Comment.objects.create(publication=self.publication, user=self.user, content='r1', parent=self.c1)
+        self.r2 = Comment.objects.create(publication=self.publication, user=self.user, content='r2', parent=self.r1)
+
+    def test_path_y_depth(self):
+        """El path contiene los ancestros y depth el nivel de anidación."""
+        self.assertEqual(self.r2.depth, 2)
+        self.assertTrue(self.r2.path.startswith(self.r1.path))
+        self.assertTrue(self.r1.path.startswith(self.c1.path))
+
+    def test_path_disponible_en_post_save(self):
+        """Los receivers de post_save ya ven el path guardado."""
+        seen = []
+
+        def remember(sender, instance, created, **kwargs):
+            seen.append((instance.path, Comment.objects.get(pk=instance.pk).path))
+
+        post_save.connect(remember, sender=Comment)
+        try:
+            reply = Comment.objects.create(publication=self.publication, user=self.user, content='r3', parent=self.r2)
+        finally:
+            post_save.disconnect(remember, sender=Comment)
+        self.assertEqual(seen, [(reply.path, reply.path)])
+        self.assertTrue(reply.path.startswith(self.r2.path))
+
+    @mock.patch.object(Comment, 'MAX_DEPTH', 2)
+    def test_profundidad_maxima(self):
+        """Una respuesta a un comentario del último nivel cuelga de su padre."""
+        reply = Comment.objects.create(publication=self.publication, user=self.user, content='r3', parent=self.r2)
+        self.assertEqual(reply.parent, self.r1)
+        self.assertEqual(reply.depth, 2)
+        self.r1.refresh_from_db()
+        self.assertEqual(self.r1.replies_count, 2)
+
+    def test_arbol_en_dos_consultas(self):
+        """La página de raíces y sus respuestas se cargan con dos consultas y se arman en memoria."""
+        with self.assertNumQueries(2):
+            roots, next_cursor = load_comment_page(self.publication)
+            self.assertEqual([c.content for c in roots], ['c1', 'c2'])
+            self.assertEqual([c.content for c in roots[0].children], ['r1'])
+            self.assertEqual([c.content for c in roots[0].children[0].children], ['r2'])
+            self.assertEqual(roots[0].children[0].user.profile, self.profile)
+        self.assertIsNone(next_cursor)
+
+    def test_limites_de_profundidad_y_tamano(self):
+        """max_depth y limit recortan el árbol sin dejar respuestas huérfanas."""
+        roots, _ = load_comment_page(self.publication, max_depth=2)
+        self.assertEqual(roots[0].children[0].children, [])
+        self.assertEqual(roots[0].children[0].hidden_replies, 1)
+
+        roots, _ = load_comment_page(self.publication, limit=1)
+        self.assertEqual([c.content for c in roots[0].children], ['r1'])
+        self.assertEqual(roots[0].children[0].children, [])
+
+@override_settings(COMMENTS_PAGE_SIZE=2)
+class ComentariosPerezososTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user, self.profile = create_test_user('testuser', 'test@example.com', 'testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.publication = Publication.objects.create(profile=self.profile, content='Publicación viral')
+        self.comments = [
+            Comment.objects.create(publication=self.publication, user=self.user, content=f'comentario {i}')
+            for i in range(3)
+        ]
+        for i in range(3):
+            Comment.objects.create(publication=self.publication, user=self.user, content=f'respuesta {i}', parent=self.comments[0])
+
+    def test_primera_pagina_y_siguientes(self):
+        """El detalle muestra la primera página y la API devuelve el resto."""
+        response = self.client.get(reverse('funATIAPP:publication_detail', args=[self.publication.id]))
+        self.assertEqual([c.content for c in response.context['comments']], ['comentario 0', 'comentario 1'])
+        self.assertEqual(response.context['comments'][0].replies_count, 3)
+
+        data = self.client.get(response.context['next_url']).json()
+        self.assertIn('comentario 2', data['html'])
+        self.assertIsNone(data['next_url'])
+
+    def test_respuestas_solo_de_las_raices_de_la_pagina(self):
+        """Las respuestas de raíces de otras páginas no ocupan el límite."""
+        first, middle, last = self.comments
+        Comment.objects.filter(pk=middle.pk).update(created_at=timezone.now() + timedelta(hours=1))
+        Comment.objects.create(publication=self.publication, user=self.user, content='fuera', parent=middle)
+        Comment.objects.create(publication=self.publication, user=self.user, content='dentro', parent=last)
+
+        roots, _ = load_comment_page(self.publication, limit=4)
+        self.assertEqual([c.content for c in roots], ['comentario 0', 'comentario 2'])
+        self.assertEqual([c.content for c in roots[1].children], ['dentro'])
+
+    def test_respuestas_por_paginas(self):
+        """Las respuestas de un comentario se expanden página por página."""
+        url = reverse('funATIAPP:comment_replies_api', args=[self.comments[0].id])
+        data = self.client.get(url).json()
+        self.assertIn('respuesta 1', data['html'])
+        self.assertNotIn('respuesta 2', data['html'])
+
+        data = self.client.get(data['next_url']).json()
+        self.assertIn('respuesta 2', data['html'])
+        self.assertIsNone(data['next_url'])
+
+class CacheConfiguracionTest(TestCase):
+    def setUp(self):
+        self.user, self.profile = create_test_user('testuser', 'test@example.com', 'testpass123')
+
+    def test_configuracion_creada_al_registrarse(self):
+        """La configuración existe desde el registro y las lecturas salen de la caché."""
+        self.assertTrue(UserSettings.objects.filter(user=self.user).exists())
+        UserSettings.get_user_settings(self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(UserSettings.get_user_settings(self.user).privacy, 'publico')
+
+    def test_invalidacion_al_guardar(self):
+        """Guardar la configuración invalida la copia en caché."""
+        user_settings = UserSettings.get_user_settings(self.user)
+        user_settings.privacy = 'privado'
+        user_settings.save()
+        self.assertEqual(UserSettings.get_user_settings(self.user).privacy, 'privado')
+
+        stats = settings_cache.get_stats()
+        self.assertGreater(stats['invalidations'], 0)
+        self.assertGreater(stats['local_hits'] + stats['shared_hits'] + stats['misses'], 0)
+
+    def test_invalidacion_durante_la_carga(self):
+        """Un valor leído antes de una invalidación no queda en la caché."""
+        def stale_loader():
+            value = UserSettings.objects.get(user=self.user)
+            UserSettings.objects.filter(user=self.user).update(privacy='privado')
+            settings_cache.invalidate(self.user.id)
+            return value
+
+        self.assertEqual(settings_cache.get(self.user.id, stale_loader).privacy, 'publico')
+        self.assertEqual(UserSettings.get_user_settings(self.user).privacy, 'privado')
+
+    @override_settings(USER_SETTINGS_CACHE={'LOCAL_TTL': 5, 'SHARED_TTL': 3600})
+    def test_ttl_corto_sin_cache_compartida(self):
+        """Con la caché en memoria de cada proceso las entradas duran LOCAL_TTL."""
+        self.assertFalse(settings_cache.is_shared_cache())
+        settings_cache.invalidate(self.user.id)
+        with mock.patch.object(settings_cache.cache, 'set', wraps=settings_cache.cache.set) as cache_set:
+            UserSettings.get_user_settings(self.user)
+        self.assertEqual(cache_set.call_args.args[2], 5)
+
+class GrafoSocialTest(TestCase):
+    def setUp(self):
+        self.user1, self.profile1 = create_test_user('usuario1', 'user1@example.com', 'testpass123')
+        self.user2, self.profile2 = create_test_user('usuario2', 'user2@example.com', 'testpass123')
+
+    def test_amistad_en_cache_se_invalida(self):
+        """are_friends refleja altas y bajas de amistad sin consultar relaciones completas."""
+        self.assertFalse(social_graph.are_friends(self.profile1, self.profile2))
+        self.profile1.friends.add(self.profile2)
+        self.assertTrue(social_graph.are_friends(self.profile2, self.profile1))
+        self.assertTrue(social_graph.are_friends(self.profile1, self.profile2))
+        with self.assertNumQueries(0):
+            self.assertTrue(social_graph.are_friends(self.profile1, self.profile2))
+        self.profile2.friends.remove(self.profile1)
+        self.assertFalse(social_graph.are_friends(self.profile1, self.profile2))
+
+    def test_chat_autoriza_contra_la_base_de_datos(self):
+        """Una amistad borrada en otro proceso (caché sin invalidar) no permite enviar mensajes."""
+        self.profile1.friends.add(self.profile2)
+        self.assertTrue(social_graph.are_friends(self.profile1, self.profile2))
+        Profile.friends.through.objects.all().delete()
+        self.assertTrue(social_graph.are_friends(self.profile1, self.profile2))
+        self.assertFalse(social_graph.are_friends_in_db(self.profile1, self.profile2))
+        self.client.login(username='usuario1', password='testpass123')
+        response = self.client.post(reverse('funATIAPP:send_message_api'), {
+            'receiver_id': self.profile2.id, 'content': 'Hola',
+        })
+        self.assertEqual(response.status_code, 403)
+
+    def test_seguimiento_en_cache_se_invalida(self):
+        """follows y following_set se actualizan al seguir y dejar de seguir."""
+        self.profile1.following.add(self.profile2)
+        self.assertTrue(social_graph.follows(self.user1, self.profile2))
+        self.assertFalse(social_graph.follows(self.profile2, self.profile1))
+        self.profile2.followers.clear()
+        self.assertEqual(social_graph.following_set(self.profile1), frozenset())
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class RecomendacionesAmigosTest(TestCase):
+    def setUp(self):
+        self.user1, self.profile1 = create_test_user('usuario1', 'user1@example.com', 'testpass123')
+        self.user2, self.profile2 = create_test_user('usuario2', 'user2@example.com', 'testpass123')
+        self.user3, self.profile3 = create_test_user('usuario3', 'user3@example.com', 'testpass123')
+        self.user4, self.profile4 = create_test_user('usuario4', 'user4@example.com', 'testpass123')
+
+    def test_amigos_de_amigos_y_seguidos_en_comun(self):
+        """Los amigos en común pesan más que los seguidos en común y se excluyen los amigos."""
+        self.profile1.friends.add(self.profile2)
+        self.profile2.friends.add(self.profile3)
+        self.profile1.following.add(self.profile2)
+        self.profile4.following.add(self.profile2)
+        recommendations.compute_for(self.profile1)
+        ranked = list(self.profile1.friend_recommendations.values_list('candidate_id', 'mutual_friends', 'shared_following'))
+        self.assertEqual(ranked, [(self.profile3.id, 1, 0), (self.profile4.id, 0, 1)])
+
+    def test_vista_amigos_usa_recomendaciones(self):
+        """friends_view muestra primero los candidatos precalculados y nunca a los amigos."""
+        self.profile1.friends.add(self.profile2)
+        self.profile2.friends.add(self.profile3)
+        recommendations.compute_for(self.profile1)
+        self.client.login(username='usuario1', password='testpass123')
+        response = self.client.get(reverse('funATIAPP:friends'))
+        shown = [profile.id for profile in response.context['recommendations']]
+        self.assertEqual(shown[0], self.profile3.id)
+        self.assertNotIn(self.profile2.id, shown)
+        self.assertNotIn(self.profile1.id, shown)
+
+    def test_comando_calcula_todos_los_perfiles(self):
+        """compute_friend_recommendations recorre los perfiles por lotes."""
+        self.profile1.friends.add(self.profile2)
+        self.profile2.friends.add(self.profile3)
+        out = StringIO()
+        call_command('compute_friend_recommendations', batch_size=2, stdout=out)
+        self.assertIn('4 perfiles', out.getvalue())
+        self.assertTrue(self.profile3.friend_recommendations.filter(candidate=self.profile1).exists())
+
+    def test_cambio_de_amistad_recalcula_a_los_amigos(self):
+        """Los amigos de los dos perfiles también ven el nuevo amigo en común."""
+        self.profile2.friends.add(self.profile3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile1.friends.add(self.profile2)
+        self.assertTrue(self.profile3.friend_recommendations.filter(candidate=self.profile1).exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile1.friends.remove(self.profile2)
+        self.assertFalse(self.profile3.friend_recommendations.filter(candidate=self.profile1).exists())
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class BandejaConversacionesTest(TestCase):
+    def setUp(self):
+        self.user1, self.profile1 = create_test_user('usuario1', 'user1@example.com', 'testpass123')
+        self.user2, self.profile2 = create_test_user('usuario2', 'user2@example.com', 'testpass123')
+        self.user3, self.profile3 = create_test_user('usuario3', 'user3@example.com', 'testpass123')
+        self.profile1.friends.add(self.profile2, self.profile3)
+
+    def test_mensajes_actualizan_conversacion(self):
+        """Cada mensaje mueve el puntero al último mensaje y suma no leídos al receptor."""
+        Message.objects.create(sender=self.user2, receiver=self.user1, content='Hola')
+        last = Message.objects.create(sender=self.user2, receiver=self.user1, content='¿Qué tal?')
+        conversation = Conversation.objects.get()
+        self.assertEqual(conversation.last_message, last)
+        self.assertEqual(conversation.unread_for(self.user1), 2)
+        self.assertEqual(conversation.unread_for(self.user2), 0)
+        Conversation.mark_read(self.user1, self.user2)
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.unread_for(self.user1), 0)
+        last.delete()
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.last_message.content, 'Hola')
+
+    def test_bandeja_ordenada_con_consultas_constantes(self):
+        """La bandeja ordena por actividad y no consulta una vez por amigo."""
+        Message.objects.create(sender=self.user2, receiver=self.user1, content='Antes')
+        Message.objects.create(sender=self.user3, receiver=self.user1, content='Después')
+        self.client.login(username='usuario1', password='testpass123')
+        response = self.client.get(reverse('funATIAPP:chats'))
+        inbox = response.context['friends_with_messages']
+        self.assertEqual([item['friend'] for item in inbox], [self.profile3, self.profile2])
+        self.assertEqual(inbox[0]['unread'], 1)
+        with self.assertNumQueries(2):
+            views.get_inbox(self.user1)
+
+    def test_bandeja_sin_actividad_al_final(self):
+        """Los amigos sin conversación quedan detrás de los que tienen mensajes."""
+        Message.objects.create(sender=self.user3, receiver=self.user1, content='Hola')
+        inbox = views.get_inbox(self.user1)
+        self.assertEqual([item['friend'] for item in inbox], [self.profile3, self.profile2])
+        self.assertIsNone(inbox[1]['last_activity_at'])
+
+    def test_marcar_leidos_descuenta_solo_los_marcados(self):
+        """Un mensaje registrado que mark_read no llegó a marcar sigue contando como no leído."""
+        Message.objects.create(sender=self.user2, receiver=self.user1, content='Hola')
+        conversation = Conversation.objects.get()
+        field = Conversation.unread_field(self.user1.id, self.user2.id)
+        Conversation.objects.filter(pk=conversation.pk).update(**{field: F(field) + 1})
+        self.assertEqual(Conversation.mark_read(self.user1, self.user2), 1)
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.unread_for(self.user1), 1)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class HistorialChatTest(TestCase):
+    def setUp(self):
+        self.user1, self.profile1 = create_test_user('usuario1', 'user1@example.com', 'testpass123')
+        self.user2, self.profile2 = create_test_user('usuario2', 'user2@example.com', 'testpass123')
+        self.profile1.friends.add(self.profile2)
+        self.messages = [
+            Message.objects.create(sender=self.user1 if i % 2 else self.user2, receiver=self.user2 if i % 2 else self.user1, content=f'Mensaje {i}')
+            for i in range(7)
+        ]
+        self.client.login(username='usuario1', password='testpass123')
+        self.url = reverse('funATIAPP:get_messages_api', args=[self.profile2.id])
+
+    def ids(self, response):
+        return [int(message['id']) for message in response.json()['messages']]
+
+    @override_settings(CHAT_HISTORY_PAGE_SIZE=3)
+    def test_historial_por_cursor(self):
+        """Sin cursor se devuelven los más recientes; before y after paginan en orden cronológico."""
+        all_ids = [message.id for message in self.messages]
+        self.assertEqual(self.messages[0].conversation_key, f'{self.user1.id}_{self.user2.id}')
+        response = self.client.get(self.url)
+        self.assertEqual(self.ids(response), all_ids[-3:])
+        self.assertTrue(response.json()['has_more'])
+        response = self.client.get(self.url, {'before': all_ids[-3]})
+        self.assertEqual(self.ids(response), all_ids[1:4])
+        response = self.client.get(self.url, {'before': all_ids[1]})
+        self.assertEqual(self.ids(response), all_ids[:1])
+        self.assertFalse(response.json()['has_more'])
+        response = self.client.get(self.url, {'after': all_ids[4]})
+        self.assertEqual(self.ids(response), all_ids[5:])
+        self.assertFalse(response.json()['has_more'])
+
+    def test_cursor_invalido(self):
+        response = self.client.get(self.url, {'before': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class EscrituraDiferidaTest(TestCase):
+    def setUp(self):
+        self.user1, self.profile1 = create_test_user('usuario1', 'user1@example.com', 'testpass123')
+        self.user2, self.profile2 = create_test_user('usuario2', 'user2@example.com', 'testpass123')
+
+    @override_settings(CHAT_WRITE_BEHIND={'ENABLED': True, 'FLUSH_INTERVAL': 60})
+    def test_lote_se_escribe_con_ids_asignados(self):
+        """Los mensajes del búfer se insertan en lote con sus ids y actualizan la conversación."""
+        writer = message_writer.MessageWriter()
+
+        async def send_and_flush():
+            first = await writer.submit(self.user1.id, self.user2.id, 'Hola')
+            second = await writer.submit(self.user1.id, self.user2.id, '¿Estás?')
+            await writer.flush()
+            return first, second
+
+        first, second = async_to_sync(send_and_flush)()
+        self.assertLess(first['id'], second['id'])
+        messages = Message.objects.between(self.user1, self.user2).order_by('id')
+        self.assertEqual([message.id for message in messages], [first['id'], second['id']])
+        conversation = Conversation.objects.get()
+        self.assertEqual(conversation.last_message_id, second['id'])
+        self.assertEqual(conversation.unread_for(self.user2), 2)
+
+    @override_settings(CHAT_WRITE_BEHIND={'ENABLED': True, 'FLUSH_INTERVAL': 60, 'RETRY_DELAY': 0, 'MAX_RETRIES': 3})
+    def test_lote_fallido_se_reintenta(self):
+        """Un lote que falla vuelve al búfer y se escribe en el siguiente intento."""
+        writer = message_writer.MessageWriter()
+        real_write_batch = message_writer.write_batch
+        calls = []
+
+        def locked_once(messages):
+            calls.append(len(messages))
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            real_write_batch(messages)
+
+        with mock.patch.object(message_writer, 'write_batch', side_effect=locked_once):
+            async def send_and_flush():
+                sent = await writer.submit(self.user1.id, self.user2.id, 'Hola')
+                await writer.flush()
+                return sent
+
+            sent = async_to_sync(send_and_flush)()
+        self.assertEqual(calls, [1, 1])
+        self.assertTrue(Message.objects.filter(id=sent['id']).exists())
+
+        # Tras MAX_RETRIES intentos el lote se descarta y se registran sus ids
+        with mock.patch.object(message_writer, 'write_batch', side_effect=OperationalError('database is locked')):
+            async def send_and_fail():
+                sent = await writer.submit(self.user1.id, self.user2.id, 'Perdido')
+                await writer.flush()
+                return sent
+
+            with self.assertLogs('funATIAPP.message_writer', 'ERROR') as logs:
+                lost = async_to_sync(send_and_fail)()
+        self.assertIn(str(lost['id']), logs.output[0])
+        self.assertEqual(writer._pending, [])
+
+    @override_settings(CHAT_WRITE_BEHIND={'ENABLED': True, 'FLUSH_INTERVAL': 60})
+    def test_mismo_origen_de_ids_para_todos_los_mensajes(self):
+        """Con escritura diferida, los mensajes insertados directamente usan los mismos ids ordenados que el búfer."""
+        first = Message.objects.create(sender=self.user1, receiver=self.user2, content='Hola')
+        second = Message.objects.create(sender=self.user2, receiver=self.user1, content='Hola')
+        self.assertGreater(first.id, 1 << 22)
+        self.assertLess(first.id, second.id)
+        with override_settings(MESSAGE_WORKER_ID=5000):
+            with self.assertRaises(ImproperlyConfigured):
+                Message.objects.create(sender=self.user1, receiver=self.user2, content='Hola')
+
+    def test_ids_autoincrementales_sin_escritura_diferida(self):
+        first = Message.objects.create(sender=self.user1, receiver=self.user2, content='Hola')
+        self.assertLess(first.id, 1 << 22)
+
+    @override_settings(CHAT_WRITE_BEHIND={'ENABLED': True, 'FLUSH_INTERVAL': 60})
+    def test_ids_grandes_se_envian_como_cadenas(self):
+        """Los ids por encima de 2**53 llegan intactos al cliente y sirven de cursor."""
+        self.profile1.friends.add(self.profile2)
+        messages = [Message.objects.create(sender=self.user2, receiver=self.user1, content=f'Mensaje {i}') for i in range(3)]
+        self.assertGreater(messages[0].id, 2 ** 53)
+        self.client.login(username='usuario1', password='testpass123')
+        url = reverse('funATIAPP:get_messages_api', args=[self.profile2.id])
+        response = self.client.get(url, {'before': str(messages[2].id)})
+        self.assertEqual([message['id'] for message in response.json()['messages']], [str(messages[0].id), str(messages[1].id)])
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class SalaChatTest(TestCase):
+    def setUp(self):
+        self.user1, self.profile1 = create_test_user('usuario1', 'user1@example.com', 'testpass123')
+        self.user2, self.profile2 = create_test_user('usuario2', 'user2@example.com', 'testpass123')
+        self.user3, self.profile3 = create_test_user('usuario3', 'user3@example.com', 'testpass123')
+        self.profile1.friends.add(self.profile2)
+        self.room = Message.conversation_key_for(self.user1.id, self.user2.id)
+
+    def communicator(self, user, room):
+        communicator = WebsocketCommunicator(URLRouter(routing.websocket_urlpatterns), f'/ws/chat/{room}/')
+        communicator.scope['user'] = user
+        return communicator
+
+    def test_solo_miembros_amigos_se_conectan(self):
+        """Un usuario ajeno a la sala, o sin amistad, es rechazado al conectar."""
+        async def connect(user, room):
+            communicator = self.communicator(user, room)
+            connected, _ = await communicator.connect()
+            await communicator.disconnect()
+            return connected
+
+        self.assertTrue(async_to_sync(connect)(self.user1, self.room))
+        self.assertFalse(async_to_sync(connect)(self.user3, self.room))
+        self.assertFalse(async_to_sync(connect)(self.user1, Message.conversation_key_for(self.user1.id, self.user3.id)))
+
+    def test_mensaje_al_otro_miembro_y_revocacion(self):
+        """El receptor sale de la sala y el fin de la amistad cierra la conexión."""
+        async def chat():
+            communicator = self.communicator(self.user1, self.room)
+            await communicator.connect()
+            await communicator.send_json_to({'message': 'Hola', 'receiver_id': self.user3.id})
+            received = await communicator.receive_json_from()
+            await database_sync_to_async(realtime.revoke_chat_membership)(self.user2.id, [self.user1.id])
+            error = await communicator.receive_json_from()
+            closed = await communicator.receive_output()
+            await communicator.wait()
+            return received, error, closed
+
+        received, error, closed = async_to_sync(chat)()
+        self.assertEqual(Message.objects.get(id=received['message_id']).receiver, self.user2)
+        self.assertEqual(error['type'], 'error')
+        self.assertEqual(closed['type'], 'websocket.close')
+
+    def test_grupo_de_usuario_recibe_resumen(self):
+        """Las otras conexiones del usuario reciben el resumen de la conversación."""
+        Message.objects.create(sender=self.user1, receiver=self.user2, content='Hola')
+
+        async def inbox():
+            communicator = WebsocketCommunicator(URLRouter(routing.websocket_urlpatterns), '/ws/inbox/')
+            communicator.scope['user'] = self.user2
+            await communicator.connect()
+            await database_sync_to_async(realtime.publish_conversation)(self.user1.id, self.user2.id)
+            update = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return update
+
+        update = async_to_sync(inbox)()
+        self.assertEqual(update['type'], 'inbox')
+        self.assertEqual(update['conversation']['peer_user_id'], self.user1.id)
+        self.assertEqual(update['conversation']['unread_count'], 1)
+        self.assertEqual(update['conversation']['last_message']['content'], 'Hola')
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class NotificacionesTiempoRealTest(TestCase):
+    def setUp(self):
+        self.user1, self.profile1 = create_test_user('usuario1', 'user1@example.com', 'testpass123')
+        self.user2, self.profile2 = create_test_user('usuario2', 'user2@example.com', 'testpass123')
+
+    def test_notificacion_nueva_llega_a_la_sesion(self):
+        """Al conectar se recibe el contador y luego cada notificación renderizada."""
+        self.profile1.following.add(self.profile2)
+        notification = Notification.objects.get(recipient=self.user2)
+
+        async def listen():
+            communicator = WebsocketCommunicator(URLRouter(routing.websocket_urlpatterns), '/ws/notifications/')
+            communicator.scope['user'] = self.user2
+            await communicator.connect()
+            initial = await communicator.receive_json_from()
+            await database_sync_to_async(realtime.publish_notification)(notification.id)
+            pushed = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return initial, pushed
+
+        initial, pushed = async_to_sync(listen)()
+        self.assertEqual(initial, {'type': 'notification_unread', 'unread_count': 1})
+        self.assertEqual(pushed['notification']['id'], notification.id)
+        self.assertIn('usuario1', pushed['notification']['html'])
+        self.assertEqual(pushed['unread_count'], 1)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ColaCorreosTest(TestCase):
+    def setUp(self):
+        self.user1, self.profile1 = create_test_user('usuario1', 'user1@example.com', 'testpass123')
+        self.user2, self.profile2 = create_test_user('usuario2', 'user2@example.com', 'testpass123')
+
+    def test_notificacion_encola_y_worker_envia(self):
+        """La notificación solo encola el correo; el comando lo envía y registra el estado."""
+        # El correo se encola al confirmar la transacción
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile1.following.add(self.profile2)
+        self.assertEqual(len(mail.outbox), 0)
+        email = EmailOutbox.objects.get()
+        self.assertEqual(email.to_email, 'user2@example.com')
+        call_command('send_queued_emails', once=True, stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        email.refresh_from_db()
+        self.assertEqual(email.status, EmailOutbox.SENT)
+
+    @override_settings(EMAIL_BACKEND='funATIAPP.tests.FailingEmailBackend')
+    def test_fallo_se_reintenta_con_espera(self):
+        """Un envío fallido vuelve a la cola con espera exponencial."""
+        email = outbox.enqueue('user2@example.com', 'Asunto', 'Cuerpo')
+        self.assertEqual(outbox.deliver_batch(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual(email.status, EmailOutbox.PENDING)
+        self.assertEqual(email.attempts, 1)
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertEqual(outbox.deliver_batch(), (0, 0))
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise ConnectionRefusedError('SMTP no disponible')
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ResumenNotificacionesTest(TestCase):
+    def setUp(self):
+        self.user1, self.profile1 = create_test_user('usuario1', 'user1@example.com', 'testpass123')
+        self.user2, self.profile2 = create_test_user('usuario2', 'user2@example.com', 'testpass123')
+        self.user3, self.profile3 = create_test_user('usuario3', 'user3@example.com', 'testpass123')
+        UserSettings.objects.filter(user=self.user3).update(email_delivery='cada_hora')
+
+    def test_resumen_agrupa_por_destinatario(self):
+        """Con resumen por hora no se encola nada por evento y luego sale un solo correo."""
+        self.profile1.following.add(self.profile3)
+        self.profile2.following.add(self.profile3)
+        publication = Publication.objects.create(profile=self.profile3, content='Publicación')
+        Comment.objects.create(publication=publication, user=self.user1, content='Buen post')
+        self.assertFalse(EmailOutbox.objects.exists())
+
+        out = StringIO()
+        call_command('send_notification_digests', frequency='cada_hora', stdout=out)
+        email = EmailOutbox.objects.get()
+        self.assertEqual(email.to_email, 'user3@example.com')
+        # Los dos seguimientos se agruparon en una sola notificación
+        self.assertIn('2 nuevos seguidores: usuario2 y 1 más', email.body)
+        self.assertIn('Buen post', email.body)
+        self.assertFalse(Notification.objects.filter(recipient=self.user3, emailed=False).exists())
+
+        call_command('send_notification_digests', frequency='cada_hora', stdout=out)
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+
+    def test_secciones_y_asunto_cuentan_igual(self):
+        """Los amigos agrupados cuentan por actor, como el asunto."""
+        notifications = [
+            Notification(recipient=self.user3, sender=self.user1, notification_type='friend', actor_count=2),
+            Notification(recipient=self.user3, sender=self.user2, notification_type='follow'),
+        ]
+        subject, body = digest.build_digest(self.user3, notifications)
+        self.assertIn('3 notificaciones nuevas', subject)
+        self.assertIn('2 nuevos amigos: usuario1 y 1 más', body)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class AgrupacionNotificacionesTest(TestCase):
+    def setUp(self):
+        self.user1, self.profile1 = create_test_user('usuario1', 'user1@example.com', 'testpass123')
+        self.user2, self.profile2 = create_test_user('usuario2', 'user2@example.com', 'testpass123')
+        self.user3, self.profile3 = create_test_user('usuario3', 'user3@example.com', 'testpass123')
+        self.client = Client()
+
+    def test_seguimientos_en_rafaga_se_agrupan(self):
+        """Los seguimientos dentro de la ventana actualizan una sola notificación."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile1.following.add(self.profile3)
+            self.profile2.following.add(self.profile3)
+
+        notification = Notification.objects.get(recipient=self.user3)
+        self.assertEqual(notification.actor_count, 2)
+        self.assertEqual(notification.sender, self.user2)
+        # Solo el primer seguimiento envía correo inmediato
+        self.assertEqual(EmailOutbox.objects.filter(to_email='user3@example.com').count(), 1)
+        # y el grupo no queda pendiente para el resumen horario
+        self.assertTrue(notification.emailed)
+
+        # Dejar de seguir y volver a seguir no suma otro actor
+        self.profile1.following.remove(self.profile3)
+        self.profile1.following.add(self.profile3)
+        notification.refresh_from_db()
+        self.assertEqual(notification.actor_count, 2)
+
+        self.client.login(username='usuario3', password='testpass123')
+        response = self.client.get(reverse('funATIAPP:notifications'))
+        self.assertContains(response, 'y 1 persona más te están siguiendo')
+
+        # Una vez leída, el siguiente seguimiento abre un grupo nuevo
+        self.profile1.following.remove(self.profile3)
+        self.profile1.following.add(self.profile3)
+        self.assertEqual(Notification.objects.filter(recipient=self.user3).count(), 2)
+
+    def test_comentarios_agrupados_por_publicacion(self):
+        """Varios comentarios del mismo usuario cuentan como un actor."""
+        publication = Publication.objects.create(profile=self.profile3, content='Publicación')
+        other = Publication.objects.create(profile=self.profile3, content='Otra')
+        Comment.objects.create(publication=publication, user=self.user1, content='Primero')
+        Comment.objects.create(publication=publication, user=self.user1, content='Segundo')
+        last = Comment.objects.create(publication=publication, user=self.user2, content='Tercero')
+        Comment.objects.create(publication=other, user=self.user1, content='En otra')
+
+        grouped = Notification.objects.get(recipient=self.user3, publication=publication)
+        self.assertEqual(grouped.actor_count, 2)
+        self.assertEqual(grouped.comment, last)
+        self.assertEqual(Notification.objects.filter(recipient=self.user3).count(), 2)
+
+    def test_actores_nuevos_pendientes_solo_con_resumen(self):
+        """Con resumen por hora, el grupo reabierto vuelve a quedar pendiente de correo."""
+        UserSettings.objects.filter(user=self.user3).update(email_delivery='cada_hora')
+        settings_cache.invalidate(self.user3.id)
+        self.profile1.following.add(self.profile3)
+        Notification.objects.update(emailed=True)
+        self.profile2.following.add(self.profile3)
+        self.assertFalse(Notification.objects.get(recipient=self.user3).emailed)
+
+    @override_settings(NOTIFICATION_COALESCE_WINDOW=0)
+    def test_fuera_de_la_ventana_no_se_agrupan(self):
+        self.profile1.following.add(self.profile3)
+        Notification.objects.update(updated_at=timezone.now() - timedelta(seconds=1))
+        self.profile2.following.add(self.profile3)
+        self.assertEqual(Notification.objects.filter(recipient=self.user3).count(), 2)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class NotificacionesEnBloqueTest(TestCase):
+    def setUp(self):
+        self.user1, self.profile1 = create_test_user('usuario1', 'user1@example.com', 'testpass123')
+        self.others = [
+            create_test_user(f'otro{i}', f'otro{i}@example.com', 'testpass123')[1]
+            for i in range(4)
+        ]
+
+    def _notification_queries(self, add, *profiles):
+        with CaptureQueriesContext(connection) as context:
+            add(*profiles)
+        return [query for query in context.captured_queries if 'funATIAPP_notification' in query['sql']]
+
+    def test_seguir_en_bloque_con_consultas_constantes(self):
+        """Un add() con varios perfiles no hace consultas de notificaciones por perfil."""
+        with self.captureOnCommitCallbacks() as callbacks:
+            single = self._notification_queries(self.profile1.following.add, self.others[0])
+            several = self._notification_queries(self.profile1.following.add, *self.others[1:])
+        self.assertEqual(len(single), len(several))
+        self.assertEqual(Notification.objects.filter(sender=self.user1, notification_type='follow').count(), 4)
+
+        # Los correos se encolan al confirmar, en un solo INSERT
+        self.assertFalse(EmailOutbox.objects.exists())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(EmailOutbox.objects.count(), 4)
+
+    def test_seguidores_en_bloque_en_una_notificacion(self):
+        """Varios seguidores añadidos a la vez comparten una notificación, con consultas constantes."""
+        other_user, other_profile = create_test_user('usuario2', 'user2@example.com', 'testpass123')
+        single = self._notification_queries(other_profile.followers.add, self.others[0])
+        several = self._notification_queries(self.profile1.followers.add, *self.others)
+        self.assertEqual(len(single), len(several))
+        notification = Notification.objects.get(recipient=self.user1)
+        self.assertEqual(notification.actor_count, 4)
+        self.assertEqual(UnreadCounter.for_user(self.user1.id).notifications, 1)
+
+    def test_amistad_en_bloque_sin_duplicados(self):
+        friends = self.profile1.friends.add
+        single = self._notification_queries(friends, self.others[0])
+        several = self._notification_queries(friends, *self.others)
+        self.assertEqual(len(single), len(several))
+        self.assertEqual(Notification.objects.filter(sender=self.user1, notification_type='friend').count(), 4)
+
+    def _feed_queries(self, change, *profiles):
+        with CaptureQueriesContext(connection) as context:
+            change(*profiles)
+        return [query for query in context.captured_queries if 'funATIAPP_feedentry' in query['sql']]
+
+    def test_feed_en_bloque_con_consultas_constantes(self):
+        """Los feeds se reconcilian por pk_set, no con consultas por perfil."""
+        for profile in self.others:
+            Publication.objects.create(profile=profile, content='Hola')
+        single = self._feed_queries(self.profile1.following.add, self.others[0])
+        several = self._feed_queries(self.profile1.following.add, *self.others[1:])
+        self.assertEqual(len(single), len(several))
+        self.assertEqual(feed.feed_for(self.profile1).count(), 4)
+        single = self._feed_queries(self.profile1.followers.add, self.others[0])
+        several = self._feed_queries(self.profile1.followers.add, *self.others[1:])
+        self.assertEqual(len(single), len(several))
+        self.assertEqual(len(self._feed_queries(self.profile1.following.remove, *self.others)), 1)
+        self.assertFalse(feed.feed_for(self.profile1).exists())
+
+    def test_eliminar_amigo_envia_un_solo_post_remove(self):
+        self.profile1.friends.add(self.others[0])
+        self.client.login(username='usuario1', password='testpass123')
+        actions = []
+
+        def record(sender, action, **kwargs):
+            actions.append(action)
+
+        m2m_changed.connect(record, sender=Profile.friends.through)
+        try:
+            self.client.post(reverse('funATIAPP:friends'), {'remove_friend': self.others[0].id})
+        finally:
+            m2m_changed.disconnect(record, sender=Profile.friends.through)
+        self.assertEqual(actions.count('post_remove'), 1)
+        self.assertFalse(Profile.friends.through.objects.exists())
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ContadoresNoLeidosTest(TestCase):
+    def setUp(self):
+        self.user1, self.profile1 = create_test_user('usuario1', 'user1@example.com', 'testpass123')
+        self.user2, self.profile2 = create_test_user('usuario2', 'user2@example.com', 'testpass123')
+        self.profile1.friends.add(self.profile2)
+        self.client = Client()
+        self.client.login(username='usuario2', password='testpass123')
+
+    def counts(self):
+        return self.client.get(reverse('funATIAPP:unread_counts_api')).json()
+
+    def test_contadores_siguen_notificaciones_y_mensajes(self):
+        self.assertEqual(self.counts(), {'notifications': 1, 'messages': 0})
+        first = Message.objects.create(sender=self.user1, receiver=self.user2, content='Hola')
+        Message.objects.create(sender=self.user1, receiver=self.user2, content='¿Estás?')
+        self.assertEqual(self.counts(), {'notifications': 1, 'messages': 2})
+
+        first.delete()
+        self.assertEqual(self.counts()['messages'], 1)
+        Conversation.mark_read(self.user2, self.user1)
+        self.client.get(reverse('funATIAPP:notifications'))
+        self.assertEqual(self.counts(), {'notifications': 0, 'messages': 0})
+        self.assertEqual(UnreadCounter.objects.get(user=self.user2).notifications, 0)
+
+    def test_leer_notificaciones_resta_solo_las_marcadas(self):
+        """Una notificación contada pero no marcada como leída sigue en el contador."""
+        # Como si llegara otra entre el UPDATE de leídas y el del contador
+        UnreadCounter.add(self.user2.id, notifications=1)
+        self.client.get(reverse('funATIAPP:notifications'))
+        self.assertEqual(self.counts()['notifications'], 1)
+
+    def test_menu_sin_consultas_agregadas(self):
+        """El menú lee los contadores por clave primaria, sin COUNT."""
+        Message.objects.create(sender=self.user1, receiver=self.user2, content='Hola')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('funATIAPP:settings'))
+        self.assertContains(response, 'id="messages-badge" >1<')
+        self.assertFalse([query for query in context.captured_queries if 'COUNT(' in query['sql']])
+
+    def test_fila_faltante_se_recalcula(self):
+        UnreadCounter.objects.filter(user=self.user2).delete()
+        Message.objects.create(sender=self.user1, receiver=self.user2, content='Hola')
+        counter = UnreadCounter.objects.get(user=self.user2)
+        self.assertEqual((counter.notifications, counter.messages), (1, 1))
+
+
+def image_bytes(size, format='JPEG', **save_options):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'pink').save(buffer, format=format, **save_options)
+    return buffer.getvalue()
+
+
+class VersionesImagenesTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.user1, self.profile1 = create_test_user('usuario1', 'user1@example.com', 'testpass123')
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_versiones_webp_sin_metadatos(self):
+        exif = Image.Exif()
+        exif[0x010F] = 'Camara'
+        self.profile1.avatar.save('foto.jpg', ContentFile(image_bytes((1200, 900), exif=exif)))
+        self.assertEqual(list(renditions.pending('avatar')), [self.profile1])
+
+        call_command('process_renditions', once=True, stdout=StringIO())
+        self.profile1.refresh_from_db()
+        thumb = renditions.get(self.profile1, 'avatar', 'thumb')
+        self.assertEqual((thumb['width'], thumb['height']), (96, 72))
+        self.assertEqual(renditions.get(self.profile1, 'avatar', 'full')['width'], 800)
+        with default_storage.open(thumb['name']) as f, Image.open(f) as image:
+            self.assertEqual(image.format, 'WEBP')
+            self.assertNotIn('exif', image.info)
+
+        html = Template("{% load renditions %}{% rendition profile 'avatar' 'thumb' alt='a' class='post-avatar' %}").render(
+            Context({'profile': self.profile1})
+        )
+        self.assertIn('_thumb.webp', html)
+        self.assertIn('width="96"', html)
+        self.assertIn('height="72"', html)
+
+        # Un avatar nuevo invalida las versiones y vuelve a quedar pendiente
+        self.profile1.avatar.save('otra.png', ContentFile(image_bytes((50, 50), format='PNG')))
+        self.assertEqual(self.profile1.avatar_renditions, {})
+        self.assertEqual(renditions.url(self.profile1, 'avatar', 'thumb'), self.profile1.avatar.url)
+
+    def test_archivos_que_no_son_imagen_se_sirven_tal_cual(self):
+        publication = Publication.objects.create(profile=self.profile1, content='Video')
+        publication.media.save('clip.mp4', ContentFile(b'no es una imagen'))
+        renditions.process_pending()
+        publication.refresh_from_db()
+        self.assertEqual(publication.media_renditions, {'source': publication.media.name})
+        self.assertFalse(renditions.pending('media').exists())
+        self.assertEqual(renditions.url(publication, 'media', 'card'), publication.media.url)
+
+
+class SubidasPorPartesTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            CHUNKED_UPLOADS={
+                'CHUNK_SIZE': 1024,
+                'MAX_SIZE': {'image': 4096, 'video': 8192},
+                'EXPIRE_HOURS': 24,
+                'TEMP_DIR': os.path.join(self.media_root, 'parts'),
+            },
+        )
+        self.override.enable()
+        self.user1, self.profile1 = create_test_user('usuario1', 'user1@example.com', 'testpass123')
+        self.user2, self.profile2 = create_test_user('usuario2', 'user2@example.com', 'testpass123')
+        self.profile1.friends.add(self.profile2)
+        self.client = Client()
+        self.client.login(username='usuario1', password='testpass123')
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def start(self, filename, size, purpose='message'):
+        return self.client.post(reverse('funATIAPP:create_upload_api'), {
+            'filename': filename, 'size': size, 'purpose': purpose,
+        })
+
+    def send(self, upload_id, offset, data):
+        return self.client.patch(
+            reverse('funATIAPP:upload_api', args=[upload_id]), data,
+            content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_limites_antes_de_recibir_datos(self):
+        self.assertEqual(self.start('foto.jpg', 5000).status_code, 413)
+        self.assertEqual(self.start('script.exe', 10).status_code, 400)
+        self.assertEqual(self.start('clip.mp4', 5000).status_code, 201)
+        self.assertEqual(UploadSession.objects.count(), 1)
+
+    def test_subida_reanudable_y_adjunta_al_mensaje(self):
+        content = bytes(range(256)) * 6
+        upload_id = self.start('clip.mp4', len(content)).json()['upload_id']
+        self.assertEqual(self.send(upload_id, 0, content[:1024]).json()['offset'], 1024)
+
+        # Una parte repetida o fuera de orden se rechaza con el offset correcto
+        response = self.send(upload_id, 0, content[:1024])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 1024)
+
+        # Corte a mitad de parte: la parte se descarta y se repite entera
+        session = UploadSession.objects.get(pk=upload_id)
+        with self.assertRaises(uploads.UploadError) as error:
+            uploads.write_chunk(session, 1024, 300, BytesIO(content[1024:1124]))
+        self.assertEqual(error.exception.status, 409)
+        resumed = self.client.get(reverse('funATIAPP:upload_api', args=[upload_id])).json()
+        self.assertEqual(resumed['offset'], 1024)
+        self.assertEqual(os.path.getsize(uploads.session_path(session)), 1024)
+        self.assertEqual(self.send(upload_id, 1024, content[1024:]).json()['status'], UploadSession.COMPLETE)
+
+        response = self.client.post(reverse('funATIAPP:send_message_api'), {
+            'receiver_id': self.profile2.id, 'upload_id': upload_id,
+        })
+        self.assertTrue(response.json()['success'])
+        message = Message.objects.get(sender=self.user1)
+        with message.media.open('rb') as f:
+            self.assertEqual(f.read(), content)
+
+        # El handle solo se puede usar una vez
+        response = self.client.post(reverse('funATIAPP:send_message_api'), {
+            'receiver_id': self.profile2.id, 'upload_id': upload_id,
+        })
+        self.assertEqual(response.status_code, 409)
+
+    def test_publicacion_con_subida_de_otro_usuario(self):
+        content = image_bytes((20, 20))
+        upload_id = self.start('foto.jpg', len(content), purpose='publication').json()['upload_id']
+        self.send(upload_id, 0, content)
+        other = Client()
+        other.login(username='usuario2', password='testpass123')
+        response = other.post(reverse('funATIAPP:muro'), {'content': 'Hola', 'upload_id': upload_id},
+                              HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post(reverse('funATIAPP:muro'), {'content': 'Hola', 'upload_id': upload_id},
+                                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Publication.objects.get(profile=self.profile1).media.name.startswith('content/'))
+
+
+class AlmacenamientoPorContenidoTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.user1, self.profile1 = create_test_user('usuario1', 'user1@example.com', 'testpass123')
+        self.user2, self.profile2 = create_test_user('usuario2', 'user2@example.com', 'testpass123')
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_mismo_contenido_se_guarda_una_vez(self):
+        content = image_bytes((40, 40))
+        self.profile1.avatar.save('meme.jpg', ContentFile(content))
+        publication = Publication.objects.create(profile=self.profile2, content='Meme')
+        publication.media.save('otro-nombre.JPG', ContentFile(content))
+
+        name = self.profile1.avatar.name
+        self.assertTrue(name.startswith('content/'))
+        self.assertEqual(publication.media.name, name)
+        self.assertEqual(StoredFile.objects.get(name=name).ref_count, 2)
+        self.assertEqual(len(os.listdir(os.path.dirname(self.profile1.avatar.path))), 1)
+
+        # Con otro uso vivo el archivo se conserva; con el último, se borra
+        with self.captureOnCommitCallbacks(execute=True):
+            publication.delete()
+        self.assertEqual(StoredFile.objects.get(name=name).ref_count, 1)
+        self.assertTrue(default_storage.exists(name))
+        old = time.time() - 3600
+        os.utime(self.profile1.avatar.path, (old, old))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile1.avatar = None
+            self.profile1.save()
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+        self.assertFalse(default_storage.exists(name))
+
+    def test_archivo_reutilizado_sin_confirmar_no_se_borra(self):
+        """Un archivo recién reutilizado sobrevive al borrado del último uso anterior."""
+        content = image_bytes((40, 40))
+        self.profile1.avatar.save('meme.jpg', ContentFile(content))
+        name = self.profile1.avatar.name
+        old = time.time() - 3600
+        os.utime(self.profile1.avatar.path, (old, old))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.profile1.avatar = None
+            self.profile1.save()
+        # Otra subida idéntica reutiliza el archivo antes de que corra el borrado
+        self.assertEqual(storage.content_storage().save('otra.jpg', ContentFile(content)), name)
+        for callback in callbacks:
+            callback()
+        self.assertTrue(default_storage.exists(name))
+
+    def test_versiones_reutilizadas_para_el_mismo_archivo(self):
+        content = image_bytes((400, 300))
+        self.profile1.avatar.save('a.jpg', ContentFile(content))
+        call_command('process_renditions', once=True, stdout=StringIO())
+        self.profile2.avatar.save('b.jpg', ContentFile(content))
+        self.profile2.refresh_from_db()
+        self.assertEqual(self.profile2.avatar_renditions, {})
+
+        call_command('process_renditions', once=True, stdout=StringIO())
+        self.profile1.refresh_from_db()
+        self.profile2.refresh_from_db()
+        self.assertEqual(self.profile2.avatar_renditions, self.profile1.avatar_renditions)
+
+
+class ArchivosHuerfanosTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.user1, self.profile1 = create_test_user('usuario1', 'user1@example.com', 'testpass123')
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def write(self, name, age_hours=48):
+        path = default_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'x' * 10)
+        old = time.time() - age_hours * 3600
+        os.utime(path, (old, old))
+        return name
+
+    def test_borra_solo_archivos_sin_referencias(self):
+        Profile.objects.filter(pk=self.profile1.pk).update(
+            avatar=self.write('avatars/actual.jpg'),
+            avatar_renditions={'source': 'avatars/actual.jpg', 'thumb': {'name': self.write('renditions/avatars/actual_thumb.webp')}},
+        )
+        publication = Publication.objects.create(profile=self.profile1, content='Foto')
+        Publication.objects.filter(pk=publication.pk).update(media=self.write('media/foto.jpg'))
+        old_avatar = self.write('avatars/anterior.jpg')
+        old_rendition = self.write('renditions/avatars/anterior_thumb.webp')
+        recent = self.write('chat_media/subiendo.mp4', age_hours=1)
+        self.write('content/.incoming/tmp.part')
+
+        out = StringIO()
+        call_command('collect_orphan_media', dry_run=True, batch_size=2, stdout=out)
+        self.assertIn(old_avatar, out.getvalue())
+        self.assertIn(old_rendition, out.getvalue())
+        self.assertIn('Huérfanos encontrados: 2', out.getvalue())
+        self.assertTrue(default_storage.exists(old_avatar))
+
+        quarantine = os.path.join(self.media_root, 'cuarentena')
+        call_command('collect_orphan_media', quarantine=quarantine, batch_size=2, stdout=StringIO())
+        self.assertFalse(default_storage.exists(old_avatar))
+        self.assertTrue(os.path.exists(os.path.join(quarantine, old_avatar)))
+        for name in ['avatars/actual.jpg', 'renditions/avatars/actual_thumb.webp', 'media/foto.jpg', recent, 'content/.incoming/tmp.part']:
+            self.assertTrue(default_storage.exists(name), name)
+
+        # La cuarentena no se vuelve a recorrer
+        out = StringIO()
+        call_command('collect_orphan_media', quarantine=quarantine, stdout=out)
+        self.assertIn('Huérfanos movidos a cuarentena: 0', out.getvalue())
+
+
+class EstaticosComprimidosTest(TestCase):
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.override = override_settings(STATIC_ROOT=self.static_root)
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.static_root, ignore_errors=True)
+
+    def test_nombres_con_hash_y_versiones_comprimidas(self):
+        from django.templatetags.static import static
+        call_command('collectstatic', interactive=False, verbosity=0)
+        url = static('js/muro.js')
+        self.assertRegex(url, r'^/static/js/muro\.[0-9a-f]{12}\.js$')
+        path = os.path.join(self.static_root, url[len('/static/'):])
+        with open(path, 'rb') as f, gzip.open(path + '.gz') as compressed:
+            self.assertEqual(compressed.read(), f.read())
+
+        # Una segunda pasada no vuelve a comprimir lo que no cambió
+        compressed_at = os.path.getmtime(path + '.gz')
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.assertEqual(os.path.getmtime(path + '.gz'), compressed_at)
@@ -0,0 +1,210 @@
+"""
+Subidas por partes y reanudables para los archivos del chat y del muro.
+
+El cliente abre una sesión (UploadSession) declarando nombre, tamaño y
+destino; los límites por tipo se comprueban ahí, antes de recibir un solo
+byte. Luego envía el contenido en partes con PATCH y la cabecera
+Upload-Offset. Cada parte se escribe directamente en el archivo temporal de
+la sesión, en bloques de READ_BLOCK bytes, sin cargarla entera en memoria.
+La reanudación es por partes completas: una parte que llega incompleta se
+descarta, y un GET a la sesión devuelve el offset de la última parte entera
+desde el que continuar.
+
+Con la sesión completa, su id (el "handle") se envía a send_message_api o a
+muro_view en lugar del archivo, y attach lo copia al FileField del mensaje o
+de la publicación. El comando expire_uploads borra las sesiones abandonadas.
+"""
+import logging
+import os
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from .models import UploadSession
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'CHUNK_SIZE': 5 * 1024 * 1024,
+    'MAX_SIZE': {
+        'image': 10 * 1024 * 1024,
+        'video': 200 * 1024 * 1024,
+    },
+    'EXPIRE_HOURS': 24,
+    'TEMP_DIR': None,
+}
+
+READ_BLOCK = 64 * 1024
+EXTENSIONS = {
+    'image': {'.jpg', '.jpeg', '.png', '.gif', '.webp'},
+    'video': {'.mp4', '.webm', '.mov', '.ogg'},
+}
+
+
+class UploadError(Exception):
+    """Subida rechazada; el mensaje se devuelve al cliente con `status`"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _config(name):
+    return getattr(settings, 'CHUNKED_UPLOADS', {}).get(name, DEFAULTS[name])
+
+
+def temp_dir():
+    return _config('TEMP_DIR') or os.path.join(settings.BASE_DIR, 'upload_parts')
+
+
+def kind_of(filename):
+    """'image' o 'video' según la extensión, o None si no se admite"""
+    extension = os.path.splitext(filename)[1].lower()
+    for kind, extensions in EXTENSIONS.items():
+        if extension in extensions:
+            return kind
+    return None
+
+
+def chunk_size():
+    return _config('CHUNK_SIZE')
+
+
+def max_size(kind):
+    return _config('MAX_SIZE')[kind]
+
+
+def check_file(filename, size):
+    """Valida tipo y tamaño de un archivo; también para las subidas de una sola vez"""
+    kind = kind_of(filename)
+    if kind is None:
+        raise UploadError('Unsupported file type')
+    limit = max_size(kind)
+    if size > limit:
+        raise UploadError(f'File too large: the {kind} limit is {limit // (1024 * 1024)} MB', status=413)
+    return kind
+
+
+def create_session(user, filename, size, purpose):
+    """Abre una sesión de subida, validando el archivo declarado"""
+    if purpose not in dict(UploadSession.PURPOSE_CHOICES):
+        raise UploadError('Invalid purpose')
+    filename = os.path.basename(filename or '')
+    if not filename:
+        raise UploadError('Filename is required')
+    if size <= 0:
+        raise UploadError('Invalid size')
+    check_file(filename, size)
+    session = UploadSession.objects.create(user=user, filename=filename, size=size, purpose=purpose)
+    os.makedirs(temp_dir(), exist_ok=True)
+    # El archivo existe desde el principio para poder escribir por posición
+    open(session_path(session), 'wb').close()
+    return session
+
+
+def session_path(session):
+    return os.path.join(temp_dir(), f'{session.id.hex}.part')
+
+
+def write_chunk(session, offset, length, stream):
+    """
+    Escribe `length` bytes de `stream` a partir de `offset`.
+
+    El offset debe coincidir con lo ya recibido. Una parte incompleta se
+    descarta sin mover el offset y se responde 409, para que el cliente la
+    repita entera.
+
+    Returns:
+        la sesión actualizada
+    """
+    if session.status != UploadSession.UPLOADING:
+        raise UploadError('Upload already finished', status=409)
+    if offset != session.offset:
+        raise UploadError('Offset mismatch', status=409)
+    if length <= 0 or length > chunk_size():
+        raise UploadError('Invalid chunk size', status=413)
+    if offset + length > session.size:
+        raise UploadError('Chunk exceeds declared size', status=413)
+
+    written = 0
+    try:
+        part = open(session_path(session), 'r+b')
+    except FileNotFoundError:
+        raise UploadError('Upload expired', status=410)
+    with part:
+        part.seek(offset)
+        while written < length:
+            block = stream.read(min(READ_BLOCK, length - written))
+            if not block:
+                break
+            part.write(block)
+            written += len(block)
+        if written < length:
+            part.truncate(offset)
+            # 409 como un offset desfasado: el cliente consulta el offset y reintenta
+            raise UploadError('Incomplete chunk', status=409)
+
+    new_offset = offset + length
+    updates = {'offset': new_offset, 'updated_at': timezone.now()}
+    if new_offset == session.size:
+        updates['status'] = UploadSession.COMPLETE
+    # Si otra petición avanzó la sesión mientras tanto, gana la primera
+    if not UploadSession.objects.filter(pk=session.pk, offset=offset, status=UploadSession.UPLOADING).update(**updates):
+        raise UploadError('Offset mismatch', status=409)
+    for name, value in updates.items():
+        setattr(session, name, value)
+    return session
+
+
+def attach(user, upload_id, purpose, instance, field_name):
+    """
+    Copia una subida completa al FileField `field_name` de `instance` (sin
+    guardar la instancia) y marca la sesión como usada. Debe llamarse dentro
+    de la transacción que guarda la instancia.
+    """
+    try:
+        upload_id = uuid.UUID(str(upload_id))
+    except ValueError:
+        raise UploadError('Upload not found', status=404)
+    session = UploadSession.objects.filter(pk=upload_id, user=user, purpose=purpose).first()
+    if session is None:
+        raise UploadError('Upload not found', status=404)
+    if not UploadSession.objects.filter(pk=session.pk, status=UploadSession.COMPLETE).update(
+        status=UploadSession.ATTACHED, updated_at=timezone.now()
+    ):
+        raise UploadError('Upload is not complete', status=409)
+    path = session_path(session)
+    try:
+        part = open(path, 'rb')
+    except FileNotFoundError:
+        raise UploadError('Upload expired', status=410)
+    with part:
+        getattr(instance, field_name).save(session.filename, File(part), save=False)
+    transaction.on_commit(lambda: _remove(path))
+    return session
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def expire_sessions():
+    """
+    Borra las sesiones sin actividad en EXPIRE_HOURS y sus archivos temporales.
+
+    Returns:
+        número de sesiones borradas
+    """
+    cutoff = timezone.now() - timedelta(hours=_config('EXPIRE_HOURS'))
+    expired = UploadSession.objects.filter(updated_at__lt=cutoff)
+    deleted = 0
+    for session in expired.iterator():
+        _remove(session_path(session))
+        deleted += 1
+    expired.delete()
+    return deleted
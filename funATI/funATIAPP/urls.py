@@ -35,11 +35,20 @@ urlpatterns = [
     # Componentes auxiliares (para AJAX)
     path('menu-main/', views.menu_main_view, name='menu_main'),
     path('container/', views.container_view, name='container'),
+    path('api/publications/', views.publications_page_api, name='publications_page_api'),
+    path('api/publication/<int:id>/comments/', views.publication_comments_api, name='publication_comments_api'),
+    path('api/comments/<int:comment_id>/replies/', views.comment_replies_api, name='comment_replies_api'),
     
     # APIs para chat
     path('api/messages/<int:friend_id>/', views.get_messages_api, name='get_messages_api'),
     path('api/search-friends/', views.search_friends_api, name='search_friends_api'),
     path('api/send-message/', views.send_message_api, name='send_message_api'),
+    path('api/unread/', views.unread_counts_api, name='unread_counts_api'),
+    path('api/uploads/', views.create_upload_api, name='create_upload_api'),
+    path('api/uploads/<uuid:upload_id>/', views.upload_api, name='upload_api'),
+    
+    # Monitoreo
+    path('api/cache-stats/', views.cache_stats_api, name='cache_stats_api'),
     
     # Test/Debug
     path('test-chat/<str:room_name>/', views.test_chat, name='test_chat'),
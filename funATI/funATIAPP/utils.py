@@ -1,89 +1,141 @@
-from django.core.mail import send_mail
 from django.conf import settings
+from django.db import transaction
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
-from .models import UserSettings
+from .models import Notification, UserSettings
+from . import outbox
 import logging
 
 logger = logging.getLogger(__name__)
 
-def send_notification_email(notification):
+def build_notification_email(notification):
+    """
+    Asunto y cuerpo del correo de una notificación.
+    
+    Returns:
+        tuple (asunto, mensaje)
     """
-    Envía un correo electrónico de notificación al usuario si tiene habilitadas las notificaciones por correo.
+    # Configurar el asunto y contenido según el tipo de notificación
+    subject = ""
+    message = ""
+    
+    if notification.notification_type == 'follow':
+        subject = f"🚀 {notification.sender.username} te está siguiendo en FunATI"
+        message = f"""
+        ¡Hola {notification.recipient.username}!
+        
+        {notification.sender.username} comenzó a seguirte en FunATI.
+        
+        ¡Entra a FunATI para ver tu perfil y conectar con más personas!
+        
+        ---
+        Este email fue enviado desde FunATI.
+        Si no quieres recibir más notificaciones por correo, puedes desactivarlas en tu configuración.
+        """
+        
+    elif notification.notification_type == 'friend':
+        subject = f"🤝 {notification.sender.username} es ahora tu amigo en FunATI"
+        message = f"""
+        ¡Hola {notification.recipient.username}!
+        
+        {notification.sender.username} es ahora tu amigo en FunATI.
+        
+        ¡Entra a FunATI para chatear y compartir momentos juntos!
+        
+        ---
+        Este email fue enviado desde FunATI.
+        Si no quieres recibir más notificaciones por correo, puedes desactivarlas en tu configuración.
+        """
+        
+    elif notification.notification_type == 'comment':
+        subject = f"💬 {notification.sender.username} respondió a tu publicación en FunATI"
+        comment_preview = notification.comment.content[:100] + ("..." if len(notification.comment.content) > 100 else "")
+        message = f"""
+        ¡Hola {notification.recipient.username}!
+        
+        {notification.sender.username} respondió a tu publicación:
+        
+        "{comment_preview}"
+        
+        ¡Entra a FunATI para ver la respuesta completa y seguir la conversación!
+        
+        ---
+        Este email fue enviado desde FunATI.
+        Si no quieres recibir más notificaciones por correo, puedes desactivarlas en tu configuración.
+        """
+    
+    return subject, message
+
+def send_notification_emails(notifications):
+    """
+    Encola los correos de varias notificaciones con un solo INSERT en EmailOutbox,
+    solo para los destinatarios que tienen habilitadas las notificaciones por correo
+    y las reciben una a una. El envío lo hace el comando send_queued_emails (ver
+    outbox.py); los resúmenes por hora o diarios, send_notification_digests (ver digest.py).
     
     Args:
-        notification: Instancia del modelo Notification
+        notifications: Instancias de Notification con recipient y sender
+    
+    Returns:
+        número de correos encolados
     """
-    try:
+    emails = []
+    done_ids = []
+    for notification in notifications:
         # Verificar si el usuario tiene habilitadas las notificaciones por correo
         user_settings = UserSettings.get_user_settings(notification.recipient)
         if not user_settings.email_notifications:
-            return False
+            done_ids.append(notification.pk)
+            continue
+        
+        # Con resumen por hora o diario, la notificación queda para send_notification_digests
+        if user_settings.email_delivery != 'inmediato':
+            continue
         
         # Verificar que el usuario tenga email
         if not notification.recipient.email:
             logger.warning(f"Usuario {notification.recipient.username} no tiene email configurado")
-            return False
-        
-        # Configurar el asunto y contenido según el tipo de notificación
-        subject = ""
-        message = ""
-        
-        if notification.notification_type == 'follow':
-            subject = f"🚀 {notification.sender.username} te está siguiendo en FunATI"
-            message = f"""
-            ¡Hola {notification.recipient.username}!
-            
-            {notification.sender.username} comenzó a seguirte en FunATI.
-            
-            ¡Entra a FunATI para ver tu perfil y conectar con más personas!
-            
-            ---
-            Este email fue enviado desde FunATI.
-            Si no quieres recibir más notificaciones por correo, puedes desactivarlas en tu configuración.
-            """
-            
-        elif notification.notification_type == 'friend':
-            subject = f"🤝 {notification.sender.username} es ahora tu amigo en FunATI"
-            message = f"""
-            ¡Hola {notification.recipient.username}!
-            
-            {notification.sender.username} es ahora tu amigo en FunATI.
-            
-            ¡Entra a FunATI para chatear y compartir momentos juntos!
-            
-            ---
-            Este email fue enviado desde FunATI.
-            Si no quieres recibir más notificaciones por correo, puedes desactivarlas en tu configuración.
-            """
-            
-        elif notification.notification_type == 'comment':
-            subject = f"💬 {notification.sender.username} respondió a tu publicación en FunATI"
-            comment_preview = notification.comment.content[:100] + ("..." if len(notification.comment.content) > 100 else "")
-            message = f"""
-            ¡Hola {notification.recipient.username}!
-            
-            {notification.sender.username} respondió a tu publicación:
-            
-            "{comment_preview}"
-            
-            ¡Entra a FunATI para ver la respuesta completa y seguir la conversación!
-            
-            ---
-            Este email fue enviado desde FunATI.
-            Si no quieres recibir más notificaciones por correo, puedes desactivarlas en tu configuración.
-            """
-        
-        # Enviar el correo
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[notification.recipient.email],
-            fail_silently=False,
-        )
-        
-        return True
+            continue
         
+        subject, message = build_notification_email(notification)
+        emails.append((notification.recipient.email, subject, message))
+        done_ids.append(notification.pk)
+    
+    with transaction.atomic():
+        outbox.enqueue_many(emails)
+        Notification.objects.filter(pk__in=done_ids).update(emailed=True)
+    return len(emails)
+
+def send_notification_email(notification):
+    """
+    Encola el correo de una notificación (ver send_notification_emails).
+    
+    Args:
+        notification: Instancia del modelo Notification
+    
+    Returns:
+        True si se encoló el correo
+    """
+    try:
+        return send_notification_emails([notification]) == 1
     except Exception as e:
-        return False 
\ No newline at end of file
+        logger.error(f"Error encolando el correo de la notificación {notification.id}: {e}")
+        return False
+
+def send_notification_emails_on_commit(notifications):
+    """
+    Encola los correos cuando se confirme la transacción actual, para que las
+    operaciones masivas no escriban la cola fila a fila. Si el proceso muere
+    antes, las notificaciones quedan con emailed=False y las recoge el resumen
+    por hora (ver digest.py).
+    """
+    notifications = list(notifications)
+    
+    def send():
+        try:
+            send_notification_emails(notifications)
+        except Exception as e:
+            logger.error(f"Error encolando {len(notifications)} correos de notificación: {e}")
+    
+    if notifications:
+        transaction.on_commit(send)
@@ -6,9 +6,17 @@ from django.contrib.auth.tokens import default_token_generator
 from django.core.mail import send_mail
 from django.conf import settings
 from .forms import PublicationForm, RegisterForm, LoginForm, RecoverPasswordForm, ProfileEditForm, ChangePasswordForm
-from .models import Publication, Profile, Comment, Message, Notification, UserSettings
+from .models import Publication, Profile, Comment, Message, Conversation, Notification, UnreadCounter, UploadSession, UserSettings
+from . import feed
+from .pagination import keyset_page
+from .comment_tree import load_comment_page, load_replies_page
+from . import realtime, renditions, settings_cache, social_graph, uploads
+from .recommendations import recommended_profiles
 from django.http import JsonResponse
-from random import sample
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.http import urlencode
+from django.db import transaction
 from django.db.models import Q
 from django.contrib import messages
 
@@ -19,6 +27,9 @@ def can_view_publications(viewer_user, profile_owner):
     Determina si un usuario puede ver las publicaciones de otro usuario
     basado en la configuración de privacidad del dueño del perfil.
     
+    La regla (propio, público, o privado y amigo) se evalúa en SQL con una
+    sola consulta; ver Profile.objects.publications_visible_to.
+    
     Args:
         viewer_user: Usuario que quiere ver las publicaciones (puede ser None si no está autenticado)
         profile_owner: Profile del dueño de las publicaciones
@@ -27,33 +38,19 @@ def can_view_publications(viewer_user, profile_owner):
         bool: True si puede ver las publicaciones, False en caso contrario
     """
     # Si es el propio usuario, siempre puede ver sus publicaciones
-    if viewer_user and viewer_user.is_authenticated and viewer_user == profile_owner.user:
-        return True
-    
-    # Obtener configuración de privacidad del dueño del perfil
-    owner_settings = UserSettings.get_user_settings(profile_owner.user)
-    
-    # Si las publicaciones son públicas, cualquiera puede verlas
-    if owner_settings.privacy == 'publico':
+    if viewer_user and viewer_user.is_authenticated and viewer_user.id == profile_owner.user_id:
         return True
     
-    # Si las publicaciones son privadas, solo los amigos pueden verlas
-    if owner_settings.privacy == 'privado':
-        # Si el viewer no está autenticado, no puede ver
-        if not viewer_user or not viewer_user.is_authenticated:
-            return False
-        
-        # Verificar si son amigos
-        return profile_owner in viewer_user.profile.friends.all()
-    
-    # Por defecto, no permitir acceso
-    return False
+    return Profile.objects.filter(pk=profile_owner.pk).publications_visible_to(viewer_user).exists()
 
 def get_viewable_publications_for_feed(viewer_user):
     """
     Obtiene todas las publicaciones que un usuario puede ver en su feed,
     respetando las configuraciones de privacidad de cada autor.
     
+    Las publicaciones se leen del timeline materializado (FeedEntry), que ya
+    está filtrado por privacidad y se mantiene al día mediante signals.
+    
     Args:
         viewer_user: Usuario autenticado que quiere ver el feed
     
@@ -63,28 +60,40 @@ def get_viewable_publications_for_feed(viewer_user):
     if not viewer_user.is_authenticated:
         return Publication.objects.none()
     
-    profile = viewer_user.profile
-    
-    # Obtener IDs de perfiles amigos, seguidos y propios
-    friends_ids = profile.friends.values_list('id', flat=True)
-    following_ids = profile.following.values_list('id', flat=True)
-    allowed_profiles = list(friends_ids) + list(following_ids) + [profile.id]
-    
-    # Obtener todas las publicaciones de estos perfiles
-    all_publications = Publication.objects.select_related('profile__user').filter(
-        profile_id__in=allowed_profiles
-    ).order_by('-created_at')
+    return feed.feed_for(viewer_user.profile)
+
+def publications_page_url(source, cursor, profile_id=None):
+    """URL del endpoint que devuelve la página de publicaciones siguiente a `cursor`"""
+    params = {'source': source, 'cursor': cursor}
+    if profile_id:
+        params['profile_id'] = profile_id
+    return f"{reverse('funATIAPP:publications_page_api')}?{urlencode(params)}"
+
+def get_profile_publications_page(viewer_user, profile, cursor=None):
+    """
+    Página de publicaciones de un perfil visibles para `viewer_user`,
+    paginada por keyset sobre (created_at, id).
     
-    # Filtrar las publicaciones basándose en la privacidad
-    viewable_publications = []
-    for publication in all_publications:
-        if can_view_publications(viewer_user, publication.profile):
-            viewable_publications.append(publication.id)
+    Returns:
+        tuple (lista de publicaciones, URL de la siguiente página o None)
+    """
+    publications = Publication.objects.visible_to(viewer_user).select_related('profile__user').filter(
+        profile=profile
+    )
+    publications, next_cursor = keyset_page(publications, cursor, settings.PUBLICATIONS_PAGE_SIZE)
+    next_url = publications_page_url('profile', next_cursor, profile.id) if next_cursor else None
+    return publications, next_url
+
+def get_feed_page(viewer_user, cursor=None):
+    """
+    Página del feed de `viewer_user` leída del timeline materializado.
     
-    # Retornar las publicaciones filtradas
-    return Publication.objects.select_related('profile__user').filter(
-        id__in=viewable_publications
-    ).order_by('-created_at')
+    Returns:
+        tuple (lista de publicaciones, URL de la siguiente página o None)
+    """
+    publications, next_cursor = feed.feed_page(viewer_user.profile, cursor, settings.PUBLICATIONS_PAGE_SIZE)
+    next_url = publications_page_url('feed', next_cursor) if next_cursor else None
+    return publications, next_url
 
 # Página de inicio (landing page)
 def index(request):
@@ -157,18 +166,31 @@ def muro_view(request):
         if form.is_valid():
             publication = form.save(commit=False)
             publication.profile = request.user.profile
-            publication.save()
+            try:
+                with transaction.atomic():
+                    # Archivo subido por partes (ver uploads.py)
+                    upload_id = request.POST.get('upload_id')
+                    if upload_id:
+                        uploads.attach(request.user, upload_id, 'publication', publication, 'media')
+                    publication.save()
+            except uploads.UploadError as e:
+                if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+                    return JsonResponse({'error': str(e)}, status=e.status)
+                form.add_error('media', str(e))
+            else:
+                if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+                    return JsonResponse({'success': True})
+                return redirect('funATIAPP:muro')
+        else:
             if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-                return JsonResponse({'success': True})
-            return redirect('funATIAPP:muro')
+                return JsonResponse({'error': form.errors.get_json_data()}, status=400)
+        return render(request, 'muro.html', {'form': form})
     
-    # Obtener publicaciones que respeten la privacidad
-    publications = get_viewable_publications_for_feed(request.user)
+    # Las publicaciones se cargan por páginas desde container_view
     form = PublicationForm()
     
     return render(request, 'muro.html', {
         'form': form,
-        'publications': publications
     })
 """ 
 @login_required
@@ -192,40 +214,72 @@ def muro_view(request):
 @login_required
 def notifications_view(request):
     # Get all notifications for the current user
-    notifications = request.user.notifications.all()[:20]  # Limit to 20 most recent
-    
-    # Mark notifications as read when viewed
-    request.user.notifications.filter(is_read=False).update(is_read=True)
+    notifications = request.user.notifications.select_related(
+        'sender__profile', 'publication', 'comment'
+    )[:20]  # Limit to 20 most recent
+    
+    # Mark notifications as read when viewed; other sessions clear their badge.
+    # The counter drops by the rows actually marked, so a notification created
+    # in between stays counted
+    read = request.user.notifications.filter(is_read=False).update(is_read=True)
+    if read:
+        UnreadCounter.add(request.user.id, notifications=-read)
+        realtime.publish_notifications_read(request.user.id)
     
     return render(request, 'notifications.html', {'notifications': notifications})
 
 @login_required
-def chats_view(request):
-    profile = request.user.profile
-    friends = profile.friends.all()
-    
-    # Get search query if provided
-    search_query = request.GET.get('search', '')
+def unread_counts_api(request):
+    """Notificaciones y mensajes sin leer del usuario, desde sus contadores"""
+    counter = UnreadCounter.for_user(request.user.id)
+    return JsonResponse({
+        'notifications': counter.notifications,
+        'messages': counter.messages,
+    })
+
+def get_inbox(user, search_query=''):
+    """
+    Amigos del usuario con su conversación, de la actividad más reciente a la
+    más antigua; los amigos sin mensajes van al final. Son dos consultas
+    (amigos y conversaciones) sin importar cuántos amigos tenga.
+    """
+    friends = user.profile.friends.select_related('user')
     if search_query:
         friends = friends.filter(
             Q(user__username__icontains=search_query) |
             Q(user__first_name__icontains=search_query) |
             Q(user__last_name__icontains=search_query)
         )
-    
-    # Add recent messages for each friend
-    friends_with_messages = []
-    for friend in friends:
-        # Get last message between current user and this friend
-        last_message = Message.objects.filter(
-            Q(sender=request.user, receiver=friend.user) |
-            Q(sender=friend.user, receiver=request.user)
-        ).first()
-        
-        friends_with_messages.append({
-            'friend': friend,
-            'last_message': last_message
-        })
+    by_user = {friend.user_id: friend for friend in friends.order_by('id')}
+
+    # El orden sale de la base de datos: las conversaciones del usuario por
+    # actividad, con los índices (user_low|user_high, -last_activity_at)
+    conversations = Conversation.objects.for_user(user).filter(
+        last_activity_at__isnull=False
+    ).select_related('last_message').order_by('-last_activity_at', '-id')
+
+    inbox = []
+    for conversation in conversations:
+        # Las conversaciones con quienes ya no son amigos (o no coinciden con la búsqueda) no se muestran
+        friend = by_user.pop(conversation.other_user_id(user), None)
+        if friend is not None:
+            inbox.append({
+                'friend': friend,
+                'last_message': conversation.last_message,
+                'last_activity_at': conversation.last_activity_at,
+                'unread': conversation.unread_for(user),
+            })
+    inbox.extend(
+        {'friend': friend, 'last_message': None, 'last_activity_at': None, 'unread': 0}
+        for friend in by_user.values()
+    )
+    return inbox
+
+@login_required
+def chats_view(request):
+    # Get search query if provided
+    search_query = request.GET.get('search', '')
+    friends_with_messages = get_inbox(request.user, search_query)
     
     return render(request, 'chats-main.html', {
         'friends_with_messages': friends_with_messages,
@@ -237,24 +291,20 @@ def chat_room_view(request, friend_id):
     """View for specific chat room with a friend"""
     try:
         friend_profile = Profile.objects.get(id=friend_id)
-        # Check if they are friends
-        if friend_profile not in request.user.profile.friends.all():
+        # Check if they are friends (authorization reads the database, not the cached index)
+        if not social_graph.are_friends_in_db(request.user.profile, friend_profile):
             return redirect('funATIAPP:chats')
     except Profile.DoesNotExist:
         return redirect('funATIAPP:chats')
     
-    # Get chat messages between the two users
-    messages = Message.objects.filter(
-        Q(sender=request.user, receiver=friend_profile.user) |
-        Q(sender=friend_profile.user, receiver=request.user)
-    ).order_by('timestamp')[:50]  # Last 50 messages
+    # Last 50 messages, oldest first
+    messages, has_more = Message.objects.between(request.user, friend_profile.user).history_page(
+        limit=settings.CHAT_HISTORY_PAGE_SIZE
+    )
     
     # Mark messages from friend as read
-    Message.objects.filter(
-        sender=friend_profile.user,
-        receiver=request.user,
-        is_read=False
-    ).update(is_read=True)
+    if Conversation.mark_read(request.user, friend_profile.user):
+        realtime.publish_read(request.user.id, friend_profile.user_id)
     
     # Generate room name for WebSocket (consistent naming)
     room_name = f"{min(request.user.id, friend_profile.user.id)}_{max(request.user.id, friend_profile.user.id)}"
@@ -262,36 +312,53 @@ def chat_room_view(request, friend_id):
     return render(request, 'chat-room.html', {
         'friend': friend_profile,
         'messages': messages,
+        'has_more': has_more,
         'room_name': room_name,
     })
 
 @login_required
 def get_messages_api(request, friend_id):
-    """API endpoint to get messages with a specific friend"""
+    """
+    API endpoint to get messages with a specific friend.
+
+    Without cursors it returns the newest messages; `?before=<id>` pages
+    backwards and `?after=<id>` forwards. Messages are always oldest first.
+    """
     
     try:
-        friend_profile = Profile.objects.get(id=friend_id)
+        friend_profile = Profile.objects.select_related('user').get(id=friend_id)
         friend_user = friend_profile.user
     except Profile.DoesNotExist:
         return JsonResponse({'error': 'Friend not found'}, status=404)
     
+    try:
+        before = int(request.GET['before']) if request.GET.get('before') else None
+        after = int(request.GET['after']) if request.GET.get('after') else None
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    
     # Get messages
-    messages = Message.objects.filter(
-        Q(sender=request.user, receiver=friend_user) |
-        Q(sender=friend_user, receiver=request.user)
-    ).order_by('timestamp')[:50]
+    messages, has_more = Message.objects.between(request.user, friend_user).history_page(
+        before=before, after=after, limit=settings.CHAT_HISTORY_PAGE_SIZE
+    )
+    
+    if after is None and before is None:
+        # Opening the chat clears the unread badge of this conversation
+        if Conversation.mark_read(request.user, friend_user):
+            realtime.publish_read(request.user.id, friend_user.id)
     
+    # Los ids pueden superar 2**53 (ver message_ids.py): van como cadenas
     messages_data = [{
-        'id': msg.id,
+        'id': str(msg.id),
         'content': msg.content,
         'media_url': msg.media.url if msg.media else None,
-        'sender_id': msg.sender.id,
-        'sender_username': msg.sender.username,
+        'sender_id': msg.sender_id,
+        'sender_username': request.user.username if msg.sender_id == request.user.id else friend_user.username,
         'timestamp': msg.timestamp.isoformat(),
-        'is_sent': msg.sender == request.user,
+        'is_sent': msg.sender_id == request.user.id,
     } for msg in messages]
     
-    return JsonResponse({'messages': messages_data})
+    return JsonResponse({'messages': messages_data, 'has_more': has_more})
 
 @login_required
 def search_friends_api(request):
@@ -302,30 +369,27 @@ def search_friends_api(request):
     
     if not search_query:
         # If no search query, return all friends with their last messages
-        friends = profile.friends.all()
         friends_data = []
-        for friend in friends:
-            # Get last message between current user and this friend
-            last_message = Message.objects.filter(
-                Q(sender=request.user, receiver=friend.user) |
-                Q(sender=friend.user, receiver=request.user)
-            ).first()
-            
+        for item in get_inbox(request.user):
+            friend = item['friend']
+            last_message = item['last_message']
             friends_data.append({
                 'id': friend.id,
+                'user_id': friend.user_id,
                 'username': friend.user.username,
                 'first_name': friend.user.first_name,
                 'last_name': friend.user.last_name,
-                'avatar_url': friend.avatar.url if friend.avatar else None,
+                'avatar_url': renditions.url(friend, 'avatar', 'thumb'),
                 'last_message': {
-                    'content': last_message.content[:50] + '...' if last_message and len(last_message.content) > 50 else (last_message.content if last_message else ''),
-                    'timestamp': last_message.timestamp.strftime('%b %d') if last_message else '',
-                    'is_unread': last_message and last_message.sender != request.user and not last_message.is_read if last_message else False
+                    'content': last_message.content[:50] + '...' if len(last_message.content) > 50 else last_message.content,
+                    'timestamp': last_message.timestamp.strftime('%b %d'),
+                    'is_unread': item['unread'] > 0,
+                    'unread_count': item['unread'],
                 } if last_message else None
             })
     else:
         # Filter friends by search query
-        friends = profile.friends.filter(
+        friends = profile.friends.select_related('user').filter(
             Q(user__username__icontains=search_query) |
             Q(user__first_name__icontains=search_query) |
             Q(user__last_name__icontains=search_query)
@@ -333,10 +397,11 @@ def search_friends_api(request):
         
         friends_data = [{
             'id': friend.id,
+            'user_id': friend.user_id,
             'username': friend.user.username,
             'first_name': friend.user.first_name,
             'last_name': friend.user.last_name,
-            'avatar_url': friend.avatar.url if friend.avatar else None,
+            'avatar_url': renditions.url(friend, 'avatar', 'thumb'),
         } for friend in friends]
     
     return JsonResponse({'friends': friends_data})
@@ -352,13 +417,21 @@ def send_message_api(request):
         receiver_id = request.POST.get('receiver_id')
         content = request.POST.get('content', '')
         media_file = request.FILES.get('media')
+        # Handle of a chunked upload (see uploads.py), instead of `media`
+        upload_id = request.POST.get('upload_id')
         
         if not receiver_id:
             return JsonResponse({'error': 'Receiver ID is required'}, status=400)
             
-        if not content and not media_file:
+        if not content and not media_file and not upload_id:
             return JsonResponse({'error': 'Message content or media is required'}, status=400)
         
+        if media_file:
+            try:
+                uploads.check_file(media_file.name, media_file.size)
+            except uploads.UploadError as e:
+                return JsonResponse({'error': str(e)}, status=e.status)
+        
         try:
             receiver_profile = Profile.objects.get(id=receiver_id)
             receiver_user = receiver_profile.user
@@ -366,21 +439,28 @@ def send_message_api(request):
             return JsonResponse({'error': 'Receiver not found'}, status=404)
         
         # Check if they are friends
-        if receiver_profile not in request.user.profile.friends.all():
+        if not social_graph.are_friends_in_db(request.user.profile, receiver_profile):
             return JsonResponse({'error': 'You can only send messages to friends'}, status=403)
         
         # Create the message
-        message = Message.objects.create(
+        message = Message(
             sender=request.user,
             receiver=receiver_user,
             content=content,
             media=media_file if media_file else None
         )
+        try:
+            with transaction.atomic():
+                if upload_id:
+                    uploads.attach(request.user, upload_id, 'message', message, 'media')
+                message.save()
+        except uploads.UploadError as e:
+            return JsonResponse({'error': str(e)}, status=e.status)
         
         return JsonResponse({
             'success': True,
             'message': {
-                'id': message.id,
+                'id': str(message.id),
                 'content': message.content,
                 'media_url': message.media.url if message.media else None,
                 'sender_id': message.sender.id,
@@ -393,6 +473,57 @@ def send_message_api(request):
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
+@login_required
+def create_upload_api(request):
+    """Open a chunked upload session; returns its handle and the chunk size"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid size'}, status=400)
+    try:
+        session = uploads.create_session(
+            request.user, request.POST.get('filename'), size, request.POST.get('purpose')
+        )
+    except uploads.UploadError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+    return JsonResponse({
+        'upload_id': str(session.id),
+        'offset': 0,
+        'chunk_size': uploads.chunk_size(),
+    }, status=201)
+
+@login_required
+def upload_api(request, upload_id):
+    """
+    GET: received offset, to resume an interrupted upload.
+    PATCH: append the request body at the Upload-Offset header.
+    """
+    session = get_object_or_404(UploadSession, pk=upload_id, user=request.user)
+    if request.method == 'PATCH':
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.headers.get('Content-Length', ''))
+        except ValueError:
+            return JsonResponse({'error': 'Upload-Offset and Content-Length are required'}, status=400)
+        try:
+            # El cuerpo se lee en bloques desde el stream, sin request.body
+            uploads.write_chunk(session, offset, length, request)
+        except uploads.UploadError as e:
+            session.refresh_from_db()
+            return JsonResponse({'error': str(e), 'offset': session.offset}, status=e.status)
+        except OSError as e:
+            return JsonResponse({'error': f'Upload interrupted: {e}', 'offset': session.offset}, status=400)
+    elif request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    return JsonResponse({
+        'upload_id': str(session.id),
+        'offset': session.offset,
+        'size': session.size,
+        'status': session.status,
+    })
+
 @login_required
 def friends_view(request):
     profile = request.user.profile
@@ -404,8 +535,8 @@ def friends_view(request):
         if add_friend_id:
             try:
                 friend_profile = Profile.objects.get(id=add_friend_id)
+                # La relación es simétrica: una sola llamada guarda la amistad mutua
                 profile.friends.add(friend_profile)
-                friend_profile.friends.add(profile)  # amistad mutua
             except Profile.DoesNotExist:
                 pass
         if follow_id:
@@ -423,36 +554,25 @@ def friends_view(request):
         if remove_friend_id:
             try:
                 friend_profile = Profile.objects.get(id=remove_friend_id)
+                # Como en add_friend, la relación simétrica borra ambas filas en una llamada
                 profile.friends.remove(friend_profile)
-                friend_profile.friends.remove(profile)  # eliminar mutua
             except Profile.DoesNotExist:
                 pass
         return redirect('funATIAPP:friends')
-    all_profiles = Profile.objects.exclude(id=profile.id)
-    friends = profile.friends.all()
-    # Excluir amigos y el propio usuario de las recomendaciones
-    exclude_ids = list(friends.values_list('id', flat=True)) + [profile.id]
-    recommendations_qs = all_profiles.exclude(id__in=exclude_ids)
-    recommendations = list(recommendations_qs)
-    # Si hay menos de 15/4 usuarios, ajustar el sample
-    if not friends:
-        num_recommend = min(15, len(recommendations))
-        recommendations = sample(recommendations, num_recommend) if num_recommend > 0 else []
-        return render(request, 'friends.html', {
-            'friends': [],
-            'recommendations': recommendations
-        })
-    else:
-        num_recommend = min(4, len(recommendations))
-        recommendations = sample(recommendations, num_recommend) if num_recommend > 0 else []
-        return render(request, 'friends.html', {
-            'friends': friends,
-            'recommendations': recommendations
-        })
+    friends = profile.friends.select_related('user')
+    # Recomendaciones precalculadas (amigos de amigos y seguidos en común)
+    num_recommend = 4 if friends else 15
+    recommendations = recommended_profiles(profile, num_recommend)
+    return render(request, 'friends.html', {
+        'friends': friends,
+        'recommendations': recommendations,
+        'following_ids': social_graph.following_set(profile),
+    })
 
 @login_required
 def settings_view(request):
-    user_settings = UserSettings.get_user_settings(request.user)
+    # Se lee de la base de datos (no de la caché) porque se va a modificar
+    user_settings, created = UserSettings.objects.get_or_create(user=request.user)
     
     if request.method == 'POST':
         # Procesar el formulario de configuración
@@ -461,6 +581,7 @@ def settings_view(request):
         color_theme = request.POST.get('color', user_settings.color_theme)
         theme_mode = request.POST.get('theme', user_settings.theme_mode)
         email_notifications = request.POST.get('notifications') == 'on'
+        email_delivery = request.POST.get('email_delivery', user_settings.email_delivery)
         
         # Actualizar configuraciones
         user_settings.privacy = privacy
@@ -468,6 +589,8 @@ def settings_view(request):
         user_settings.color_theme = color_theme
         user_settings.theme_mode = theme_mode
         user_settings.email_notifications = email_notifications
+        if email_delivery in dict(UserSettings.EMAIL_DELIVERY_CHOICES):
+            user_settings.email_delivery = email_delivery
         user_settings.save()
         
         messages.success(request, 'Configuración guardada exitosamente.')
@@ -510,9 +633,9 @@ def profile_detail_view(request, profile_id):
     # Verificar si el usuario actual puede ver las publicaciones del perfil
     can_view = can_view_publications(request.user, profile)
     if can_view:
-        publications = profile.publications.order_by('-created_at')
+        publications, next_url = get_profile_publications_page(request.user, profile)
     else:
-        publications = []
+        publications, next_url = [], None
     
     # Obtener configuración de privacidad del perfil
     profile_settings = UserSettings.get_user_settings(profile.user)
@@ -521,6 +644,7 @@ def profile_detail_view(request, profile_id):
     context = {
         'profile': profile,
         'publications': publications,
+        'next_url': next_url,
         'can_view_publications': can_view,
         'profile_privacy': profile_settings.privacy,
         'is_own_profile': is_own_profile
@@ -532,7 +656,7 @@ def profile_detail_view(request, profile_id):
 def profile_view(request):
     profile = request.user.profile
     # El usuario siempre puede ver sus propias publicaciones
-    publications = profile.publications.order_by('-created_at')
+    publications, next_url = get_profile_publications_page(request.user, profile)
     
     # Obtener configuración de privacidad del perfil
     profile_settings = UserSettings.get_user_settings(profile.user)
@@ -540,6 +664,7 @@ def profile_view(request):
     context = {
         'profile': profile,
         'publications': publications,
+        'next_url': next_url,
         'can_view_publications': True,  # Siempre puede ver sus propias publicaciones
         'profile_privacy': profile_settings.privacy,
         'is_own_profile': True
@@ -585,8 +710,12 @@ def followers_view(request, profile_id=None):
             redirect_url += f'?profile_id={profile_id}'
         return redirect(redirect_url)
     
-    followers = profile.followers.all()
-    return render(request, 'followers.html', {'profile': profile, 'followers': followers})
+    followers = profile.followers.select_related('user')
+    return render(request, 'followers.html', {
+        'profile': profile,
+        'followers': followers,
+        'following_ids': social_graph.following_set(request.user.profile),
+    })
 
 @login_required
 def follows_view(request, profile_id=None):
@@ -639,17 +768,48 @@ def menu_main_view(request):
 
 @login_required
 def container_view(request):
-    # Obtener publicaciones que respeten la privacidad
-    publications = get_viewable_publications_for_feed(request.user)
-    return render(request, 'container.html', {'publications': publications})
+    # Primera página del feed; las siguientes se piden a publications_page_api
+    publications, next_url = get_feed_page(request.user)
+    return render(request, 'container.html', {'publications': publications, 'next_url': next_url})
+
+@login_required
+def publications_page_api(request):
+    """API endpoint para el scroll infinito: devuelve la página siguiente a un cursor"""
+    source = request.GET.get('source', 'feed')
+    cursor = request.GET.get('cursor')
+    
+    if source not in ('feed', 'profile'):
+        return JsonResponse({'error': 'Invalid source'}, status=400)
+    
+    try:
+        if source == 'feed':
+            publications, next_url = get_feed_page(request.user, cursor)
+        else:
+            try:
+                profile = Profile.objects.get(id=int(request.GET.get('profile_id', '')))
+            except (ValueError, Profile.DoesNotExist):
+                return JsonResponse({'error': 'Profile not found'}, status=404)
+            publications, next_url = get_profile_publications_page(request.user, profile, cursor)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    
+    html = render_to_string('container.html', {
+        'publications': publications,
+        'next_url': next_url,
+    }, request=request)
+    return JsonResponse({'html': html, 'next_url': next_url})
 
 @login_required
 def publication_detail_view(request, id):
-    publication = Publication.objects.select_related('profile__user').get(id=id)
+    # Solo se puede abrir una publicación si su autor permite verla
+    publication = get_object_or_404(
+        Publication.objects.visible_to(request.user).select_related('profile__user'),
+        id=id
+    )
     if request.method == 'POST':
         content = request.POST.get('content')
         parent_id = request.POST.get('parent')
-        parent = Comment.objects.filter(id=parent_id).first() if parent_id else None
+        parent = publication.comments.filter(id=parent_id).first() if parent_id else None
         if content:
             Comment.objects.create(
                 publication=publication,
@@ -658,12 +818,60 @@ def publication_detail_view(request, id):
                 parent=parent
             )
             return redirect('funATIAPP:publication_detail', id=id)
-    comments = publication.comments.select_related('user').order_by('created_at')
+    # Primera página de comentarios con sus respuestas precargadas; el resto
+    # se pide a publication_comments_api y comment_replies_api
+    comments, next_cursor = load_comment_page(publication)
     return render(request, 'publication.html', {
         'publication': publication,
-        'comments': comments
+        'comments': comments,
+        'next_url': comments_page_url(publication, next_cursor),
     })
 
+def comments_page_url(publication, cursor):
+    """URL de la página de comentarios de primer nivel siguiente a `cursor`"""
+    if not cursor:
+        return None
+    return f"{reverse('funATIAPP:publication_comments_api', args=[publication.id])}?{urlencode({'cursor': cursor})}"
+
+@login_required
+def publication_comments_api(request, id):
+    """API endpoint: página de comentarios de primer nivel de una publicación"""
+    publication = get_object_or_404(Publication.objects.visible_to(request.user), id=id)
+    try:
+        comments, next_cursor = load_comment_page(publication, request.GET.get('cursor'))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    
+    next_url = comments_page_url(publication, next_cursor)
+    html = render_to_string('comment-list.html', {
+        'comments': comments,
+        'next_url': next_url,
+    }, request=request)
+    return JsonResponse({'html': html, 'next_url': next_url})
+
+@login_required
+def comment_replies_api(request, comment_id):
+    """API endpoint: página de respuestas directas de un comentario"""
+    comment = get_object_or_404(
+        Comment.objects.filter(publication__in=Publication.objects.visible_to(request.user)),
+        id=comment_id
+    )
+    try:
+        replies, next_cursor = load_replies_page(comment, request.GET.get('cursor'))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    
+    next_url = None
+    if next_cursor:
+        next_url = f"{reverse('funATIAPP:comment_replies_api', args=[comment.id])}?{urlencode({'cursor': next_cursor})}"
+    html = render_to_string('comment-replies-page.html', {
+        'replies': replies,
+        'next_url': next_url,
+        # Mismo sangrado que las respuestas precargadas en la página de detalle
+        'parent_margin': 32 * (comment.depth + 1),
+    }, request=request)
+    return JsonResponse({'html': html, 'next_url': next_url, 'replies_count': comment.replies_count})
+
 @login_required
 def change_password_view(request):
     """View para cambiar la contraseña del usuario mediante AJAX"""
@@ -699,3 +907,10 @@ def test_chat(request, room_name):
         'room_name': room_name,
         'user': request.user
     })
+
+@login_required
+def cache_stats_api(request):
+    """API endpoint de monitoreo: aciertos y fallos de la caché de configuraciones"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Forbidden'}, status=403)
+    return JsonResponse({'user_settings': settings_cache.get_stats()})
@@ -9,15 +9,17 @@ sleep 2
 # Navigate to Django project directory
 cd /app/funATI
 
+# Shared Django cache for every process below (UserSettings, social graph);
+# a per-process cache would only see its own invalidations
+export CACHE_REDIS_URL=${CACHE_REDIS_URL:-redis://127.0.0.1:6379/1}
+
 # Run Django migrations
 python3 manage.py migrate
 
-# Clear and collect static files
-rm -rf /app/funATI/staticfiles/*
+# Collect static files (incremental: only changed files are copied and
+# compressed; hashed names from previous deploys stay for cached pages)
 mkdir -p /app/funATI/staticfiles
-
-# Collect static files with clear option
-python3 manage.py collectstatic --noinput --clear --verbosity=1
+python3 manage.py collectstatic --noinput --verbosity=1
 
 # Set proper permissions for static files
 chown -R www-data:www-data /app/funATI/staticfiles/
@@ -83,9 +85,28 @@ print('ASGI_APPLICATION:', getattr(settings, 'ASGI_APPLICATION', 'Not configured
 print('CHANNEL_LAYERS:', getattr(settings, 'CHANNEL_LAYERS', 'Not configured'))
 " || echo "Channels test failed"
 
+# Start the outbound email worker (EmailOutbox queue) in background
+echo "Starting email worker..."
+python3 manage.py send_queued_emails &
+
+# Image renditions (thumb/card/full WEBP) for new avatars and publication media
+echo "Starting renditions worker..."
+python3 manage.py process_renditions &
+
+# Notification digests (hourly and daily), queued in the same outbox
+(while true; do sleep 3600; python3 manage.py send_notification_digests --frequency cada_hora; done) &
+(while true; do sleep 86400; python3 manage.py send_notification_digests --frequency diario; done) &
+
+# Abandoned chunked uploads
+(while true; do sleep 3600; python3 manage.py expire_uploads; done) &
+
+# Orphaned files in MEDIA_ROOT (replaced avatars, deleted publications)
+(while true; do sleep 86400; python3 manage.py collect_orphan_media; done) &
+
 # Start Daphne with proper Django environment and debug
 echo "Starting Daphne with command: daphne -b 0.0.0.0 -p 8001 -v 2 funATI.asgi:application"
-daphne -b 0.0.0.0 -p 8001 -v 2 funATI.asgi:application &
+# Each process that inserts chat messages needs its own MESSAGE_WORKER_ID
+MESSAGE_WORKER_ID=0 daphne -b 0.0.0.0 -p 8001 -v 2 funATI.asgi:application &
 DAPHNE_PID=$!
 
 echo "Daphne PID: $DAPHNE_PID"